@@ -17,12 +17,19 @@ from routers.mojettes import api as mojettes_api
 from routers.nivats import api as nivats_api
 # Travail de l'équipe (Sprint December)
 from routers.payment import api as payment_api
-from routers.payment import stripe_cache
 from routers.problems import api as problems_api
 from routers.users import api as users_api
 from routers.week_problems import api as week_problems_api
 from sqlalchemy import event
 from utils.common import load_environment
+from utils.compression import init_compression
+from utils.daily_grid_manager import daily_grids_cli
+from utils.discord_webhook import discord_cli
+from utils.export_jobs import rgpd_exports_cli
+from utils.mail import mail_queue
+from utils.pagination import NEXT_CURSOR_HEADER
+from utils.stripe_catalog import stripe_catalog, stripe_catalog_cli
+from utils.svg_geometry import geometry_cli
 
 # Chargement de l'environnement selon la logique du sprint
 env_state = load_environment()
@@ -34,7 +41,8 @@ app.config['MAIL_DEFAULT_SENDER'] = os.getenv("EMAIL_DEFAULT_SENDER")
 app.config['MAIL_SERVER'] = os.getenv("EMAIL_SERVER")
 app.config['MAIL_PORT'] = int(os.getenv("EMAIL_PORT"))
 app.config['MAIL_USE_TLS'] = False
-app.config['MAIL_USE_SSL'] = True
+# EMAIL_USE_SSL=false pour un serveur SMTP local de debug (voir README)
+app.config['MAIL_USE_SSL'] = os.getenv("EMAIL_USE_SSL", "true").lower() != "false"
 app.config['MAIL_USERNAME'] = os.getenv("EMAIL_USER")
 app.config['MAIL_PASSWORD'] = os.getenv("EMAIL_PASSWORD")
 
@@ -58,15 +66,25 @@ front_url = os.getenv('FRONT_URL')
 origins = [front_url, front_url.replace('https://www.', 'https://')]
 print(f"CORS origins allowed: {origins}")
 CORS(app, resources={
-     r"/*": {"origins": origins, "supports_credentials": True}})
+     r"/*": {"origins": origins, "supports_credentials": True,
+             "expose_headers": [NEXT_CURSOR_HEADER]}})
 
 db.init_app(app)
 migrate = Migrate(app, db)
 mail = Mail(app)
+mail_queue.init_app(app)
+init_compression(app)
 
-# stripe_cache (Sprint December feature)
-with app.app_context():
-    stripe_cache.init_app(app)
+# flask daily-grids pregenerate, flask geometry build, flask rgpd-exports cleanup,
+# flask discord stub-server, flask stripe-catalog warm
+app.cli.add_command(daily_grids_cli)
+app.cli.add_command(geometry_cli)
+app.cli.add_command(rgpd_exports_cli)
+app.cli.add_command(discord_cli)
+app.cli.add_command(stripe_catalog_cli)
+
+# catalogue Stripe partagé entre les workers, préchargé au démarrage
+stripe_catalog.init_app(app)
 
 # Timeouts de SESSION
 with app.app_context():
@@ -114,6 +132,8 @@ api.add_namespace(nivats_api)
 api.add_namespace(payment_api)
 api.add_namespace(week_problems_api)
 
+# Les miniatures des uploads sont produites par des processus 'spawn' qui ré-importent
+# le module principal : lancer le serveur avec `flask run` ou gunicorn, pas `python app.py`
 if __name__ == "__main__":
     if not env_state:
         raise ValueError("L'environnement n'est pas défini correctement.")
@@ -0,0 +1,71 @@
+"""
+Benchmark of the price resolution of POST /payment/create-checkout-session.
+
+Compares, for carts of increasing size, the previous sequential
+stripe.Price.retrieve(expand=['product']) per cart line with
+StripeCatalog.expanded_prices, cold (every price fetched concurrently) and
+warm (catalog already filled, as after the warming at boot), against the
+local Stripe stand-in answering after a simulated API latency.
+
+Usage (from the back/ folder):
+    python -m benchmarks.bench_checkout_prices [--latency 0.15] [--cart-sizes 1 3 5 10]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import stripe
+from utils.stripe_catalog import StripeCatalog
+from utils.stripe_stub import StripeStubServer
+
+PRODUCTS = [{'id': f'prod_{i}', 'object': 'product', 'name': f'Pack {i}',
+             'metadata': {'type': 'token' if i % 2 else 'mojette'}} for i in range(5)]
+PRICES = [{'id': f'price_{i}', 'object': 'price', 'product': f'prod_{i % 5}', 'unit_amount': 100 * (i + 1),
+           'metadata': {'promo_mojette': 'true', 'promo_mojette_amount': '10'} if i % 3 == 0 else {},
+           'transform_quantity': {'divide_by': 1, 'round': 'up'}} for i in range(20)]
+
+
+def sequential(price_ids):
+    return {price_id: stripe.Price.retrieve(price_id, expand=['product']) for price_id in price_ids}
+
+
+def measure(func, price_ids, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(price_ids)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Checkout price resolution benchmark')
+    parser.add_argument('--latency', type=float, default=0.15, help='Simulated Stripe latency (s)')
+    parser.add_argument('--cart-sizes', type=int, nargs='+', default=[1, 3, 5, 10])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    stub = StripeStubServer(PRODUCTS, PRICES, delay=args.latency).start()
+    stripe.api_base = stub.url
+    stripe.api_key = 'sk_test_bench'
+    print(f"Simulated Stripe latency: {args.latency * 1000:.0f} ms")
+    print(f"{'cart':>5} {'sequential':>12} {'cold catalog':>13} {'warm catalog':>13}")
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            for size in args.cart_sizes:
+                price_ids = [f'price_{i}' for i in range(size)]
+                catalogs = iter(StripeCatalog(os.path.join(directory, f'cold_{size}_{i}.sqlite3'))
+                                for i in range(args.repeat))
+                cold = measure(lambda ids: next(catalogs).expanded_prices(ids), price_ids, args.repeat)
+                warm_catalog = StripeCatalog(os.path.join(directory, f'warm_{size}.sqlite3'))
+                warm_catalog.warm()
+                warm = measure(warm_catalog.expanded_prices, price_ids, args.repeat)
+                seq = measure(sequential, price_ids, args.repeat)
+                print(f"{size:>5} {seq * 1000:>10.0f}ms {cold * 1000:>11.0f}ms {warm * 1000:>11.1f}ms")
+    finally:
+        stub.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+Benchmark of the ownership checks of the formation calendar (GET /formations/calendar).
+
+Compares the previous loop (one DatabaseManager.FormationOwnedByUser query per
+calendar row, i.e. per session) with a single ReadFormationIdsOwnedByUser read,
+for 200 formations x 10 upcoming sessions, using an in-memory SQLite database.
+
+Usage (from the back/ folder):
+    python -m benchmarks.bench_formation_calendar [--formations 200] [--sessions 10] [--repeat 5]
+"""
+import argparse
+import time
+from datetime import datetime, timedelta
+
+from database.database import DatabaseManager, db
+from database.models import (Formation, FormationAvailability, FormationBought,
+                             FormationCategory, User)
+from flask import Flask
+from sqlalchemy import event, insert
+
+
+def legacy_owned(db_manager, user_id, rows):
+    return {row['id']: db_manager.FormationOwnedByUser(user_id, row['id']) for row in rows}
+
+
+def bulk_owned(db_manager, user_id, rows):
+    owned_ids = db_manager.ReadFormationIdsOwnedByUser(user_id)
+    return {row['id']: row['id'] in owned_ids for row in rows}
+
+
+def best_time(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def count_queries(func):
+    count = 0
+
+    def on_execute(*args):
+        nonlocal count
+        count += 1
+
+    event.listen(db.engine, 'before_cursor_execute', on_execute)
+    try:
+        func()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', on_execute)
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Formation calendar ownership benchmark')
+    parser.add_argument('--formations', type=int, default=200)
+    parser.add_argument('--sessions', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+
+    with app.app_context():
+        # only the tables used here (the full schema relies on MySQL specific features)
+        db.metadata.create_all(db.engine, tables=[User.__table__, FormationCategory.__table__,
+                                                  Formation.__table__, FormationAvailability.__table__,
+                                                  FormationBought.__table__])
+        db.session.add(User(id=1, username='bench', email='bench@ppmoj.fr', password_hash='x'))
+        db.session.add(FormationCategory(id=1, category_name='bench', code='bench'))
+        db.session.execute(insert(Formation.__table__),
+                           [{'id': i, 'name': f'formation {i}', 'category': 1, 'price': 10,
+                             'displayed': True} for i in range(1, args.formations + 1)])
+        start = datetime.now() + timedelta(days=1)
+        db.session.execute(insert(FormationAvailability.__table__),
+                           [{'formation_id': i, 'delivery_date': start + timedelta(days=s),
+                             'duration_minutes': 60, 'speaker': 'bench'}
+                            for i in range(1, args.formations + 1) for s in range(args.sessions)])
+        # the user owns one formation out of four
+        db.session.execute(insert(FormationBought.__table__),
+                           [{'user_id': 1, 'formation_id': i}
+                            for i in range(1, args.formations + 1, 4)])
+        db.session.commit()
+
+        db_manager = DatabaseManager()
+        rows = db_manager.ReadFormationsCalendarProjection()
+        assert len(rows) == args.formations * args.sessions
+        assert legacy_owned(db_manager, 1, rows) == bulk_owned(db_manager, 1, rows)
+
+        legacy = best_time(lambda: legacy_owned(db_manager, 1, rows), args.repeat)
+        bulk = best_time(lambda: bulk_owned(db_manager, 1, rows), args.repeat)
+        print(f"{len(rows)} calendar rows ({args.formations} formations x {args.sessions} sessions)")
+        print(f"FormationOwnedByUser per row    {legacy * 1e3:8.2f} ms   "
+              f"{count_queries(lambda: legacy_owned(db_manager, 1, rows))} queries")
+        print(f"ReadFormationIdsOwnedByUser     {bulk * 1e3:8.2f} ms   "
+              f"{count_queries(lambda: bulk_owned(db_manager, 1, rows))} queries   x{legacy / bulk:.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Benchmark of the grid catalog pagination (GET /mojettes, GET /carres).
+
+Compares the legacy OFFSET pages of DatabaseManager.ReadMojettesProjection with
+its keyset variant (after=(level, id)) at increasing depths of a 500k grids
+catalog, using an in-memory SQLite database with the ix_mojette_level_id index.
+The whole catalog is also walked with cursors to check that no grid is missed.
+
+Usage (from the back/ folder):
+    python -m benchmarks.bench_keyset_pagination [--grids 500000] [--repeat 5]
+"""
+import argparse
+import time
+
+from database.database import DatabaseManager, db
+from database.models import Mojette
+from flask import Flask
+from sqlalchemy import insert
+
+PAGE_SIZE = 30
+
+
+def best_time(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Grid catalog pagination benchmark')
+    parser.add_argument('--grids', type=int, default=500000)
+    parser.add_argument('--levels', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+
+    with app.app_context():
+        # only the table used here (the full schema relies on MySQL specific features)
+        db.metadata.create_all(db.engine, tables=[Mojette.__table__])
+        rows = [{'id': i, 'level': i % args.levels + 1, 'published': True}
+                for i in range(1, args.grids + 1)]
+        for start in range(0, len(rows), 50000):
+            db.session.execute(insert(Mojette.__table__), rows[start:start + 50000])
+        db.session.commit()
+
+        db_manager = DatabaseManager()
+        walked = 0
+        after = None
+        while True:
+            page = db_manager.ReadMojettesProjection(after=after, limit=PAGE_SIZE)
+            walked += len(page)
+            if len(page) < PAGE_SIZE:
+                break
+            after = (page[-1]['level'], page[-1]['id'])
+        assert walked == args.grids
+
+        print(f"{args.grids} grids, {PAGE_SIZE} per page")
+        print(f"{'page':>8} {'OFFSET':>10} {'keyset':>10}")
+        last_page = args.grids // PAGE_SIZE - 1
+        pages = sorted({page for page in (0, 100, 1000, 10000, last_page) if 0 <= page <= last_page})
+        for page in pages:
+            offset_rows = db_manager.ReadMojettesProjection(page, limit=PAGE_SIZE)
+            previous = db_manager.ReadMojettesProjection(page - 1, limit=PAGE_SIZE)[-1] if page else None
+            after = (previous['level'], previous['id']) if previous else None
+            assert db_manager.ReadMojettesProjection(after=after, limit=PAGE_SIZE) == offset_rows
+
+            legacy = best_time(lambda: db_manager.ReadMojettesProjection(page, limit=PAGE_SIZE), args.repeat)
+            keyset = best_time(lambda: db_manager.ReadMojettesProjection(after=after, limit=PAGE_SIZE),
+                               args.repeat)
+            print(f"{page:>8} {legacy * 1e3:>8.2f}ms {keyset * 1e3:>8.2f}ms")
+
+
+if __name__ == '__main__':
+    main()
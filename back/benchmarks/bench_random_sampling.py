@@ -0,0 +1,109 @@
+"""
+Benchmark of the random unsolved-grid sampling used to schedule the daily grids.
+
+Compares the previous query (anti-join on mojette_completed + ORDER BY random())
+with DatabaseManager.ReadRandomMojetteIds backed by unsolved_mojette_pool, for
+10k, 100k and 1M completions, using an in-memory SQLite database.
+The pool is timed twice: the first draw includes the (re)load of the pool,
+the next ones only the O(k) draw and its one-query check.
+
+Usage (from the back/ folder):
+    python -m benchmarks.bench_random_sampling [--grids 50000] [--count 31] [--repeat 5]
+"""
+import argparse
+import random
+import time
+
+from database.database import DatabaseManager, db
+from database.models import (DailyGrid, Mojette, MojetteCompleted,
+                             MojetteLeaderboard)
+from flask import Flask
+from sqlalchemy import func, insert
+from utils.random_id_pool import unsolved_mojette_pool
+
+
+def legacy_random_mojette_ids(count):
+    subquery = db.session.query(MojetteCompleted.grid_id).subquery()
+    return [
+        row[0] for row in db.session.query(Mojette.id)
+        .join(subquery, Mojette.id == subquery.c.grid_id, isouter=True)
+        .join(DailyGrid, Mojette.id == DailyGrid.mojette_id, isouter=True)
+        .filter(subquery.c.grid_id == None)
+        .filter(DailyGrid.mojette_id == None)
+        .order_by(func.random())
+        .limit(count)
+        .all()
+    ]
+
+
+def best_time(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def fill_completions(completions, grids):
+    """Completions spread over the first 3/4 of the catalog, the last quarter stays unsolved"""
+    db.session.execute(MojetteCompleted.__table__.delete())
+    db.session.execute(MojetteLeaderboard.__table__.delete())
+    solved_grids = grids * 3 // 4
+    rows = [{'user_id': i // solved_grids + 1, 'grid_id': i % solved_grids + 1,
+             'helps_used': 0, 'completion_time': 60, 'score': 940}
+            for i in range(completions)]
+    for start in range(0, completions, 50000):
+        chunk = rows[start:start + 50000]
+        db.session.execute(insert(MojetteCompleted.__table__),
+                           [{k: r[k] for k in ('user_id', 'grid_id', 'helps_used', 'completion_time')}
+                            for r in chunk])
+        db.session.execute(insert(MojetteLeaderboard.__table__), chunk)
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Random unsolved-grid sampling benchmark')
+    parser.add_argument('--grids', type=int, default=50000)
+    parser.add_argument('--count', type=int, default=31)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--completions', type=int, nargs='+', default=[10000, 100000, 1000000])
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+
+    with app.app_context():
+        # only the tables used here (the full schema relies on MySQL specific features)
+        db.metadata.create_all(db.engine, tables=[Mojette.__table__, MojetteCompleted.__table__,
+                                                  MojetteLeaderboard.__table__, DailyGrid.__table__])
+        db.session.execute(insert(Mojette.__table__),
+                           [{'id': i, 'game': 2, 'level': i % 5, 'shape': 1, 'bin_values': '1,2,3'}
+                            for i in range(1, args.grids + 1)])
+        db.session.commit()
+        db_manager = DatabaseManager()
+        random.seed(0)
+
+        for completions in args.completions:
+            fill_completions(completions, args.grids)
+
+            ids = db_manager.ReadRandomMojetteIds(args.count)
+            assert len(ids) == len(set(ids)) == args.count
+            assert not db_manager.ReadMojetteIdsCompletedOrScheduledAmong(ids)
+
+            def pool_cold():
+                unsolved_mojette_pool.invalidate()
+                db_manager.ReadRandomMojetteIds(args.count)
+
+            legacy = best_time(lambda: legacy_random_mojette_ids(args.count), args.repeat)
+            cold = best_time(pool_cold, args.repeat)
+            warm = best_time(lambda: db_manager.ReadRandomMojetteIds(args.count), args.repeat)
+            print(f"{completions:>8} completions   legacy {legacy * 1e3:9.2f} ms   "
+                  f"pool reload {cold * 1e3:9.2f} ms   pool draw {warm * 1e3:7.3f} ms   "
+                  f"x{legacy / warm:.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Benchmark of database.models.Serializer on large lists.
+
+Compares the previous implementation (sqlalchemy.inspect() on every object)
+with the cached per-class plan, on 10k loaded Mojette rows and 10k
+(Mojette, MojetteCompleted) join rows, using an in-memory SQLite database.
+
+Usage (from the back/ folder):
+    python -m benchmarks.bench_serializer [--rows 10000] [--repeat 5]
+"""
+import argparse
+import time
+
+from database.models import Base, Mojette, MojetteCompleted, Serializer, User
+from sqlalchemy import create_engine
+from sqlalchemy.inspection import inspect
+from sqlalchemy.orm import Session
+
+
+def legacy_serialize(obj):
+    return {c: getattr(obj, c) for c in inspect(obj).attrs.keys()}
+
+
+def legacy_serialize_row(row):
+    combined_dict = {}
+    for table in row:
+        if table is None:
+            continue
+        combined_dict.update(legacy_serialize(table))
+    return combined_dict
+
+
+def best_time(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def report(label, legacy, cached, rows):
+    print(f"{label:<28} legacy {legacy * 1e6 / rows:8.2f} us/row   "
+          f"cached {cached * 1e6 / rows:8.2f} us/row   x{legacy / cached:.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serializer benchmark')
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    engine = create_engine('sqlite://')
+    # only the tables used here (the full schema relies on MySQL specific features)
+    Base.metadata.create_all(engine, tables=[User.__table__, Mojette.__table__,
+                                             MojetteCompleted.__table__])
+    with Session(engine) as session:
+        session.add(User(id=1, username='bench', email='bench@ppmoj.fr', password_hash='x'))
+        session.add_all(Mojette(id=i, game=2, level=i % 5, shape=1, bin_values='1,2,3',
+                                solution='1,2,3') for i in range(1, args.rows + 1))
+        session.add_all(MojetteCompleted(user_id=1, grid_id=i, helps_used=0, completion_time=60)
+                        for i in range(1, args.rows + 1, 2))
+        session.commit()
+
+        mojettes = session.query(Mojette).all()
+        rows = (
+            session.query(Mojette, MojetteCompleted)
+            .select_from(Mojette)
+            .join(MojetteCompleted, Mojette.id == MojetteCompleted.grid_id, isouter=True)
+            .all()
+        )
+
+        assert [legacy_serialize(m) for m in mojettes] == Serializer.serialize_list(mojettes)
+        assert [legacy_serialize_row(r) for r in rows] == Serializer.serialize_list_row(rows)
+
+        report('serialize_list',
+               best_time(lambda: [legacy_serialize(m) for m in mojettes], args.repeat),
+               best_time(lambda: Serializer.serialize_list(mojettes), args.repeat),
+               len(mojettes))
+        report('serialize_list_row (join)',
+               best_time(lambda: [legacy_serialize_row(r) for r in rows], args.repeat),
+               best_time(lambda: Serializer.serialize_list_row(rows), args.repeat),
+               len(rows))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Benchmark of the admin user export (GET /users vs GET /users/export).
+
+Compares the peak memory (tracemalloc) of the list endpoint body
+(ReadUsers + serialize_list + one JSON document) with the streamed NDJSON
+and CSV exports (StreamUsers + export_stream chunks), for an increasing
+number of users, using an on-disk SQLite database.
+
+Usage (from the back/ folder):
+    python -m benchmarks.bench_streaming_export [--users 10000 100000]
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+from database.database import DatabaseManager, db
+from database.models import User
+from flask import Flask
+from sqlalchemy import insert
+from utils.export_stream import chunked, csv_lines, ndjson_lines
+
+COLUMNS = ('id', 'username', 'email', 'mojettes', 'token_coin', 'confirmation_token',
+           'role', 'confirmed', 'tutorial_mojette_done', 'created_at')
+
+
+def list_body(db_manager):
+    data = User.serialize_list(db_manager.ReadUsers())
+    return len(json.dumps([{column: row[column] for column in COLUMNS} for row in data], default=str))
+
+
+def streamed_body(db_manager, lines):
+    return sum(len(chunk) for chunk in chunked(lines(db_manager.StreamUsers(COLUMNS), COLUMNS)))
+
+
+def measure(func):
+    db.session.expunge_all()
+    tracemalloc.start()
+    start = time.perf_counter()
+    size = func()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return size, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Streaming user export benchmark')
+    parser.add_argument('--users', type=int, nargs='+', default=[10000, 100000])
+    args = parser.parse_args()
+
+    for users in args.users:
+        with tempfile.TemporaryDirectory() as directory:
+            app = Flask(__name__)
+            app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(directory, 'bench.db')
+            db.init_app(app)
+            with app.app_context():
+                db.metadata.create_all(db.engine, tables=[User.__table__])
+                rows = [{'id': i, 'username': f'user{i}', 'email': f'user{i}@ppmoj.fr',
+                         'password_hash': 'x' * 60, 'role': 'User'} for i in range(1, users + 1)]
+                for start in range(0, users, 50000):
+                    db.session.execute(insert(User.__table__), rows[start:start + 50000])
+                db.session.commit()
+                del rows
+
+                db_manager = DatabaseManager()
+                print(f"{users} users")
+                for name, func in (('GET /users (list)', lambda: list_body(db_manager)),
+                                   ('export NDJSON', lambda: streamed_body(db_manager, ndjson_lines)),
+                                   ('export CSV', lambda: streamed_body(db_manager, csv_lines))):
+                    size, elapsed, peak = measure(func)
+                    print(f"  {name:<20} {elapsed * 1e3:8.1f} ms   peak {peak / 2 ** 20:7.2f} MiB   "
+                          f"body {size / 2 ** 20:6.2f} MiB")
+                db.session.remove()
+                db.engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
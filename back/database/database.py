@@ -1,18 +1,56 @@
 from datetime import date, datetime
-from typing import List, Optional
+from typing import Iterator, List, Optional, Sequence
 
 from database.models import (Base, Carre, CarreCompleted, CheckoutSession,
-                             Department, Formation, FormationAvailability,
+                             DailyGrid, Department, Formation, FormationAvailability,
                              FormationBought, FormationCategory, Game, Mojette,
-                             MojetteCompleted, MojetteShape, Problem,
-                             ProblemCompleted, Region, Reward, User, WeekProblem,
-                             WeekProblemCompleted, UserDataRequest, UserDataDeletion)
+                             MojetteCompleted, MojetteLeaderboard, MojetteShape, Problem,
+                             ProblemCompleted, Region, Reward, Serializer, StripeEvent,
+                             User, WeekProblem, WeekProblemCompleted, UserDataRequest,
+                             UserDataDeletion)
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy import Column, Row, func
+from sqlalchemy.exc import IntegrityError
+from utils.mojette_grid_cache import DecodedMojette, mojette_grid_cache
+from utils.random_id_pool import unpublished_carre_pool, unsolved_mojette_pool
+from utils.response_cache import FORMATIONS, WEEK_PROBLEMS, bump_content_version
+from utils.role_cache import UserRoleCache, user_role_cache
 
 db = SQLAlchemy(model_class=Base)
 
 
+def _rows_to_dicts(rows: List[Row]) -> List[dict]:
+    """
+    Convert the rows of a column-only query into plain dictionaries.
+    Used by the *Projection read methods: selecting labeled columns instead of
+    entities bypasses the session identity map and loads only what is needed.
+    """
+    return [row._asdict() for row in rows]
+
+
+def _read_after(query, columns: tuple[Column, Column], after: tuple[int, int], limit: int) -> list:
+    """
+    Keyset page: the `limit` rows of `query` (ordered by the two `columns`, e.g. level, id)
+    after the row whose key is `after`.
+    Read as the rest of the first column value then the next values: both are seeks in the
+    (first, second) index, whereas `(a, b) > (x, y)` or `a > x OR (a = x AND b > y)` only
+    seek on the first column and scan everything before `y`, whatever its depth.
+    """
+    first, second = columns
+    rows = query.filter(first == after[0], second > after[1]).limit(limit).all()
+    if len(rows) < limit:
+        rows += query.filter(first > after[0]).limit(limit - len(rows)).all()
+    return rows
+
+
+def _stream_rows(query, batch_size: int) -> Iterator[Row]:
+    """
+    Rows of `query` read with a server-side cursor, `batch_size` at a time.
+    The query only runs when the generator is first iterated.
+    """
+    yield from query.yield_per(batch_size)
+
+
 class DatabaseManager:
 
     def __init__(self):
@@ -22,6 +60,19 @@ class DatabaseManager:
     def ReadUsers(self) -> List[User]:
         return self.db.session.query(User).order_by(User.created_at.desc()).all()
 
+    def ReadUsersPage(self, after_id: Optional[int], limit: int) -> List[User]:
+        """Page of ReadUsers, newest first by id (keyset: the page starts after the user `after_id`)"""
+        query = self.db.session.query(User).order_by(User.id.desc())
+        if after_id is not None:
+            query = query.filter(User.id < after_id)
+        return query.limit(limit).all()
+
+    def StreamUsers(self, columns: Sequence[str], batch_size=1000) -> Iterator[Row]:
+        """Lazy export of the users (only `columns`), read with a server-side cursor"""
+        return _stream_rows(
+            self.db.session.query(*(getattr(User, column) for column in columns)).order_by(User.id),
+            batch_size)
+
     def ReadUserById(self, id) -> User | None:
         return self.db.session.query(User).filter(User.id == id).first()
 
@@ -39,6 +90,8 @@ class DatabaseManager:
     def UpdateUser(self, id, user_data) -> User | None:
         self.db.session.query(User).filter(User.id == id).update(user_data)
         self.db.session.commit()
+        if 'role' in user_data:
+            user_role_cache.invalidate(id)
 
     def UpdateUserMojettes(self, id, mojettes) -> User:
         self.db.session.query(User).filter(User.id == id).update(
@@ -49,6 +102,7 @@ class DatabaseManager:
     def DeleteUser(self, id) -> None:
         user = self.db.session.get(User, id)
         self.db.session.delete(user)
+        user_role_cache.invalidate(id)
         return
 
     def UpdateUserConfirmationStatus(self, id, token) -> User | None:
@@ -58,7 +112,15 @@ class DatabaseManager:
         return self.db.session.query(User).filter(User.id == id, User.confirmation_token == token).first()
 
     def UserIsAdmin(self, id) -> bool:
-        return self.db.session.query(User).filter(User.id == id, User.role == "Admin").first() is not None
+        return self.ReadUserRole(id) == "Admin"
+
+    def ReadUserRole(self, id) -> str | None:
+        """Role of the user, served from user_role_cache (None if the user does not exist)"""
+        role = user_role_cache.get(id)
+        if role is UserRoleCache.MISSING:
+            role = self.db.session.query(User.role).filter(User.id == id).scalar()
+            user_role_cache.put(id, role)
+        return role
 
     # GAMES
     def ReadGames(self) -> List[Game]:
@@ -96,17 +158,20 @@ class DatabaseManager:
         )
         self.db.session.add(new_week_problem)
         self.db.session.commit()
+        bump_content_version(WEEK_PROBLEMS)
         return new_week_problem
 
     def UpdateWeekProblem(self, problem_id, update_data) -> 'WeekProblem':
         self.db.session.query(WeekProblem).filter(WeekProblem.id == problem_id).update(update_data)
         self.db.session.commit()
+        bump_content_version(WEEK_PROBLEMS)
         return self.db.session.query(WeekProblem).filter(WeekProblem.id == problem_id).first()
 
     def DeleteWeekProblem(self, problem_id) -> None:
         wp = self.db.session.get(WeekProblem, problem_id)
         self.db.session.delete(wp)
         self.db.session.commit()
+        bump_content_version(WEEK_PROBLEMS)
 
     def CreateWeekProblemCompleted(self, completed_data) -> WeekProblemCompleted:
         new_completed = WeekProblemCompleted(
@@ -162,10 +227,40 @@ class DatabaseManager:
             .all()
         )
 
+    def ReadWeekProblemCompletionsByProblemProjection(self, problem_id: int) -> List[dict]:
+        """Read-only variant of ReadWeekProblemCompletionsByProblem returning dictionaries."""
+        return _rows_to_dicts(
+            self.db.session.query(
+                WeekProblemCompleted.user_id,
+                User.username,
+                WeekProblemCompleted.completion_date,
+                WeekProblemCompleted.helps_used
+            )
+            .select_from(WeekProblemCompleted)
+            .join(User, User.id == WeekProblemCompleted.user_id)
+            .filter(WeekProblemCompleted.week_problem_id == problem_id)
+            .order_by(WeekProblemCompleted.completion_date.asc())
+            .all()
+        )
+
     # PROBLEMS
     def ReadProblems(self) -> List[Row[tuple[Problem, Department]]]:
         return self.db.session.query(Problem, Department).join(Department).all()
 
+    def ReadProblemsProjection(self) -> List[dict]:
+        """Read-only variant of ReadProblems returning only the listed columns as dictionaries."""
+        return _rows_to_dicts(
+            self.db.session.query(
+                Problem.id,
+                Problem.level,
+                Problem.department,
+                Problem.type,
+                Department.region
+            )
+            .join(Department)
+            .all()
+        )
+
     def ReadProblemById(self, user_id) -> Row[tuple[Problem, Game, Reward]] | None:
         return self.db.session.query(Problem, Reward).join(Reward, Reward.game == Problem.game).filter(Problem.id == user_id).first()
 
@@ -216,6 +311,9 @@ class DatabaseManager:
     def ReadRegions(self) -> List[Region]:
         return self.db.session.query(Region).all()
 
+    def ReadDepartments(self) -> List[Department]:
+        return self.db.session.query(Department).all()
+
     def ReadDepartmentsByRegionCode(self, region_code) -> List[Department]:
         return self.db.session.query(Department).filter(Department.region == region_code).all()
 
@@ -228,7 +326,7 @@ class DatabaseManager:
 
     # MOJETTES
     def ReadMojettes(self, page=0) -> List[Mojette]:
-        return self.db.session.query(Mojette).limit(30).offset(page * 30).all()
+        return self.db.session.query(Mojette).order_by(Mojette.level, Mojette.id).limit(30).offset(page * 30).all()
 
     def ReadMojettesByLevelAndPage(self, user_id, level, page) -> List[Row[tuple[Mojette, MojetteCompleted]]]:
         return (
@@ -240,11 +338,63 @@ class DatabaseManager:
                 isouter=True
             )
             .filter(Mojette.level == level)
+            .order_by(Mojette.id)
             .limit(30)
             .offset(page * 30)
             .all()
         )
 
+    def ReadMojettesProjection(self, page=0, after: Optional[tuple[int, int]] = None, limit=30) -> List[dict]:
+        """
+        Read-only variant of ReadMojettes returning only the listed columns as dictionaries.
+
+        Args:
+            page: Legacy page index (OFFSET page * 30), ignored when `after` is given
+            after: Keyset cursor (level, id), the page starts right after this grid
+            limit: Number of grids to read
+        """
+        query = (
+            self.db.session.query(Mojette.id, Mojette.level, Mojette.date, Mojette.published)
+            .order_by(Mojette.level, Mojette.id)
+        )
+        if after is not None:
+            return _rows_to_dicts(_read_after(query, (Mojette.level, Mojette.id), after, limit))
+        return _rows_to_dicts(query.offset(page * 30).limit(limit).all())
+
+    def ReadMojettesByLevelAndPageProjection(self, user_id, level, page, after_id: Optional[int] = None,
+                                             limit=30) -> List[dict]:
+        """
+        Read-only variant of ReadMojettesByLevelAndPage returning dictionaries,
+        with a 'solved' column telling if the user completed the grid.
+
+        Args:
+            page: Legacy page index (OFFSET page * 30), ignored when `after_id` is given
+            after_id: Keyset cursor, the page starts right after this grid id of the level
+            limit: Number of grids to read
+        """
+        query = (
+            self.db.session.query(
+                Mojette.id,
+                Mojette.level,
+                Mojette.date,
+                Mojette.published,
+                (MojetteCompleted.user_id != None).label('solved')
+            )
+            .select_from(Mojette)
+            .join(MojetteCompleted, (
+                (Mojette.id == MojetteCompleted.grid_id) &
+                (MojetteCompleted.user_id == user_id)),
+                isouter=True
+            )
+            .filter(Mojette.level == level)
+            .order_by(Mojette.id)
+        )
+        if after_id is not None:
+            query = query.filter(Mojette.id > after_id)
+        else:
+            query = query.offset(page * 30)
+        return _rows_to_dicts(query.limit(limit).all())
+
     # the order of the tuple is important, we want the ID of mojette, not mojetteShape
     def ReadFirstMojetteNotPublished(self) -> Row[tuple[MojetteShape, Mojette, Reward]] | None:
         return self.db.session.query(
@@ -271,11 +421,39 @@ class DatabaseManager:
             .join(MojetteShape)
             .join(Reward, (Mojette.level == Reward.level) & (Mojette.game == Reward.game))
             .filter(Mojette.level == level)
+            .order_by(Mojette.id)
             .limit(1)
             .offset(offset)
             .first()
         )
 
+    # the order of the tuple is important, we want the ID of mojette, not mojetteShape
+    def ReadMojetteByLevelAfter(self, level, after_id) -> Row[tuple[MojetteShape, Mojette, Reward]] | None:
+        """Keyset variant of ReadMojetteByLevelAndOffset: first grid of the level after the grid `after_id`"""
+        return (
+            self.db.session.query(MojetteShape, Mojette, Reward)
+            .select_from(Mojette)
+            .join(MojetteShape)
+            .join(Reward, (Mojette.level == Reward.level) & (Mojette.game == Reward.game))
+            .filter(Mojette.level == level, Mojette.id > after_id)
+            .order_by(Mojette.id)
+            .first()
+        )
+
+    def ReadDecodedMojetteById(self, id) -> DecodedMojette | None:
+        """
+        Same data as ReadMojetteById, with the grid strings already parsed.
+        Served from mojette_grid_cache, the database is only queried on a miss.
+        """
+        decoded = mojette_grid_cache.get(id)
+        if decoded is None:
+            row = self.ReadMojetteById(id)
+            if row is None:
+                return None
+            decoded = DecodedMojette(Serializer.serialize_row(row))
+            mojette_grid_cache.put(id, decoded)
+        return decoded
+
     def ReadMojetteHelpCost(self, id) -> int | None:
         row = (
             self.db.session.query(Reward.help_1_percent_cost)
@@ -291,17 +469,47 @@ class DatabaseManager:
     def CreateMojette(self, mojette: Mojette) -> Mojette:
         self.db.session.add(mojette)
         self.db.session.commit()
+        unsolved_mojette_pool.add(mojette.id)
         return mojette
 
     def ReadMojettesCompleted(self) -> List[MojetteCompleted]:
         return self.db.session.query(MojetteCompleted).all()
 
+    def ReadMojettesCompletedPage(self, after: Optional[tuple[int, int]], limit: int) -> List[MojetteCompleted]:
+        """Page of ReadMojettesCompleted ordered by primary key (keyset: after = (user_id, grid_id))"""
+        query = self.db.session.query(MojetteCompleted).order_by(MojetteCompleted.user_id, MojetteCompleted.grid_id)
+        if after is not None:
+            return _read_after(query, (MojetteCompleted.user_id, MojetteCompleted.grid_id), after, limit)
+        return query.limit(limit).all()
+
+    def StreamMojettesCompleted(self, columns: Sequence[str], batch_size=1000) -> Iterator[Row]:
+        """Lazy export of the mojette completions (only `columns`), read with a server-side cursor"""
+        return _stream_rows(
+            self.db.session.query(*(getattr(MojetteCompleted, column) for column in columns))
+            .order_by(MojetteCompleted.user_id, MojetteCompleted.grid_id),
+            batch_size)
+
     def ReadMojettesCompletedByUser(self, user_id) -> List[MojetteCompleted]:
         return self.db.session.query(MojetteCompleted).filter(MojetteCompleted.user_id == user_id).all()
 
     def ReadMojetteCompletedByPrimaryKey(self, user_id, grid_id) -> MojetteCompleted | None:
         return self.db.session.query(MojetteCompleted).join(Mojette).join(Reward, Reward.game == Mojette.game).filter(MojetteCompleted.user_id == user_id, MojetteCompleted.grid_id == grid_id).first()
 
+    def ReadMojettesCompletedAmong(self, user_id, grid_ids) -> set[int]:
+        """
+        Return the ids, among grid_ids, of the grids completed by the user.
+        A single query on the (user_id, grid_id) primary key, whatever the number of grids.
+        """
+        grid_ids = set(grid_ids)
+        if not grid_ids:
+            return set()
+        rows = (
+            self.db.session.query(MojetteCompleted.grid_id)
+            .filter(MojetteCompleted.user_id == user_id, MojetteCompleted.grid_id.in_(grid_ids))
+            .all()
+        )
+        return {row[0] for row in rows}
+
     # TODO : change mojette_data to a MojetteCompleted object
     def CreateMojetteCompleted(self, mojette_data) -> MojetteCompleted:
         new_mojette_completed = MojetteCompleted(
@@ -310,8 +518,19 @@ class DatabaseManager:
             helps_used=mojette_data['helps_used'],
             completion_time=mojette_data['completion_time']
         )
+        # the leaderboard row is written in the same transaction as the completion
+        leaderboard_entry = MojetteLeaderboard(
+            user_id=mojette_data['user_id'],
+            grid_id=mojette_data['grid_id'],
+            helps_used=mojette_data['helps_used'],
+            completion_time=mojette_data['completion_time'],
+            score=MojetteLeaderboard.compute_score(
+                mojette_data['completion_time'], mojette_data['helps_used'])
+        )
         self.db.session.add(new_mojette_completed)
+        self.db.session.add(leaderboard_entry)
         self.db.session.commit()
+        unsolved_mojette_pool.discard(mojette_data['grid_id'])
         return new_mojette_completed
 
     def ReadMojetteReward(self, id) -> int | None:
@@ -325,136 +544,195 @@ class DatabaseManager:
         self,
         user_id: int,
         grid_id: int,
-        base_score: int = 1000,
-        points_lost_per_second: int = 1,
-        points_lost_per_help: int = 50,
         leaderboard_size=10,
         leaderboard_range=2
-    ) -> list[dict] | None:
+    ) -> list[dict]:
         """
         Récupère le classement des utilisateurs pour une grille spécifique, incluant :
         - Le top des meilleurs joueurs
         - Les joueurs proches du rang de l'utilisateur spécifié
 
-        Le score est calculé comme :
-        score = max(0, base_score - (time_penalty * completion_time) - \
-                    (help_penalty * helps_used))
+        Le classement est lu dans la table mojette_leaderboard, où le score est
+        précalculé à l'insertion (voir MojetteLeaderboard.compute_score). Chaque
+        partie du classement est une lecture de l'index (grid_id, score, user_id) :
+        aucune fonction de fenêtre n'est calculée sur toute la grille.
 
         Args:
             user_id: ID de l'utilisateur de référence
             grid_id: ID de la grille de jeu
-            base_score: Score maximal initial (par défaut 1000)
-            points_lost_per_second: Points perdus par seconde (par défaut 1)
-            points_lost_per_help: Points perdus par aide utilisée (par défaut 50)
             leaderboard_size: Nombre de tops joueurs à retourner (par défaut 10)
             leaderboard_range: Étendue autour du rang de l'utilisateur (par défaut 2)
 
         Returns:
-            Une liste de dictionnaires contenant les infos des joueurs, triée par position,
-            ou None si l'utilisateur n'a pas de score.
+            Une liste de dictionnaires contenant les infos des joueurs, triée par position.
+            Si l'utilisateur n'a pas de score, seul le top est renvoyé.
 
             Format des données:
             {
                 'user_id': int,
                 'username': str,
-                'completion_time': float,
+                'completion_time': int,
                 'helps_used': int,
-                'score': float,
+                'score': int,
                 'position': int
             }
         """
-        # Calcul du score
-        score_expr = func.greatest(
-            0,
-            base_score - (points_lost_per_second *
-                          MojetteCompleted.completion_time)
-                       - (points_lost_per_help * MojetteCompleted.helps_used)
-        )
-
-        # Création de la sous-requête pour le classement complet
-        ranked_users = (
+        entries = (
             self.db.session.query(
-                User.id,
+                MojetteLeaderboard.user_id,
                 User.username,
-                MojetteCompleted.completion_time,
-                MojetteCompleted.helps_used,
-                score_expr.label('score'),
-                func.row_number().over(order_by=score_expr.desc()).label('position')
+                MojetteLeaderboard.completion_time,
+                MojetteLeaderboard.helps_used,
+                MojetteLeaderboard.score
             )
-            .join(MojetteCompleted, User.id == MojetteCompleted.user_id)
-            .filter(MojetteCompleted.grid_id == grid_id)
-            .subquery()
+            .join(User, User.id == MojetteLeaderboard.user_id)
+            .filter(MojetteLeaderboard.grid_id == grid_id)
         )
 
-        # Récupération du rang de l'utilisateur
-        user_rank = (
-            self.db.session.query(ranked_users.c.position)
-            .filter(ranked_users.c.id == user_id)
-            .scalar()
+        # Top du classement
+        positions = {}
+        top = (
+            entries
+            .order_by(MojetteLeaderboard.score.desc(), MojetteLeaderboard.user_id.desc())
+            .limit(leaderboard_size)
+            .all()
         )
+        for position, row in enumerate(top, start=1):
+            positions[position] = row
 
-        # Définir la condition de filtre en fonction de la présence de l'utilisateur dans le classement
-        if user_rank is None:
-            # Si l'utilisateur n'est pas dans le classement, renvoyer seulement le top du classement
-            filter_condition = (ranked_users.c.position <= leaderboard_size)
-        else:
-            # Sinon, inclure le top du classement et les joueurs proches du rang de l'utilisateur
-            filter_condition = (
-                (ranked_users.c.position <= leaderboard_size) |
-                (ranked_users.c.position.between(
-                    user_rank - leaderboard_range,
-                    user_rank + leaderboard_range
-                ))
+        user_entry = (
+            entries
+            .filter(MojetteLeaderboard.user_id == user_id)
+            .first()
+        )
+        if user_entry is not None:
+            # Joueurs classés avant l'utilisateur
+            ranked_before = (
+                (MojetteLeaderboard.score > user_entry.score) |
+                ((MojetteLeaderboard.score == user_entry.score) &
+                 (MojetteLeaderboard.user_id > user_id))
             )
-
-        # Récupération des résultats finaux avec la condition appropriée
-        return (
-            self.db.session.query(
-                ranked_users.c.id.label('user_id'),
-                ranked_users.c.username,
-                ranked_users.c.completion_time,
-                ranked_users.c.helps_used,
-                ranked_users.c.score,
-                ranked_users.c.position
+            ranked_after = (
+                (MojetteLeaderboard.score < user_entry.score) |
+                ((MojetteLeaderboard.score == user_entry.score) &
+                 (MojetteLeaderboard.user_id < user_id))
             )
-            .filter(filter_condition)
-            .order_by(ranked_users.c.position)
-            .limit(leaderboard_size + leaderboard_range * 2 + 1)  # Évite de dépasser le nombre de calculs nécessaires
-            .all()
-        )
+            user_rank = self.db.session.query(func.count()).select_from(MojetteLeaderboard).filter(
+                MojetteLeaderboard.grid_id == grid_id, ranked_before).scalar() + 1
+            positions[user_rank] = user_entry
+
+            if leaderboard_range > 0:
+                above_user = (
+                    entries.filter(ranked_before)
+                    .order_by(MojetteLeaderboard.score.asc(), MojetteLeaderboard.user_id.asc())
+                    .limit(leaderboard_range)
+                    .all()
+                )
+                for offset, row in enumerate(above_user, start=1):
+                    positions[user_rank - offset] = row
+                below_user = (
+                    entries.filter(ranked_after)
+                    .order_by(MojetteLeaderboard.score.desc(), MojetteLeaderboard.user_id.desc())
+                    .limit(leaderboard_range)
+                    .all()
+                )
+                for offset, row in enumerate(below_user, start=1):
+                    positions[user_rank + offset] = row
+
+        return [
+            {**row._asdict(), 'position': position}
+            for position, row in sorted(positions.items())
+        ]
 
     def ReadRandomMojetteIds(self, count=31) -> List[int]:
         """
         Récupère un nombre spécifié d'IDs de grilles Mojette de manière aléatoire
-        parmi celles qui n'ont jamais été complétées.
+        parmi celles qui n'ont jamais été complétées ni programmées en grille du jour.
 
         Args:
             count: Nombre d'IDs à récupérer
 
         Returns:
             Liste d'IDs de grilles Mojette sélectionnés aléatoirement
-        """
-        # On récupère tous les grid_id de la table MojetteCompleted dans une sous-requête
-        subquery = self.db.session.query(MojetteCompleted.grid_id).subquery()
 
-        return [
-            row[0] for row in self.db.session.query(Mojette.id)
-            .join(subquery, Mojette.id == subquery.c.grid_id, isouter=True)
-            .filter(subquery.c.grid_id == None)  # Que les grilles non complétées
-            .order_by(func.random())  # Aléatoire
-            .limit(count)
+        Note:
+            Les IDs sont tirés dans unsolved_mojette_pool (en O(count)), puis revérifiés
+            en une requête : le pool peut ignorer des complétions faites par d'autres workers.
+        """
+        while True:
+            ids = unsolved_mojette_pool.sample(count, self.ReadUnsolvedMojetteIdCandidates)
+            stale_ids = self.ReadMojetteIdsCompletedOrScheduledAmong(ids)
+            if not stale_ids:
+                return ids
+            for id in stale_ids:
+                unsolved_mojette_pool.discard(id)
+
+    def ReadUnsolvedMojetteIdCandidates(self) -> List[int]:
+        """
+        IDs des grilles jamais complétées ni programmées, pour remplir unsolved_mojette_pool.
+        Les grilles complétées sont lues sur l'index (grid_id, score, user_id) de
+        mojette_leaderboard : le DISTINCT ne lit qu'une entrée par grille, sans tri.
+        """
+        excluded = {row[0] for row in self.db.session.query(MojetteLeaderboard.grid_id).distinct()}
+        excluded.update(row[0] for row in self.db.session.query(DailyGrid.mojette_id).distinct())
+        return [row[0] for row in self.db.session.query(Mojette.id) if row[0] not in excluded]
+
+    def ReadMojetteIdsCompletedOrScheduledAmong(self, grid_ids) -> set[int]:
+        """IDs, parmi grid_ids, des grilles déjà complétées ou programmées en grille du jour"""
+        grid_ids = set(grid_ids)
+        if not grid_ids:
+            return set()
+        completed = self.db.session.query(MojetteLeaderboard.grid_id).filter(
+            MojetteLeaderboard.grid_id.in_(grid_ids)).distinct()
+        scheduled = self.db.session.query(DailyGrid.mojette_id).filter(
+            DailyGrid.mojette_id.in_(grid_ids))
+        return {row[0] for row in completed.union(scheduled)}
+
+    # DAILY GRIDS
+    def ReadDailyGridsBetween(self, start: date, end: date) -> dict[date, int]:
+        """Grilles programmées entre start et end inclus, par jour"""
+        return {
+            row.date: row.mojette_id for row in self.db.session.query(DailyGrid.date, DailyGrid.mojette_id)
+            .filter(DailyGrid.date >= start, DailyGrid.date <= end)
             .all()
-        ]
+        }
+
+    def CreateDailyGrids(self, schedule: dict[date, int]) -> None:
+        self.db.session.add_all(DailyGrid(date=day, mojette_id=mojette_id)
+                                for day, mojette_id in schedule.items())
+        self.db.session.commit()
+        for mojette_id in schedule.values():
+            unsolved_mojette_pool.discard(mojette_id)
 
     # CARRE
-    def ReadCarres(self, offset) -> List[Carre]:
-        return self.db.session.query(Carre).limit(100).offset(offset).all()
+    def ReadCarres(self, offset, after: Optional[tuple[int, int]] = None, limit=100) -> List[Carre]:
+        """
+        Args:
+            offset: Legacy OFFSET, ignored when `after` is given
+            after: Keyset cursor (level, id), the page starts right after this grid
+            limit: Number of grids to read
+        """
+        query = self.db.session.query(Carre).order_by(Carre.level, Carre.id)
+        if after is not None:
+            return _read_after(query, (Carre.level, Carre.id), after, limit)
+        return query.offset(offset).limit(limit).all()
 
     def ReadFirstCarreNotPublished(self) -> Row[tuple[Carre, Reward]] | None:
         return self.db.session.query(Carre, Reward).select_from(Carre).join(Reward, Reward.game == Carre.game and Reward.level == Carre.level).filter(Carre.published == 0).first()
 
     def ReadRandomCarreNotPublished(self) -> Row[tuple[Carre, Reward]] | None:
-        return self.db.session.query(Carre, Reward).select_from(Carre).join(Reward, Reward.game == Carre.game and Reward.level == Carre.level).filter(Carre.published == 0).order_by(func.random()).limit(1).first()
+        # tirage dans unpublished_carre_pool puis lecture par clé primaire
+        while True:
+            ids = unpublished_carre_pool.sample(1, self.ReadUnpublishedCarreIdCandidates)
+            if not ids:
+                return None
+            row = self.db.session.query(Carre, Reward).select_from(Carre).join(Reward, Reward.game == Carre.game and Reward.level == Carre.level).filter(Carre.id == ids[0], Carre.published == 0).first()
+            if row is not None:
+                return row
+            unpublished_carre_pool.discard(ids[0])
+
+    def ReadUnpublishedCarreIdCandidates(self) -> List[int]:
+        return [row[0] for row in self.db.session.query(Carre.id).filter(Carre.published == 0)]
 
     def ReadCarreById(self, id) -> Row[tuple[Carre, Reward]] | None:
         return self.db.session.query(Carre, Reward).select_from(Carre).join(Reward, Reward.game == Carre.game and Reward.level == Carre.level).filter(Carre.id == id).first()
@@ -462,11 +740,27 @@ class DatabaseManager:
     def CreateCarre(self, carre: Carre) -> Carre:
         self.db.session.add(carre)
         self.db.session.commit()
+        if not carre.published:
+            unpublished_carre_pool.add(carre.id)
         return carre
 
     def ReadCarresCompleted(self) -> List[CarreCompleted]:
         return self.db.session.query(CarreCompleted).all()
 
+    def ReadCarresCompletedPage(self, after: Optional[tuple[int, int]], limit: int) -> List[CarreCompleted]:
+        """Page of ReadCarresCompleted ordered by primary key (keyset: after = (user_id, grid_id))"""
+        query = self.db.session.query(CarreCompleted).order_by(CarreCompleted.user_id, CarreCompleted.grid_id)
+        if after is not None:
+            return _read_after(query, (CarreCompleted.user_id, CarreCompleted.grid_id), after, limit)
+        return query.limit(limit).all()
+
+    def StreamCarresCompleted(self, columns: Sequence[str], batch_size=1000) -> Iterator[Row]:
+        """Lazy export of the carre completions (only `columns`), read with a server-side cursor"""
+        return _stream_rows(
+            self.db.session.query(*(getattr(CarreCompleted, column) for column in columns))
+            .order_by(CarreCompleted.user_id, CarreCompleted.grid_id),
+            batch_size)
+
     def ReadCarreCompletedByPrimaryKey(self, user_id, carre_id) -> CarreCompleted | None:
         return self.db.session.query(CarreCompleted).join(Carre).join(Reward, Reward.game == Carre.game and Reward.level == Carre.level).filter(CarreCompleted.user_id == user_id, CarreCompleted.grid_id == carre_id).first()
 
@@ -497,6 +791,30 @@ class DatabaseManager:
             .filter(Formation.displayed == True) \
             .order_by(Formation.id, FormationAvailability.delivery_date.desc()).all()
 
+    def ReadFormationsCalendarProjection(self) -> List[dict]:
+        """
+        Read-only variant of ReadFormationsCalendar returning dictionaries.
+        Session links are not selected since the calendar never exposes them.
+        """
+        return _rows_to_dicts(
+            self.db.session.query(
+                Formation.id,
+                Formation.name,
+                Formation.category,
+                Formation.description,
+                Formation.price,
+                Formation.img_link,
+                FormationAvailability.delivery_date,
+                FormationAvailability.duration_minutes,
+                FormationAvailability.speaker
+            )
+            .select_from(Formation).join(FormationAvailability)
+            .filter(FormationAvailability.delivery_date > datetime.now())
+            .filter(Formation.displayed == True)
+            .order_by(Formation.id, FormationAvailability.delivery_date.desc())
+            .all()
+        )
+
     def ReadFormationsByCategoryCode(self, category_code, admin=False) -> List[Formation]:
         query = self.db.session.query(Formation).join(FormationCategory).filter(FormationCategory.code == category_code)
         if not admin:
@@ -530,11 +848,23 @@ class DatabaseManager:
             user_id=user_id, formation_id=formation_id, purchase_date=datetime.now())
         self.db.session.add(formationBought)
         self.db.session.commit()
+        bump_content_version(FORMATIONS)
         return user
 
     def FormationOwnedByUser(self, user_id, formation_id) -> bool:
         return self.db.session.query(FormationBought).filter(FormationBought.user_id == user_id, FormationBought.formation_id == formation_id).first() is not None
 
+    def ReadFormationIdsOwnedByUser(self, user_id) -> set[int]:
+        """
+        Ids of all the formations bought by the user, in one query on the
+        (user_id, formation_id) primary key (instead of one FormationOwnedByUser per formation).
+        """
+        return {
+            row[0] for row in self.db.session.query(FormationBought.formation_id)
+            .filter(FormationBought.user_id == user_id)
+            .all()
+        }
+
     def ReadFormationUsers(self, formation_id) -> List[User]:
         return self.db.session.query(User).join(FormationBought).filter(FormationBought.formation_id == formation_id).all()
 
@@ -542,12 +872,14 @@ class DatabaseManager:
         self.db.session.query(FormationCategory).filter(
             FormationCategory.code == category_code).update(category_data)
         self.db.session.commit()
+        bump_content_version(FORMATIONS)
         return self.db.session.query(FormationCategory).filter(FormationCategory.code == category_code).first()
 
     def UpdateFormation(self, formation_id, formation_data) -> Formation | None:
         self.db.session.query(Formation).filter(
             Formation.id == formation_id).update(formation_data)
         self.db.session.commit()
+        bump_content_version(FORMATIONS)
         return self.db.session.query(Formation).filter(Formation.id == formation_id).first()
 
     def DeleteFormation(self, formation_id) -> None:
@@ -558,6 +890,7 @@ class DatabaseManager:
         self.db.session.query(Formation).filter(
             Formation.id == formation_id).delete()
         self.db.session.commit()
+        bump_content_version(FORMATIONS)
         return
 
     def CreateFormation(self, formation_data) -> Formation:
@@ -572,6 +905,7 @@ class DatabaseManager:
         )
         self.db.session.add(new_formation)
         self.db.session.commit()
+        bump_content_version(FORMATIONS)
         return new_formation
 
     def UpdateFormationSession(self, formation_availability_id, session_data) -> FormationAvailability | None:
@@ -579,6 +913,7 @@ class DatabaseManager:
             FormationAvailability.formation_availability_id == formation_availability_id
         ).update(session_data)
         self.db.session.commit()
+        bump_content_version(FORMATIONS)
         return self.db.session.query(FormationAvailability).filter(FormationAvailability.formation_availability_id == formation_availability_id).first()
 
     def DeleteFormationSession(self, formation_availability_id) -> None:
@@ -586,6 +921,7 @@ class DatabaseManager:
             FormationAvailability, formation_availability_id)
         self.db.session.delete(session)
         self.db.session.commit()
+        bump_content_version(FORMATIONS)
         return
 
     def CreateFormationSession(self, formation_id, session_data) -> FormationAvailability:
@@ -599,6 +935,7 @@ class DatabaseManager:
         )
         self.db.session.add(new_session)
         self.db.session.commit()
+        bump_content_version(FORMATIONS)
         return new_session
 # Payment
 
@@ -610,36 +947,53 @@ class DatabaseManager:
     def readCheckoutSession(self, session_id) -> CheckoutSession | None:
         return self.db.session.query(CheckoutSession).filter(CheckoutSession.session_id == session_id).first()
 
-    def payToken(self, session_id, user_id, quantity) -> CheckoutSession | None:
-        user = self.db.session.query(User).filter(User.id == user_id).first()
-        user.token_coin += quantity
-        session = self.db.session.query(CheckoutSession)\
-            .filter(CheckoutSession.session_id == session_id).first()
-        session.status = 'confirmed'
-        session.finished_at = datetime.now()
-        self.db.session.commit()
-        return session
+    def fulfillCheckoutSession(self, session_id, user_id, token_coin, mojettes) -> bool:
+        """
+        Confirm a pending checkout session and credit what was bought, in one transaction.
+        The session is switched from 'pending' first: a concurrent or repeated call finds it
+        already confirmed (the row stays locked until the commit) and credits nothing.
 
-    def payTokenPromoMojette(self, session_id, user_id, quantity, promo_mojette_amount) -> CheckoutSession | None:
-        user = self.db.session.query(User).filter(User.id == user_id).first()
-        user.token_coin += quantity
-        user.mojettes -= promo_mojette_amount
-        session = self.db.session.query(CheckoutSession)\
-            .filter(CheckoutSession.session_id == session_id).first()
-        session.status = 'confirmed'
-        session.finished_at = datetime.now()
+        Args:
+            token_coin: Token coins bought
+            mojettes: Mojettes bought, minus the mojettes spent on promotions
+
+        Returns:
+            False if the session was not pending (already fulfilled or cancelled)
+        """
+        confirmed = self.db.session.query(CheckoutSession)\
+            .filter(CheckoutSession.session_id == session_id, CheckoutSession.status == 'pending')\
+            .update({CheckoutSession.status: 'confirmed', CheckoutSession.finished_at: datetime.now()},
+                    synchronize_session=False)
+        if confirmed != 1:
+            self.db.session.rollback()
+            return False
+        if token_coin or mojettes:
+            self.db.session.query(User).filter(User.id == user_id).update({
+                User.token_coin: User.token_coin + token_coin,
+                User.mojettes: User.mojettes + mojettes,
+            }, synchronize_session=False)
         self.db.session.commit()
-        return session
+        return True
 
-    def payMojette(self, session_id, user_id, quantity) -> CheckoutSession | None:
-        user = self.db.session.query(User).filter(User.id == user_id).first()
-        user.mojettes += quantity
-        session = self.db.session.query(CheckoutSession)\
-            .filter(CheckoutSession.session_id == session_id).first()
-        session.status = 'confirmed'
-        session.finished_at = datetime.now()
+    def recordStripeEvent(self, event_id, event_type) -> bool:
+        """
+        Record a webhook event, returns False if it was already processed
+        (Stripe sends an event again until it is acknowledged, and may send it twice).
+        """
+        try:
+            self.db.session.add(StripeEvent(event_id=event_id, type=event_type))
+            self.db.session.commit()
+            return True
+        except IntegrityError:
+            # already received: processed again only if it failed the first time
+            self.db.session.rollback()
+            event = self.db.session.get(StripeEvent, event_id)
+            return event.processed_at is None
+
+    def markStripeEventProcessed(self, event_id) -> None:
+        self.db.session.query(StripeEvent).filter(StripeEvent.event_id == event_id)\
+            .update({StripeEvent.processed_at: datetime.now()})
         self.db.session.commit()
-        return session
 
     def cancelCheckoutSession(self, session_id) -> CheckoutSession | None:
         session = self.db.session.query(CheckoutSession)\
@@ -0,0 +1,46 @@
+"""add mojette leaderboard
+
+Revision ID: 3f6b2c9d1e47
+Revises: 18470b8311da
+Create Date: 2026-10-18 10:12:41.208133
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f6b2c9d1e47'
+down_revision = '18470b8311da'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'mojette_leaderboard',
+        sa.Column('grid_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('score', sa.Integer(), nullable=False),
+        sa.Column('completion_time', sa.Integer(), nullable=True),
+        sa.Column('helps_used', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['grid_id'], ['mojette.id'], ),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+        sa.PrimaryKeyConstraint('grid_id', 'user_id')
+    )
+    op.create_index('ix_mojette_leaderboard_grid_score', 'mojette_leaderboard',
+                    ['grid_id', 'score', 'user_id'])
+
+    # Remplissage avec les complétions existantes (même formule que MojetteLeaderboard.compute_score)
+    op.execute("""
+        INSERT INTO mojette_leaderboard (grid_id, user_id, score, completion_time, helps_used)
+        SELECT grid_id, user_id,
+               GREATEST(0, 1000 - COALESCE(completion_time, 0) - 50 * COALESCE(helps_used, 0)),
+               completion_time, helps_used
+        FROM mojette_completed
+    """)
+
+
+def downgrade():
+    op.drop_index('ix_mojette_leaderboard_grid_score', table_name='mojette_leaderboard')
+    op.drop_table('mojette_leaderboard')
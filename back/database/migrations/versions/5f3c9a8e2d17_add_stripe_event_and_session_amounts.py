@@ -0,0 +1,37 @@
+"""add stripe event and session amounts
+
+Revision ID: 5f3c9a8e2d17
+Revises: b4d7e1f09a26
+Create Date: 2026-10-18 19:12:07.482913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5f3c9a8e2d17'
+down_revision = 'b4d7e1f09a26'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('stripe_event',
+    sa.Column('event_id', sa.String(length=255), nullable=False),
+    sa.Column('type', sa.String(length=255), nullable=False),
+    sa.Column('received_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.Column('processed_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('event_id')
+    )
+    with op.batch_alter_table('checkout_session', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('token_coin', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('mojettes', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('checkout_session', schema=None) as batch_op:
+        batch_op.drop_column('mojettes')
+        batch_op.drop_column('token_coin')
+
+    op.drop_table('stripe_event')
@@ -0,0 +1,30 @@
+"""add daily grid
+
+Revision ID: 8a1e5d2c7b90
+Revises: 3f6b2c9d1e47
+Create Date: 2026-10-18 14:37:05.612904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8a1e5d2c7b90'
+down_revision = '3f6b2c9d1e47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'daily_grid',
+        sa.Column('date', sa.Date(), nullable=False),
+        sa.Column('mojette_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['mojette_id'], ['mojette.id'], ),
+        sa.PrimaryKeyConstraint('date')
+    )
+
+
+def downgrade():
+    op.drop_table('daily_grid')
@@ -0,0 +1,26 @@
+"""add grid level id indexes
+
+Revision ID: b4d7e1f09a26
+Revises: 8a1e5d2c7b90
+Create Date: 2026-10-18 16:02:41.318552
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b4d7e1f09a26'
+down_revision = '8a1e5d2c7b90'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_mojette_level_id', 'mojette', ['level', 'id'], unique=False)
+    op.create_index('ix_carre_level_id', 'carre', ['level', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_carre_level_id', table_name='carre')
+    op.drop_index('ix_mojette_level_id', table_name='mojette')
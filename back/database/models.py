@@ -1,7 +1,10 @@
 import datetime
+from operator import attrgetter, itemgetter
+from typing import Callable
+
 from sqlalchemy import (DECIMAL, JSON, Boolean, Column, Date, DateTime,
-                        ForeignKey, ForeignKeyConstraint, Integer, Row, String,
-                        Text, func)
+                        ForeignKey, ForeignKeyConstraint, Index, Integer, Row,
+                        String, Text, func)
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.inspection import inspect
 from sqlalchemy.orm import DeclarativeBase
@@ -17,16 +20,69 @@ class Base(DeclarativeBase):
 metadata = Base.metadata
 
 
+# mapped class -> (attribute names, getter returning a tuple of their values)
+_serializer_plans: dict[type, tuple[tuple[str, ...], Callable[[object], tuple]]] = {}
+
+
+def _make_values_getter(keys: tuple[str, ...]) -> Callable[[object], tuple]:
+    """
+    Return a function reading the values of `keys` on an instance, as a tuple.
+    Loaded values are read straight from the instance __dict__, which skips the
+    instrumented attribute machinery; expired or deferred attributes fall back
+    to getattr so that SQLAlchemy can load them.
+    """
+    from_dict = itemgetter(*keys)
+    from_attrs = attrgetter(*keys)
+    if len(keys) == 1:
+        # item/attrgetter return a bare value (not a tuple) for a single key
+        return lambda obj: (obj.__dict__[keys[0]] if keys[0] in obj.__dict__ else from_attrs(obj),)
+
+    def getter(obj):
+        try:
+            return from_dict(obj.__dict__)
+        except KeyError:
+            return from_attrs(obj)
+    return getter
+
+
+def _get_serializer_plan(cls) -> tuple[tuple[str, ...], Callable[[object], tuple]]:
+    """
+    Build (once per mapped class) the list of attributes to serialize and a
+    getter reading all of them in a single call.
+    """
+    plan = _serializer_plans.get(cls)
+    if plan is None:
+        keys = tuple(inspect(cls).attrs.keys())
+        plan = (keys, _make_values_getter(keys))
+        _serializer_plans[cls] = plan
+    return plan
+
+
 class Serializer(object):
     """
     Helper class for serializing SQLAlchemy objects into dictionaries.
+    The attributes of each mapped class are inspected only once, see _get_serializer_plan.
     """
 
     def serialize(self):
         """
         Serialize the Database object into a dictionary
         """
-        return {c: getattr(self, c) for c in inspect(self).attrs.keys()}
+        keys, getter = _get_serializer_plan(type(self))
+        return dict(zip(keys, getter(self)))
+
+    def serialize_tuple(self) -> tuple:
+        """
+        Serialize the Database object into a tuple, ordered like serializer_keys()
+        """
+        return _get_serializer_plan(type(self))[1](self)
+
+    @classmethod
+    def serializer_keys(cls) -> tuple[str, ...]:
+        """
+        Names of the attributes returned by serialize() and serialize_tuple()
+        """
+        return _get_serializer_plan(cls)[0]
 
     @staticmethod
     def serialize_list(l):
@@ -45,8 +101,8 @@ class Serializer(object):
         for table in row:
             if table is None:
                 continue
-            data = table.serialize()
-            combined_dict.update(data)
+            keys, getter = _get_serializer_plan(type(table))
+            combined_dict.update(zip(keys, getter(table)))
         return combined_dict
 
     @staticmethod
@@ -55,7 +111,8 @@ class Serializer(object):
         Serialize a list of Row objects, result of a join into a list of dictionaries
         warning: if there are multiple columns with the same name, only the last one will be kept
         """
-        return [Serializer.serialize_row(m) for m in l]
+        serialize_row = Serializer.serialize_row
+        return [serialize_row(m) for m in l]
 
 # users
 
@@ -358,6 +415,10 @@ class Mojette(Base, Serializer):
     """
 
     __tablename__ = 'mojette'
+    # keyset pagination of the catalog (utils/pagination.py)
+    __table_args__ = (
+        Index('ix_mojette_level_id', 'level', 'id'),
+    )
 
     id = Column(Integer, primary_key=True)
     game = Column(Integer, ForeignKey('game.id'))
@@ -396,6 +457,65 @@ class MojetteCompleted(Base, Serializer):
     completion_date = Column(DateTime, server_default=func.now())
     completion_time = Column(Integer)
 
+
+class MojetteLeaderboard(Base, Serializer):
+    """
+    Materialized leaderboard of a Mojette grid, one row per completion.
+    Filled by DatabaseManager.CreateMojetteCompleted, so that ranks are read
+    from the (grid_id, score, user_id) index instead of a window function.
+
+    Players are ranked by score descending, then by user_id descending, so that
+    every ranking query is a plain (forward or backward) scan of the index.
+
+    Attributes:
+        grid_id (int): The ID of the completed Mojette puzzle.
+        user_id (int): The ID of the user who completed the puzzle.
+        score (int): Score of the completion, see compute_score.
+        completion_time (int): The time taken by the user to complete the puzzle, in seconds.
+        helps_used (int): The number of helps used by the user to complete the puzzle.
+    """
+
+    __tablename__ = 'mojette_leaderboard'
+
+    BASE_SCORE = 1000
+    POINTS_LOST_PER_SECOND = 1
+    POINTS_LOST_PER_HELP = 50
+
+    grid_id = Column(Integer, ForeignKey('mojette.id'), primary_key=True)
+    user_id = Column(Integer, ForeignKey('user.id'), primary_key=True)
+    score = Column(Integer, nullable=False)
+    completion_time = Column(Integer)
+    helps_used = Column(Integer)
+    __table_args__ = (
+        Index('ix_mojette_leaderboard_grid_score', 'grid_id', 'score', 'user_id'),
+    )
+
+    @classmethod
+    def compute_score(cls, completion_time, helps_used) -> int:
+        """
+        score = max(0, BASE_SCORE - POINTS_LOST_PER_SECOND * completion_time - POINTS_LOST_PER_HELP * helps_used)
+        """
+        return max(0, cls.BASE_SCORE
+                   - cls.POINTS_LOST_PER_SECOND * (completion_time or 0)
+                   - cls.POINTS_LOST_PER_HELP * (helps_used or 0))
+
+
+class DailyGrid(Base, Serializer):
+    """
+    Schedule of the daily Mojette, one grid per calendar day.
+    Generated months ahead by DailyGridManager.pregenerate (flask daily-grids pregenerate)
+    and never overwritten, so past days stay available.
+
+    Attributes:
+        date (date): The day the grid is played.
+        mojette_id (int): The ID of the Mojette puzzle of the day.
+    """
+
+    __tablename__ = 'daily_grid'
+
+    date = Column(Date, primary_key=True)
+    mojette_id = Column(Integer, ForeignKey('mojette.id'), nullable=False)
+
 # carres
 
 
@@ -413,6 +533,10 @@ class Carre(Base, Serializer):
     """
 
     __tablename__ = 'carre'
+    # keyset pagination of the catalog (utils/pagination.py)
+    __table_args__ = (
+        Index('ix_carre_level_id', 'level', 'id'),
+    )
 
     id = Column(Integer, primary_key=True)
     game = Column(Integer, ForeignKey('game.id'))
@@ -547,6 +671,8 @@ class CheckoutSession(Base, Serializer):
         status (str): The status of the checkout session, either 'pending', 'confirmed' or 'cancelled'.
         created_at (datetime): The timestamp when the checkout session was created.
         finished_at (datetime): The timestamp when the checkout session was finished (confirmed or cancelled).
+        token_coin (int): The token coins credited when the session is paid (None for the sessions created before it was stored).
+        mojettes (int): The mojettes credited when the session is paid, minus the promotions (None for the sessions created before it was stored).
     """
 
     __tablename__ = 'checkout_session'
@@ -556,6 +682,26 @@ class CheckoutSession(Base, Serializer):
     status = Column(Text)
     created_at = Column(DateTime, server_default=func.now())
     finished_at = Column(DateTime, server_default=None)
+    token_coin = Column(Integer, nullable=True)
+    mojettes = Column(Integer, nullable=True)
+
+
+class StripeEvent(Base, Serializer):
+    """
+    Represents a Stripe webhook event received, to process each event only once.
+    Attributes:
+        event_id (str): The stripe ID of the event.
+        type (str): The type of the event (e.g. 'checkout.session.completed').
+        received_at (datetime): The timestamp when the event was first received.
+        processed_at (datetime): The timestamp when the event was processed, None until then.
+    """
+
+    __tablename__ = 'stripe_event'
+
+    event_id = Column(String(255), primary_key=True)
+    type = Column(String(255), nullable=False)
+    received_at = Column(DateTime, server_default=func.now(), nullable=False)
+    processed_at = Column(DateTime, nullable=True)
 
 # RGPD
 
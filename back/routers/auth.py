@@ -1,6 +1,7 @@
 import datetime
 import os
 import re
+import time
 import uuid
 
 import bcrypt
@@ -14,7 +15,8 @@ from flask_restx import Namespace, Resource, fields
 from utils.decorators import token_required
 from utils.mail import sendConfirmationTemplate, sendPasswordResetTemplate
 from utils.token import decode_token, generate_token
-from utils.rgpd import create_user_export_json
+from utils.export_jobs import (COMPLETED, EXPORT_FORMATS, ExportJobManager,
+                               export_job_manager)
 
 api = Namespace('/', description='Auth related operations')
 
@@ -179,111 +181,131 @@ def is_email(identifier: str) -> bool:
     return re.match(r"^[^@\s]+@[^@\s]+\.[^@\s]+$", identifier) is not None
 
 
+def _check_export_access(user_id):
+    """
+    Abort (401 / 404 / 500) unless the Authorization token belongs to the user
+    or to an admin, and the user exists. Each refusal is logged as a failed UserDataRequest.
+    """
+    # Get token from Authorization header
+    auth_header = request.headers.get('Authorization', '')
+    if not auth_header:
+        # Log failed request
+        db_manager.CreateUserDataRequest(
+            UserDataRequest(user_id=user_id, status='failed', extra='Missing authorization token')
+        )
+        abort(401, 'Missing authorization token')
+
+    token = auth_header
+    if auth_header.startswith('Bearer '):
+        token = auth_header[7:]
+
+    # Decode token manually
+    SECRET_KEY = os.getenv('SECRET_KEY')
+    if not SECRET_KEY:
+        db_manager.CreateUserDataRequest(
+            UserDataRequest(user_id=user_id, status='failed', extra='SECRET_KEY not configured')
+        )
+        abort(500, 'SECRET_KEY not set in environment variables')
+
+    try:
+        decoded = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
+        token_user_id = decoded.get('user_id')
+    except jwt.ExpiredSignatureError:
+        db_manager.CreateUserDataRequest(
+            UserDataRequest(user_id=user_id, status='failed', extra='Token expired')
+        )
+        abort(401, 'Token expired')
+    except jwt.InvalidTokenError:
+        db_manager.CreateUserDataRequest(
+            UserDataRequest(user_id=user_id, status='failed', extra='Invalid token')
+        )
+        abort(401, 'Invalid token')
+
+    # Check if requesting user is the same as the user being exported or is admin
+    user = db_manager.ReadUserById(token_user_id)
+    if not user:
+        db_manager.CreateUserDataRequest(
+            UserDataRequest(user_id=user_id, status='failed', extra='Token user not found')
+        )
+        abort(401, 'Unauthorized')
+
+    is_admin = user.role == 'Admin'
+    if token_user_id != user_id and not is_admin:
+        db_manager.CreateUserDataRequest(
+            UserDataRequest(user_id=user_id, status='failed', extra='Unauthorized - can only export own data')
+        )
+        abort(401, 'Unauthorized - can only export own data')
+
+    # Get the target user's data
+    target_user = db_manager.ReadUserById(user_id)
+    if not target_user:
+        db_manager.CreateUserDataRequest(
+            UserDataRequest(user_id=user_id, status='failed', extra='User not found')
+        )
+        abort(404, 'User not found')
+
+
 @api.route('/user/<int:user_id>/export-data')
 class ExportUserData(Resource):
-    @api.response(200, 'User data exported successfully')
+    @api.response(202, 'Export job enqueued')
+    @api.response(400, 'Invalid format')
     @api.response(401, 'Unauthorized')
     @api.response(404, 'User not found')
-    @api.response(500, 'Internal Server Error')
-    def get(self, user_id):
-        """Export all user data in JSON format (RGPD compliance)"""
-        try:
-            # Get token from Authorization header
-            auth_header = request.headers.get('Authorization', '')
-            if not auth_header:
-                # Log failed request
-                db_manager.CreateUserDataRequest(
-                    UserDataRequest(user_id=user_id, status='failed', extra='Missing authorization token')
-                )
-                abort(401, 'Missing authorization token')
-
-            token = auth_header
-            if auth_header.startswith('Bearer '):
-                token = auth_header[7:]
-
-            # Decode token manually
-            SECRET_KEY = os.getenv('SECRET_KEY')
-            if not SECRET_KEY:
-                db_manager.CreateUserDataRequest(
-                    UserDataRequest(user_id=user_id, status='failed', extra='SECRET_KEY not configured')
-                )
-                abort(500, 'SECRET_KEY not set in environment variables')
-
-            try:
-                decoded = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
-                token_user_id = decoded.get('user_id')
-            except jwt.ExpiredSignatureError:
-                db_manager.CreateUserDataRequest(
-                    UserDataRequest(user_id=user_id, status='failed', extra='Token expired')
-                )
-                abort(401, 'Token expired')
-            except jwt.InvalidTokenError:
-                db_manager.CreateUserDataRequest(
-                    UserDataRequest(user_id=user_id, status='failed', extra='Invalid token')
-                )
-                abort(401, 'Invalid token')
-
-            # Check if requesting user is the same as the user being exported or is admin
-            user = db_manager.ReadUserById(token_user_id)
-            if not user:
-                db_manager.CreateUserDataRequest(
-                    UserDataRequest(user_id=user_id, status='failed', extra='Token user not found')
-                )
-                abort(401, 'Unauthorized')
-
-            is_admin = user.role == 'Admin'
-            if token_user_id != user_id and not is_admin:
-                db_manager.CreateUserDataRequest(
-                    UserDataRequest(user_id=user_id, status='failed', extra='Unauthorized - can only export own data')
-                )
-                abort(401, 'Unauthorized - can only export own data')
-
-            # Get the target user's data
-            target_user = db_manager.ReadUserById(user_id)
-            if not target_user:
-                db_manager.CreateUserDataRequest(
-                    UserDataRequest(user_id=user_id, status='failed', extra='User not found')
-                )
-                abort(404, 'User not found')
-
-            # Export data as JSON
-            json_data = create_user_export_json(user_id)
-
-            # Check if there was an error in the export
-            if 'error' in json_data:
-                db_manager.CreateUserDataRequest(
-                    UserDataRequest(user_id=user_id, status='failed', extra=json_data.get('error', 'Unknown error'))
-                )
-                abort(500, f'Error exporting data: {json_data.get("error")}')
-
-            # Log successful request
-            db_manager.CreateUserDataRequest(
-                UserDataRequest(user_id=user_id, status='completed')
-            )
-
-            # Return as JSON file download
-            from io import BytesIO
-            json_bytes = BytesIO(json_data.encode('utf-8'))
+    @api.doc(params={"format": "zip (default, one JSON file per table) or json (one document)"})
+    def post(self, user_id):
+        """Enqueue the export of all user data (RGPD compliance), prepared in the background"""
+        export_format = request.args.get('format', 'zip')
+        if export_format not in EXPORT_FORMATS:
+            abort(400, 'format must be json or zip')
+        _check_export_access(user_id)
+        job = export_job_manager.submit(user_id, export_format)
+        db_manager.CreateUserDataRequest(
+            UserDataRequest(user_id=user_id, status='pending', extra=f"job {job['job_id']}")
+        )
+        return ExportJobManager.public_status(job), 202
+
+
+def _read_export_job(user_id, job_id):
+    """Job of the user after the access checks, 404 if it does not exist"""
+    _check_export_access(user_id)
+    job = export_job_manager.get(job_id)
+    if job is None or job['user_id'] != user_id:
+        abort(404, 'Export job not found')
+    return job
+
+
+@api.route('/user/<int:user_id>/export-data/<string:job_id>')
+class ExportUserDataJob(Resource):
+    @api.response(200, 'Export job status')
+    @api.response(401, 'Unauthorized')
+    @api.response(404, 'Export job not found')
+    def get(self, user_id, job_id):
+        """Status and progress of an export job"""
+        return ExportJobManager.public_status(_read_export_job(user_id, job_id)), 200
 
-            return send_file(
-                json_bytes,
-                mimetype='application/json',
-                as_attachment=True,
-                download_name=f'user_data_{user_id}_{datetime.datetime.now().strftime("%Y%m%d")}.json'
-            )
 
-        except Exception as e:
-            import traceback
-            print(f"Error exporting user data: {str(e)}")
-            traceback.print_exc()
-            # Log the error
-            try:
-                db_manager.CreateUserDataRequest(
-                    UserDataRequest(user_id=user_id, status='failed', extra=str(e))
-                )
-            except:
-                pass
-            abort(500, f'Internal Server Error: {str(e)}')
+@api.route('/user/<int:user_id>/export-data/<string:job_id>/download')
+class ExportUserDataJobDownload(Resource):
+    @api.response(200, 'User data exported successfully')
+    @api.response(401, 'Unauthorized')
+    @api.response(404, 'Export job not found')
+    @api.response(409, 'Export not ready')
+    @api.response(410, 'Export expired')
+    def get(self, user_id, job_id):
+        """Download the archive prepared by an export job"""
+        job = _read_export_job(user_id, job_id)
+        if job['status'] != COMPLETED:
+            abort(409, f"Export {job['status']}")
+        path = export_job_manager.artifact_path(job)
+        if job['expires_at'] < time.time() or not os.path.exists(path):
+            abort(410, 'Export expired')
+        created = datetime.datetime.fromtimestamp(job['created_at'])
+        return send_file(
+            path,
+            mimetype='application/zip' if job['format'] == 'zip' else 'application/json',
+            as_attachment=True,
+            download_name=f"user_data_{user_id}_{created.strftime('%Y%m%d')}.{job['format']}"
+        )
 
 
 @api.route('/user/<int:user_id>/delete-account')
@@ -7,23 +7,34 @@ api = Namespace('carres', description='Carres related operations')
 from core.models import carre_model, carre_complete_model, carre_completed_model, carre_verification_model, completion_response_model
 
 from utils.decorators import token_required
-from utils.token import decode_token
+from utils.export_stream import export_response
+from utils.pagination import DEFAULT_PAGE_LIMIT, NEXT_CURSOR_HEADER, next_cursor_headers, request_cursor, request_limit
+from utils.token import get_token_claims
 from utils.validation import is_carre_solution_valid, add_carre_to_completed_list
 
 from database.database import DatabaseManager
 import database.models as models
 db_manager = DatabaseManager()
 
+CARRES_PAGE_SIZE = 100
+
+COMPLETION_EXPORT_COLUMNS = ('user_id', 'grid_id', 'completion_time', 'completion_date')
+
 @api.route('')
 class CarreList(Resource):
     @api.marshal_list_with(carre_model)
     @api.response(401, 'User token invalid')    
+    @api.response(400, 'Invalid cursor')
+    @api.doc(params={"cursor": f"Cursor of the next page, returned in the {NEXT_CURSOR_HEADER} header"})
     # @token_required
 
     def get(self):
-        '''List all carres grid'''
+        '''List all carres grid, ordered by level and id'''
+        cursor = request_cursor()
         try:
-          data = models.Carre.serialize_list(db_manager.ReadCarres(0))
+          # one extra grid tells if there is a next page
+          data = models.Carre.serialize_list(db_manager.ReadCarres(0, after=cursor, limit=CARRES_PAGE_SIZE + 1))
+          headers = next_cursor_headers(data, CARRES_PAGE_SIZE)
           for x in data:
             x["carre_list"] = x["carre_list"].split(',')
           if data is None:
@@ -31,7 +42,7 @@ class CarreList(Resource):
         except Exception as e:
           print(e)
           return {'message': "Carres not found"}, 404
-        return data, 200
+        return data, 200, headers
     
     @api.marshal_with(carre_model)
     @api.expect(carre_model, validate=True)  # Make sure the model is correct for validation
@@ -124,19 +135,46 @@ class CarreRandom(Resource):
 class CarreComplete(Resource):    
     @api.response(401, 'User token invalid')  
     @api.response(201, 'Carre completion added successfully')
+    @api.response(400, 'Invalid limit or cursor')
     @api.response(500, 'Internal Server Error')
+    @api.doc(params={"limit": "Page size, all completions when neither limit nor cursor is given",
+                     "cursor": f"Cursor of the next page, returned in the {NEXT_CURSOR_HEADER} header"})
     @api.marshal_list_with(carre_complete_model)
     @token_required
     def get(self):
       '''Retrieve all carres completed'''
+      limit = request_limit()
+      cursor = request_cursor()
+      headers = {}
       try:
-        data = models.CarreCompleted.serialize_list(db_manager.ReadCarresCompleted())
+        if limit is None and cursor is None:
+          data = models.CarreCompleted.serialize_list(db_manager.ReadCarresCompleted())
+        else:
+          limit = limit or DEFAULT_PAGE_LIMIT
+          # one extra completion tells if there is a next page
+          data = models.CarreCompleted.serialize_list(db_manager.ReadCarresCompletedPage(cursor, limit + 1))
+          headers = next_cursor_headers(data, limit, keys=('user_id', 'grid_id'))
         if data is None:
           abort(404)
       except Exception as e:
         print(e)
         return {'message': "Carres completed not found"}, 404
-      return data, 200
+      return data, 200, headers
+
+@api.route('/complete/export')
+class CarreCompleteExport(Resource):
+    @api.response(200, 'Completions streamed as NDJSON or CSV')
+    @api.response(400, 'Invalid format')
+    @api.response(401, 'User is not admin')
+    @api.doc(params={"format": "ndjson (default) or csv"})
+    @token_required
+    def get(self):
+      '''Export all carre completions, streamed with a server-side cursor (admin only)'''
+      user_id = get_token_claims()['user_id']
+      if not db_manager.UserIsAdmin(user_id):
+        return {'message': "User is not admin"}, 401
+      return export_response(db_manager.StreamCarresCompleted(COMPLETION_EXPORT_COLUMNS),
+                             COMPLETION_EXPORT_COLUMNS, 'carres_completed')
 
 @api.route('/<int:carre_id>/completed')
 class MojetteCompleted(Resource):
@@ -148,7 +186,7 @@ class MojetteCompleted(Resource):
     def get(self, carre_id):
         '''Retrieve if user has completed carre'''
 
-        user_id = decode_token(request.headers["Authorization"])['user_id']
+        user_id = get_token_claims()['user_id']
         try:
           data = db_manager.ReadCarreCompletedByPrimaryKey(user_id, carre_id).serialize()
           if data is None:
@@ -177,7 +215,7 @@ class CarreGridCompleted(Resource):
         r = request.json
         completion_time = r["completion_time"]
 
-        user_id = decode_token(request.headers["Authorization"])['user_id']
+        user_id = get_token_claims()['user_id']
         try:
           data = models.Serializer.serialize_row(db_manager.ReadCarreById(carre_id))
           if data is None:
@@ -8,7 +8,8 @@ from flask import abort, request, send_from_directory
 from flask_restx import Namespace, Resource, fields
 import werkzeug
 import os
-from utils.image_utils import upload_image_with_compression, create_lowered_image
+from utils.image_utils import (RENDITION_MISSING, image_processing_pool,
+                               upload_image_with_compression)
 from utils.discord_webhook import discord_webhook
 
 UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), '..', 'static', 'formation_images')
@@ -19,7 +20,8 @@ api = Namespace('formations', description='Formation related operations')
 
 db_manager = DatabaseManager()
 from utils.decorators import token_required
-from utils.token import decode_token
+from utils.response_cache import FORMATIONS, cached_response
+from utils.token import get_token_claims
 
 
 @api.route('')
@@ -43,8 +45,7 @@ class FormationList(Resource):
     def post(self):
         '''Create formation'''
         try:
-            user_id = decode_token(request.headers.get('Authorization'))[
-                "user_id"]
+            user_id = get_token_claims()["user_id"]
             if not user_id or not db_manager.UserIsAdmin(user_id):
                 return {'message': "User is not admin"}, 401
             data = request.json
@@ -57,6 +58,8 @@ class FormationList(Resource):
 
 @api.route('/calendar')
 class FormationCalendar(Resource):
+    # rebuilt every minute anyway: only upcoming sessions are listed
+    @cached_response(FORMATIONS, per_user=True, max_age=60)
     @api.marshal_list_with(formation_extended_model)
     @api.response(401, 'User token invalid')
     def get(self):
@@ -65,20 +68,17 @@ class FormationCalendar(Resource):
 
             token = request.headers.get('Authorization')
             if token is not None:
-                user_id = decode_token(token)["user_id"]
+                user_id = get_token_claims()["user_id"]
             else:
                 user_id = None
 
-            data = models.Serializer.serialize_list_row(
-                db_manager.ReadFormationsCalendar())
+            # Une seule requête pour toutes les formations achetées par l'utilisateur
+            owned_ids = db_manager.ReadFormationIdsOwnedByUser(
+                user_id) if user_id is not None else set()
+
+            data = db_manager.ReadFormationsCalendarProjection()
             ret = {}
             for formation in data:
-                if user_id is not None:
-                    owned = db_manager.FormationOwnedByUser(
-                        user_id, formation['id'])
-                    formation['owned'] = owned
-                else:
-                    formation['owned'] = False
                 formation['live_link'] = None
                 formation['replay_link'] = None
                 # solution un peu hacky mais il faudrait revoir la requete calendrier a termes
@@ -90,6 +90,7 @@ class FormationCalendar(Resource):
                         'description': formation['description'],
                         'price': formation['price'],
                         'img_link': formation['img_link'],
+                        'owned': formation['id'] in owned_ids,
                         'sessions': []
                     }
                 ret[formation['id']]['sessions'].append({
@@ -120,8 +121,7 @@ class Formation(Resource):
             formation_obj = db_manager.ReadFormationById(formation_id)
             if formation_obj is None:
                 abort(404)
-            token = request.headers.get('Authorization')
-            user_id = decode_token(token)["user_id"]
+            user_id = get_token_claims()["user_id"]
             admin = db_manager.UserIsAdmin(user_id) if user_id else False
             if not admin and not formation_obj.displayed:
                 abort(404, "Formation not found")
@@ -151,8 +151,7 @@ class Formation(Resource):
         '''Update formation'''
         try:
             print("PUT")
-            user_id = decode_token(request.headers.get('Authorization'))[
-                "user_id"]
+            user_id = get_token_claims()["user_id"]
             if not user_id or not db_manager.UserIsAdmin(user_id):
                 return {'message': "User is not admin"}, 401
             data = request.json
@@ -168,8 +167,7 @@ class Formation(Resource):
     def delete(self, formation_id):
         '''Delete formation'''
         try:
-            user_id = decode_token(request.headers.get('Authorization'))[
-                "user_id"]
+            user_id = get_token_claims()["user_id"]
             if not user_id or not db_manager.UserIsAdmin(user_id):
                 return {'message': "User is not admin"}, 401
             db_manager.DeleteFormation(formation_id)
@@ -189,8 +187,7 @@ class FormationSessions(Resource):
     def post(self, formation_id):
         '''Create formation session'''
         try:
-            user_id = decode_token(request.headers.get('Authorization'))[
-                "user_id"]
+            user_id = get_token_claims()["user_id"]
             if not user_id or not db_manager.UserIsAdmin(user_id):
                 return {'message': "User is not admin"}, 401
             data = request.json
@@ -212,8 +209,7 @@ class FormationSession(Resource):
     def put(self, formation_id, formation_availability_id):
         '''Update formation session'''
         try:
-            user_id = decode_token(request.headers.get('Authorization'))[
-                "user_id"]
+            user_id = get_token_claims()["user_id"]
             if not user_id or not db_manager.UserIsAdmin(user_id):
                 return {'message': "User is not admin"}, 401
             data = request.json
@@ -231,8 +227,7 @@ class FormationSession(Resource):
     def delete(self, formation_id, formation_availability_id):
         '''Delete formation session'''
         try:
-            user_id = decode_token(request.headers.get('Authorization'))[
-                "user_id"]
+            user_id = get_token_claims()["user_id"]
             if not user_id or not db_manager.UserIsAdmin(user_id):
                 return {'message': "User is not admin"}, 401
             db_manager.DeleteFormationSession(formation_availability_id)
@@ -266,8 +261,7 @@ class FormationUsers(Resource):
     def get(self, formation_id):
         '''Get formation users'''
         try:
-            token_user_id = decode_token(
-                request.headers.get('Authorization'))["user_id"]
+            token_user_id = get_token_claims()["user_id"]
             if not token_user_id or not db_manager.UserIsAdmin(token_user_id):
                 return {'message': "User is not admin"}, 401
             data = models.Serializer.serialize_list(
@@ -286,8 +280,7 @@ class FormationBuy(Resource):
     def post(self, formation_id):
         '''Buy a formation'''
         try:
-            token = request.headers.get('Authorization')
-            user_id = decode_token(token)["user_id"]
+            user_id = get_token_claims()["user_id"]
             user = db_manager.ReadUserById(user_id)
             formation = db_manager.ReadFormationById(formation_id)
 
@@ -317,8 +310,7 @@ class FormationBuy(Resource):
     def post(self, formation_id, user_id):
         '''Buy a formation for a user (admin only)'''
         try:
-            token = request.headers.get('Authorization')
-            token_user_id = decode_token(token)["user_id"]
+            token_user_id = get_token_claims()["user_id"]
             if not token_user_id or not db_manager.UserIsAdmin(token_user_id):
                 return {'message': "User is not admin"}, 401
 
@@ -344,9 +336,10 @@ class FormationBuy(Resource):
 
 @api.route('/category')
 class FormationCategoryList(Resource):
+    @token_required
+    @cached_response(FORMATIONS)
     @api.marshal_list_with(formation_category_model)
     @api.response(401, 'User token invalid')
-    @token_required
     def get(self):
         '''List all formation category'''
         try:
@@ -379,8 +372,7 @@ class FormationCategory(Resource):
     def put(self, category_code):
         '''Update formation category'''
         try:
-            user_id = decode_token(request.headers.get('Authorization'))[
-                "user_id"]
+            user_id = get_token_claims()["user_id"]
             if not user_id or not db_manager.UserIsAdmin(user_id):
                 return {'message': "User is not admin"}, 401
             data = request.json
@@ -400,8 +392,7 @@ class FormationCategoryFormations(Resource):
     def get(self, category_code):
         '''Get formation category formations'''
         try:
-            token = request.headers.get('Authorization')
-            user_id = decode_token(token)["user_id"]
+            user_id = get_token_claims()["user_id"]
             is_admin = db_manager.UserIsAdmin(user_id) if user_id else False
             formations = db_manager.ReadFormationsByCategoryCode(category_code, admin=is_admin)
             data = models.Serializer.serialize_list(formations)
@@ -433,6 +424,16 @@ class FormationImageUpload(Resource):
         file: werkzeug.datastructures.FileStorage = request.files['image']
         return upload_image_with_compression(file, UPLOAD_FOLDER, '/formations/image')
 
+@api.route('/upload-image/status/<string:filename>')
+class FormationImageUploadStatus(Resource):
+    @api.response(404, 'Image not found')
+    def get(self, filename):
+        '''Status of the lowered version of an uploaded image (pending, ready, failed, missing or none)'''
+        image_path = os.path.join(UPLOAD_FOLDER, filename)
+        if filename != werkzeug.utils.secure_filename(filename) or not os.path.isfile(image_path):
+            return {'message': 'Image not found'}, 404
+        return {'filename': filename, 'image_status': image_processing_pool.status(image_path)}, 200
+
 @api.route('/image/<string:filename>')
 class FormationImageServe(Resource):
     def get(self, filename):
@@ -479,13 +480,11 @@ class FormationImageServeLowered(Resource):
             original_file = next((f for f in files if f.lower().split('.')[0] == filename_lower.split('.')[0]), None)
 
             if original_file:
-                # Create lowered version from original
+                # Lowered version produced in the background, the original is served meanwhile
                 original_path = os.path.join(UPLOAD_FOLDER, original_file)
-                lowered_path = create_lowered_image(original_path)
-
-                if lowered_path and os.path.exists(lowered_path):
-                    lowered_filename = os.path.basename(lowered_path)
-                    return send_from_directory(UPLOAD_FOLDER, lowered_filename)
+                if image_processing_pool.status(original_path) == RENDITION_MISSING:
+                    image_processing_pool.submit(original_path)
+                return send_from_directory(UPLOAD_FOLDER, original_file)
 
             abort(404, "Image not found")
         except Exception as e:
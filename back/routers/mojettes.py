@@ -13,7 +13,12 @@ from flask import abort, request
 from flask_restx import Namespace, Resource
 from utils.daily_grid_manager import DailyGridManager
 from utils.decorators import token_required
-from utils.token import decode_token
+from utils.export_stream import export_response
+from utils.mojette_grid_cache import mojette_grid_cache
+from utils.pagination import (DEFAULT_PAGE_LIMIT, NEXT_CURSOR_HEADER,
+                              encode_cursor, next_cursor_headers,
+                              request_cursor, request_limit)
+from utils.token import get_token_claims
 from utils.validation import add_mojette_to_completed_list
 
 api = Namespace('mojettes', description='Mojettes related operations')
@@ -24,32 +29,45 @@ db_manager = DatabaseManager()
 
 daily_grid_manager = DailyGridManager()
 
+MOJETTES_PAGE_SIZE = 30
+
+COMPLETION_EXPORT_COLUMNS = ('user_id', 'grid_id', 'helps_used', 'completion_time', 'completion_date')
+
 
 @api.route('')
 class MojetteList(Resource):
     @api.marshal_list_with(simple_mojette_model)
     @api.response(401, 'User token invalid')
-    @api.doc(params={"level": "Filter grids based on level", "page": "Pagination index"})
+    @api.response(400, 'Invalid cursor')
+    @api.doc(params={"level": "Filter grids based on level",
+                     "page": "Pagination index (legacy, prefer cursor)",
+                     "cursor": f"Cursor of the next page, returned in the {NEXT_CURSOR_HEADER} header"})
     @token_required
     def get(self):
-        '''List all mojettes grid'''
-        token_decoded = decode_token(request.headers["Authorization"])
+        '''List all mojettes grid, ordered by level and id'''
+        token_decoded = get_token_claims()
         user_id = token_decoded['user_id']
         level = request.args.get('level')
         page = 0 if request.args.get(
             'page') is None else request.args.get('page')
+        cursor = request_cursor()
+        if cursor is not None and level and str(cursor[0]) != level:
+            abort(400, "Invalid cursor")
         try:
+            # one extra grid tells if there is a next page
             if not level:
-                data = models.Mojette.serialize_list(
-                    db_manager.ReadMojettes(int(page)))
+                data = db_manager.ReadMojettesProjection(
+                    int(page), after=cursor, limit=MOJETTES_PAGE_SIZE + 1)
             else:
-                data = models.Mojette.serialize_list_row(
-                    db_manager.ReadMojettesByLevelAndPage(user_id, int(level), int(page)))
+                data = db_manager.ReadMojettesByLevelAndPageProjection(
+                    user_id, int(level), int(page), after_id=cursor[1] if cursor else None,
+                    limit=MOJETTES_PAGE_SIZE + 1)
+            headers = next_cursor_headers(data, MOJETTES_PAGE_SIZE)
             for mojette in data:
-                mojette['solved'] = "user_id" in mojette and mojette['user_id'] is not None
+                mojette['solved'] = bool(mojette.get('solved'))
         except Exception:
             abort(404, "Mojettes not found")
-        return data, 200
+        return data, 200, headers
 
     @api.marshal_with(mojette_model)
     # Make sure the model is correct for validation
@@ -94,13 +112,7 @@ class Mojette(Resource):
         '''Retrieve one mojette by id'''
 
         try:
-            data = models.Serializer.serialize_row(
-                db_manager.ReadMojetteById(mojette_id))
-            data['bin_values'] = data['bin_values'].split(',')
-            data['array_box'] = data['array_box'].split(' ')
-            if data is None:
-                abort(404)
-
+            data = db_manager.ReadDecodedMojetteById(mojette_id).to_dict()
         except Exception:
             abort(404, "Mojette not found")
         return data, 200
@@ -130,16 +142,28 @@ class MojetteCompletedByUser(Resource):
     @api.marshal_list_with(mojette_complete_model)
     @api.response(401, 'User token invalid')
     @api.response(201, 'Mojette completion added successfully')
+    @api.response(400, 'Invalid limit or cursor')
     @api.response(500, 'Internal Server Error')
+    @api.doc(params={"limit": "Page size of the admin list, all completions when neither limit nor cursor is given",
+                     "cursor": f"Cursor of the next page, returned in the {NEXT_CURSOR_HEADER} header"})
     @token_required
     def get(self):
         '''Retrieve user completed mojettes'''
 
-        token_decoded = decode_token(request.headers["Authorization"])
+        token_decoded = get_token_claims()
         is_admin = token_decoded['admin']
         user_id = token_decoded['user_id']
+        limit = request_limit()
+        cursor = request_cursor()
+        headers = {}
         try:
-            if is_admin:
+            if is_admin and (limit is not None or cursor is not None):
+                limit = limit or DEFAULT_PAGE_LIMIT
+                # one extra completion tells if there is a next page
+                data = models.Serializer.serialize_list(
+                    db_manager.ReadMojettesCompletedPage(cursor, limit + 1))
+                headers = next_cursor_headers(data, limit, keys=('user_id', 'grid_id'))
+            elif is_admin:
                 data = models.Serializer.serialize_list(
                     db_manager.ReadMojettesCompleted())
             else:
@@ -149,7 +173,35 @@ class MojetteCompletedByUser(Resource):
                 abort(404)
         except Exception:
             abort(404, "Mojettes completed not found")
-        return data, 200
+        return data, 200, headers
+
+
+@api.route('/complete/export')
+class MojetteCompletedExport(Resource):
+    @api.response(200, 'Completions streamed as NDJSON or CSV')
+    @api.response(400, 'Invalid format')
+    @api.response(401, 'User is not admin')
+    @api.doc(params={"format": "ndjson (default) or csv"})
+    @token_required
+    def get(self):
+        '''Export all mojette completions, streamed with a server-side cursor (admin only)'''
+        user_id = get_token_claims()['user_id']
+        if not db_manager.UserIsAdmin(user_id):
+            return {'message': "User is not admin"}, 401
+        return export_response(db_manager.StreamMojettesCompleted(COMPLETION_EXPORT_COLUMNS),
+                               COMPLETION_EXPORT_COLUMNS, 'mojettes_completed')
+
+
+@api.route('/cache')
+class MojetteCacheStats(Resource):
+    @api.response(401, 'User is not admin')
+    @token_required
+    def get(self):
+        '''Retrieve hit/miss counters of the decoded grids cache (admin only)'''
+        user_id = get_token_claims()['user_id']
+        if not db_manager.UserIsAdmin(user_id):
+            return {'message': "User is not admin"}, 401
+        return mojette_grid_cache.stats(), 200
 
 
 @api.route('/<int:offset>/level/<int:mojette_level>')
@@ -157,20 +209,29 @@ class MojetteByLevel(Resource):
     @api.response(401, 'User token invalid')
     @api.response(201, 'Mojette completion added successfully')
     @api.response(500, 'Internal Server Error')
+    @api.response(400, 'Invalid cursor')
+    @api.doc(params={"cursor": f"Cursor of the next grid of the level (replaces offset), "
+                               f"returned in the {NEXT_CURSOR_HEADER} header"})
     @api.marshal_list_with(mojette_model)
     @token_required
     def get(self, offset, mojette_level):
-        '''Retrieve mojette grid by level and offset'''
+        '''Retrieve mojette grid by level and offset (or cursor)'''
+        cursor = request_cursor()
+        if cursor is not None and cursor[0] != mojette_level:
+            abort(400, "Invalid cursor")
         try:
-            data = models.Serializer.serialize_row(
-                db_manager.ReadMojetteByLevelAndOffset(mojette_level, offset))
+            if cursor is not None:
+                row = db_manager.ReadMojetteByLevelAfter(mojette_level, cursor[1])
+            else:
+                row = db_manager.ReadMojetteByLevelAndOffset(mojette_level, offset)
+            data = models.Serializer.serialize_row(row)
             data['bin_values'] = data['bin_values'].split(',')
             data['array_box'] = data['array_box'].split(' ')
             if data is None:
                 abort(404)
         except Exception:
             abort(404, "Mojette not found")
-        return data, 200
+        return data, 200, {NEXT_CURSOR_HEADER: encode_cursor(mojette_level, data['id'])}
 
 
 @api.route('/<int:mojette_id>/hint')
@@ -182,16 +243,15 @@ class MojetteHint(Resource):
     @token_required
     def get(self, mojette_id):
         '''Retrieve one mojette hint by id'''
-        user_id = decode_token(request.headers["Authorization"])['user_id']
+        user_id = get_token_claims()['user_id']
         try:
-            data = models.Serializer.serialize_row(
-                db_manager.ReadMojetteById(mojette_id))
+            grid = db_manager.ReadDecodedMojetteById(mojette_id)
 
-            assert data is not None and data['solution'] is not None
+            assert grid is not None and grid.solution is not None
 
-            solutionArr = data['solution'].split(',')
-            help_cost = data['help_1_percent_cost']
-            reward = data['reward']
+            solutionArr = grid.solution
+            help_cost = grid.help_cost
+            reward = grid.reward
             randIndex = random.randint(0, len(solutionArr) - 1)
         except Exception:
             abort(404, "Mojette or hint not found")
@@ -205,7 +265,7 @@ class MojetteHint(Resource):
 
         return {
             "tile": randIndex,
-            "value": int(solutionArr[randIndex]),
+            "value": solutionArr[randIndex],
             "mojettes": mojettes
         }, 200
 
@@ -219,7 +279,7 @@ class MojetteCompleted(Resource):
     def get(self, mojette_id):
         '''Retrieve if user has completed mojette grid'''
 
-        user_id = decode_token(request.headers["Authorization"])['user_id']
+        user_id = get_token_claims()['user_id']
         try:
             data = db_manager.ReadMojetteCompletedByPrimaryKey(
                 user_id, mojette_id).serialize()
@@ -247,15 +307,14 @@ class MojetteGridCompleted(Resource):
         helps_used = r["helps_used"]
         completion_time = r["completion_time"]
 
-        user_id = decode_token(request.headers["Authorization"])['user_id']
+        user_id = get_token_claims()['user_id']
         try:
-            data = models.Serializer.serialize_row(
-                db_manager.ReadMojetteById(mojette_id))
+            grid = db_manager.ReadDecodedMojetteById(mojette_id)
 
-            if data is None or data['solution'] is None:
+            if grid is None or grid.solution is None:
                 abort(404, "Mojette not found")
 
-            if ([int(x) for x in data['solution'].split(',')] == r['grid']):
+            if list(grid.solution) == r['grid']:
                 mojette_completed_data = {
                     'grid_id': mojette_id,
                     'user_id': user_id,
@@ -317,7 +376,7 @@ class Leaderboard(Resource):
             404: Si le classement est introuvable
             401: Si le token utilisateur est invalide
         '''
-        user_id = decode_token(request.headers["Authorization"])['user_id']
+        user_id = get_token_claims()['user_id']
         try:
             leaderboard_size = request.args.get('size')
             leaderboard_size = int(leaderboard_size) if leaderboard_size is not None else 10
@@ -337,20 +396,20 @@ class Leaderboard(Resource):
                     'below_user': []
                 }, 200
             top = data[:leaderboard_size]
-            filtered_users = list(filter(lambda x: x.user_id == user_id, data))
+            filtered_users = list(filter(lambda x: x['user_id'] == user_id, data))
             user_entry = filtered_users[0] if filtered_users else None
             above_user = []
             below_user = []
 
             if user_entry:
-                user_position = user_entry.position
+                user_position = user_entry['position']
                 # On récupère les joueurs au-dessus et en-dessous de l'utilisateur
                 if user_position > leaderboard_size:
-                    above_user = list(filter(lambda e: e.position < user_position and
-                                             e.position >= user_position - leaderboard_range and
-                                             e.position > leaderboard_size, data))
+                    above_user = list(filter(lambda e: e['position'] < user_position and
+                                             e['position'] >= user_position - leaderboard_range and
+                                             e['position'] > leaderboard_size, data))
                     below_user = list(filter(
-                        lambda e: e.position > user_position and e.position <= user_position + leaderboard_range, data))
+                        lambda e: e['position'] > user_position and e['position'] <= user_position + leaderboard_range, data))
 
             return {
                 'top': top,
@@ -380,17 +439,12 @@ class MojetteById(Resource):
             dict: Détails de la grille Mojette.
         '''
         try:
-            data = models.Serializer.serialize_row(
-                db_manager.ReadMojetteById(id)
-            )
+            grid = db_manager.ReadDecodedMojetteById(id)
 
-            if data is None:
+            if grid is None:
                 abort(404, "Grid not found")
 
-            data['bin_values'] = data['bin_values'].split(',') if isinstance(data['bin_values'], str) else data['bin_values']
-            data['array_box'] = data['array_box'].split(' ') if isinstance(data['array_box'], str) else data['array_box']
-
-            return data, 200
+            return grid.to_dict(), 200
 
         except Exception as e:
             abort(500, str(e))
@@ -408,9 +462,8 @@ class MojetteDaily(Resource):
         Récupère la grille Mojette du jour.
 
         Cette route utilise le gestionnaire de grilles quotidiennes (DailyGridManager) pour:
-        1. Déterminer quelle grille correspond au jour actuel
-        2. Vérifier si un nouveau mois a commencé (auquel cas de nouvelles grilles sont générées)
-        3. Récupérer et formater les données de la grille
+        1. Déterminer quelle grille est programmée pour le jour demandé
+        2. Récupérer et formater les données de la grille
 
         Query Parameters:
             day (int): Jour spécifique du mois (1-31). Si non spécifié, utilise le jour actuel.
@@ -420,8 +473,8 @@ class MojetteDaily(Resource):
             int: 200 pour succès, autre code pour erreur
 
         Note:
-            Chaque mois, un nouvel ensemble de grilles est aléatoirement assigné
-            aux jours du mois, stocké dans un fichier JSON.
+            Les grilles sont assignées aléatoirement aux jours, à l'avance, dans la
+            table daily_grid (commande `flask daily-grids pregenerate`).
         '''
         # Récupérer le jour demandé s'il est spécifié, sinon utiliser aujourd'hui
         day_param = request.args.get('day')
@@ -433,18 +486,13 @@ class MojetteDaily(Resource):
             if mojette_id == -1:
                 abort(404, "Invalid day specified")
 
-            # Récupérer les détails de la grille depuis la base de données
-            data = models.Serializer.serialize_row(
-                db_manager.ReadMojetteById(mojette_id))
+            # Récupérer les détails de la grille (déjà décodés et mis en cache)
+            grid = db_manager.ReadDecodedMojetteById(mojette_id)
 
-            if data is None:
+            if grid is None:
                 abort(404, "Daily grid not found")
 
-            # Formater les données de la réponse
-            data['bin_values'] = data['bin_values'].split(',')
-            data['array_box'] = data['array_box'].split(' ')
-
-            return data, 200
+            return grid.to_dict(), 200
 
         except Exception as e:
             abort(500, str(e))
@@ -475,39 +523,25 @@ class MojetteDailyCompleted(Resource):
                 ...
             }
         '''
-        user_id = decode_token(request.headers["Authorization"])['user_id']
+        user_id = get_token_claims()['user_id']
 
         try:
-            # Récupérer les données du mois en cours
             today = datetime.date.today()
-            current_month = f"{today.year}-{today.month}"
 
-            # Charger les données des grilles quotidiennes
-            daily_data = daily_grid_manager.load_data()
+            # Grilles programmées pour le mois en cours
+            grids_by_day = daily_grid_manager.get_month_grids()
 
-            # Si le mois courant n'est pas encore généré, on le fait maintenant
-            if daily_data["current_month"] != current_month:
-                daily_grid_manager._generate_monthly_grids(current_month)
-                daily_data = daily_grid_manager.load_data()
+            # Récupérer les IDs des grilles pour chaque jour du mois jusqu'à aujourd'hui
+            days = [str(day) for day in range(1, today.day + 1)
+                    if str(day) in grids_by_day]
 
-            # Récupérer les IDs des grilles pour chaque jour du mois
-            grids_by_day = daily_data["grids"]
+            # Une seule requête pour savoir lesquelles l'utilisateur a complétées
+            completed_ids = db_manager.ReadMojettesCompletedAmong(
+                user_id, [int(grids_by_day[day]) for day in days])
 
-            # Préparer le résultat
-            completion_status = {}
-
-            # Pour chaque jour du mois jusqu'à aujourd'hui
-            for day in range(1, today.day + 1):
-                day_str = str(day)
-
-                # Si ce jour existe dans les grilles quotidiennes
-                if day_str in grids_by_day:
-                    mojette_id = grids_by_day[day_str]
-
-                    # Vérifier si l'utilisateur a complété cette grille
-                    completed = db_manager.ReadMojetteCompletedByPrimaryKey(
-                        user_id, mojette_id)
-                    completion_status[day_str] = completed is not None
+            completion_status = {
+                day: int(grids_by_day[day]) in completed_ids for day in days
+            }
 
             return completion_status, 200
 
@@ -2,7 +2,7 @@ from database.database import DatabaseManager
 from flask import abort, request
 from flask_restx import Namespace, Resource
 from utils.decorators import token_required
-from utils.token import decode_token
+from utils.token import get_token_claims
 
 # Define the namespace for API documentation
 api = Namespace(
@@ -66,7 +66,7 @@ class NivatCompleted(Resource):
 
         try:
             # Placeholder for future DB check on static puzzles
-            # user_id = decode_token(request.headers["Authorization"])['user_id']
+            # user_id = get_token_claims()['user_id']
             abort(404)
         except Exception:
             return {'message': "Nivat completion not found"}, 404
@@ -100,7 +100,7 @@ class NivatGridCompleted(Resource):
             reward_earned = rewards_map.get(int(level), 4)
 
             # --- User Identification & Database Update ---
-            user_id = decode_token(request.headers["Authorization"])['user_id']
+            user_id = get_token_claims()['user_id']
 
             # Update user balance in the core database
             # This method returns the updated user object
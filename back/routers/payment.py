@@ -1,4 +1,5 @@
 import os
+import re
 
 import database.models as models
 import stripe
@@ -6,54 +7,51 @@ from core.models import create_checkout_session_model
 from database.database import DatabaseManager
 from utils.common import load_environment
 from flask import abort, redirect, request
-from flask_caching import Cache
 from flask_restx import Namespace, Resource, fields
 from utils.decorators import token_required
-from utils.token import decode_token
+from utils.stripe_catalog import StripeFetchError, price_key, stripe_catalog
+from utils.token import get_token_claims
 
 api = Namespace('payment', description='Payment related operations')
 
-stripe_cache = Cache(config={'CACHE_TYPE': 'simple'})
-
 db_manager = DatabaseManager()
 
 env_state = load_environment()
 
 stripe.api_key = os.getenv('STRIPE_PRIVATE_KEY')
+# local Stripe stand-in (utils/stripe_stub.py) for the tests and the benchmarks
+if os.getenv('STRIPE_API_BASE'):
+    stripe.api_base = os.getenv('STRIPE_API_BASE')
 front_url = os.getenv('FRONT_URL')
 api_url = os.getenv('API_URL')
 
 
 @api.route('/product')
 class Products(Resource):
-    @stripe_cache.cached(timeout=60 * 60 * 24)  # 1 day
     def get(self):
         '''List all products'''
-        return list(stripe.Product.list(limit=100).auto_paging_iter())
+        return stripe_catalog.products()
 
 
 @api.route('/product/<string:product_id>')
 class Product(Resource):
-    @stripe_cache.cached(timeout=60 * 60 * 24)  # 1 day
     def get(self, product_id):
         '''Get a product'''
-        return stripe.Product.retrieve(product_id)
+        return stripe_catalog.product(product_id)
 
 
 @api.route('/product/<string:product_id>/prices')
 class ProductPrices(Resource):
-    @stripe_cache.cached(timeout=60 * 60 * 24)  # 1 day
     def get(self, product_id):
         '''List all prices for a product'''
-        return list(stripe.Price.list(product=product_id, limit=100).auto_paging_iter())
+        return stripe_catalog.product_prices(product_id)
 
 
 @api.route('/prices')
 class Prices(Resource):
-    @stripe_cache.cached(timeout=60 * 60 * 24)  # 1 day
     def get(self):
         '''List all prices'''
-        return list(stripe.Price.list(limit=100).auto_paging_iter())
+        return stripe_catalog.prices()
 
 
 @api.route('/create-checkout-session', methods=['POST'])
@@ -63,7 +61,7 @@ class CreateCheckoutSession(Resource):
     @token_required
     def post(self):
         '''Create a checkout session'''
-        user_id = decode_token(request.headers["Authorization"])['user_id']
+        user_id = get_token_claims()['user_id']
         user = db_manager.ReadUserById(user_id)
         if user is None:
             return {'message': 'User not found'}, 404
@@ -81,20 +79,29 @@ class CreateCheckoutSession(Resource):
         else:
             customer = stripe.Customer.retrieve(user.stripe_id)
 
+        line_items, current_price = None, None
         try:
             line_items = request.json.get('line_items')
             total_mojette = 0
+            bought = []
+            # prix du catalogue, les manquants sont récupérés en parallèle
+            prices = stripe_catalog.expanded_prices(
+                item['price'] for item in line_items)
             for item in line_items:
-                item_stripe = stripe.Price.retrieve(
-                    item['price'], expand=['product'])
+                current_price = item['price']
+                item_stripe = stripe.Price.construct_from(
+                    prices[item['price']], stripe.api_key)
                 item['quantity'] = item['quantity'] * \
                     item_stripe.transform_quantity.divide_by
+                bought.append((item['quantity'], item_stripe.metadata,
+                               item_stripe.product.metadata))
                 if 'type' in item_stripe.product.metadata\
                         and item_stripe.product.metadata['type'] == 'token'\
                         and 'promo_mojette' in item_stripe.metadata\
                         and item_stripe.metadata['promo_mojette'] == 'true':
                     total_mojette += int(
                         item_stripe.metadata['promo_mojette_amount'])
+            current_price = None
             if (total_mojette > user.mojettes):
                 return {'message': 'Not enough mojette'}, 400
 
@@ -120,35 +127,76 @@ class CreateCheckoutSession(Resource):
                     },
                 },
             )
+            # crédité au paiement par le webhook, sans rappeler Stripe
+            token_coin, mojettes = bought_amounts(bought)
             session = models.CheckoutSession(
                 session_id=checkout_session.id,
                 user_id=user_id,
                 status='pending',
+                token_coin=token_coin,
+                mojettes=mojettes,
             )
             db_manager.createCheckoutSession(session)
+        except StripeFetchError as e:
+            invalidate_failed_price(e.error, line_items, e.object_id)
+            return str(e)
         except Exception as e:
-            stripe_cache.clear()
+            invalidate_failed_price(e, line_items, current_price)
             return str(e)
         return {'id': checkout_session.id}
 
 
-def handle_bought_item(session_id, user_id, item: stripe.LineItem):
-    quantity = 1
-    if item.quantity is not None:
-        quantity = quantity * item.quantity
-    product = stripe.Product.retrieve(item.price.product)
-    if 'type' in product.metadata and product.metadata['type'] == 'token':
-        if 'promo_mojette' in item.price.metadata\
-                and item.price.metadata['promo_mojette'] == 'true'\
-                and 'promo_mojette_amount' in item.price.metadata:
-            promo_mojette_amount = int(
-                item.price.metadata['promo_mojette_amount'])
-            db_manager.payTokenPromoMojette(
-                session_id, user_id, quantity, promo_mojette_amount)
-        else:
-            db_manager.payToken(session_id, user_id, quantity)
-    elif 'type' in product.metadata and product.metadata['type'] == 'mojette':
-        db_manager.payMojette(session_id, user_id, quantity)
+def invalidate_failed_price(error, line_items, current_price):
+    '''Drop the cached price (and its product prices) a checkout failed on, the rest of the catalog is kept'''
+    price_id = current_price
+    # errors of stripe.checkout.Session.create name the line: param='line_items[2][price]'
+    match = re.match(r'line_items\[(\d+)\]', getattr(error, 'param', None) or '')
+    if price_id is None and match and line_items and int(match.group(1)) < len(line_items):
+        price_id = line_items[int(match.group(1))].get('price')
+    if price_id is None:
+        return
+    try:
+        cached = stripe_catalog.get_cached(price_key(price_id))
+        stripe_catalog.invalidate_price(price_id, cached['product'] if cached else None)
+    except Exception as e:
+        print(f"Error invalidating the Stripe catalog: {e!r}")
+
+
+def bought_amounts(lines):
+    '''(token coins, mojettes) credited for the (quantity, price metadata, product metadata) lines of a session'''
+    token_coin, mojettes = 0, 0
+    for quantity, price_metadata, product_metadata in lines:
+        if quantity is None:
+            quantity = 1
+        if 'type' in product_metadata and product_metadata['type'] == 'token':
+            token_coin += quantity
+            if 'promo_mojette' in price_metadata\
+                    and price_metadata['promo_mojette'] == 'true'\
+                    and 'promo_mojette_amount' in price_metadata:
+                mojettes -= int(price_metadata['promo_mojette_amount'])
+        elif 'type' in product_metadata and product_metadata['type'] == 'mojette':
+            mojettes += quantity
+    return token_coin, mojettes
+
+
+def fulfill_session(session, checkout_session) -> bool:
+    '''
+    Credit a paid checkout session (`checkout_session` from Stripe, `session` the local one).
+    The amounts are stored with the session at its creation, the line items are only
+    fetched for the sessions created before.
+    '''
+    if checkout_session.payment_status == 'unpaid' or checkout_session.consent.terms_of_service != 'accepted':
+        return False
+    token_coin, mojettes = session.token_coin, session.mojettes
+    if token_coin is None or mojettes is None:
+        items_bought = list(stripe.checkout.Session.list_line_items(
+            session.session_id, limit=100).auto_paging_iter())
+        products = stripe_catalog.products_by_id(
+            item.price.product for item in items_bought)
+        token_coin, mojettes = bought_amounts(
+            (item.quantity, item.price.metadata, products[item.price.product]['metadata'])
+            for item in items_bought)
+    return db_manager.fulfillCheckoutSession(session.session_id, session.user_id, token_coin, mojettes)
 
 
 @api.route('/success/<string:session_id>')
@@ -157,20 +205,62 @@ class Success(Resource):
         '''Successfull payment'''
         if session_id is None:
             return redirect(front_url)
-        checkout_session = stripe.checkout.Session.retrieve(session_id)
-        if checkout_session.payment_status == 'unpaid' or checkout_session.consent.terms_of_service != 'accepted':
-            return redirect(front_url)
         session = db_manager.readCheckoutSession(session_id)
-        if session is None or session.status != 'pending':
+        if session is None or session.status == 'cancelled':
             return redirect(front_url)
-        user_id = session.user_id
-        items_bought = list(stripe.checkout.Session.list_line_items(
-            session_id, limit=100).auto_paging_iter())
-        for item in items_bought:
-            handle_bought_item(session_id, user_id, item)
+        # en général le webhook est déjà passé : état local uniquement
+        if session.status == 'confirmed':
+            return redirect(front_url + "?resetCart=true")
+        # sinon (webhook en retard ou non configuré) la session est vérifiée auprès de Stripe
+        checkout_session = stripe.checkout.Session.retrieve(session_id)
+        if not fulfill_session(session, checkout_session):
+            # le webhook a pu confirmer la session entre-temps
+            db_manager.db.session.refresh(session)
+            if session.status != 'confirmed':
+                return redirect(front_url)
         return redirect(front_url + "?resetCart=true")
 
 
+# Events of the catalog: the cached product or price is fetched again on its next read
+CATALOG_EVENTS = ('product.created', 'product.updated', 'product.deleted',
+                  'price.created', 'price.updated', 'price.deleted')
+# Events of a paid session (asynchronous payment methods are paid after 'completed')
+CHECKOUT_PAID_EVENTS = ('checkout.session.completed', 'checkout.session.async_payment_succeeded')
+
+
+@api.route('/webhook', methods=['POST'])
+class Webhook(Resource):
+    @api.response(400, 'Invalid payload or signature')
+    def post(self):
+        '''Stripe webhook (events signed with STRIPE_WEBHOOK_SECRET)'''
+        webhook_secret = os.getenv('STRIPE_WEBHOOK_SECRET')
+        if not webhook_secret:
+            return {'message': 'Webhook not configured'}, 400
+        try:
+            event = stripe.Webhook.construct_event(
+                request.get_data(), request.headers.get('Stripe-Signature', ''), webhook_secret)
+        except ValueError:
+            return {'message': 'Invalid payload'}, 400
+        except stripe.error.SignatureVerificationError:
+            return {'message': 'Invalid signature'}, 400
+
+        if not db_manager.recordStripeEvent(event.id, event.type):
+            return {'received': True, 'duplicate': True}
+        obj = event.data.object
+        if event.type in CHECKOUT_PAID_EVENTS:
+            # tout est dans l'événement : pas d'appel à Stripe
+            session = db_manager.readCheckoutSession(obj.id)
+            if session is not None and session.status == 'pending':
+                fulfill_session(session, obj)
+        elif event.type in CATALOG_EVENTS:
+            if obj.object == 'product':
+                stripe_catalog.invalidate_product(obj.id)
+            else:
+                stripe_catalog.invalidate_price(obj.id, obj.product)
+        db_manager.markStripeEventProcessed(event.id)
+        return {'received': True}
+
+
 @api.route('/cancel/<string:session_id>')
 class Cancel(Resource):
     def get(self, session_id):
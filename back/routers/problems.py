@@ -7,11 +7,15 @@ from core.models import (completion_response_model, problem_completed_model,
                          problem_model, problem_verification_model,
                          simple_problem_model_with_region)
 from database.database import DatabaseManager
-from flask import abort, jsonify, request
+from flask import Response, abort, request
 from flask_restx import Namespace, Resource, fields
 from utils.common import get_array_width
+from utils.compression import accepts_gzip, compression_stats
 from utils.decorators import token_required
-from utils.token import decode_token
+from utils.response_cache import PROBLEMS, cached_response, response_cache
+from utils.svg_geometry import (DEFAULT_DETAIL_LEVEL, DETAIL_LEVELS,
+                                precomputed_geometry)
+from utils.token import get_token_claims
 from utils.validation import (add_problem_to_completed_list,
                               verify_region_solution, verify_standard_solution)
 
@@ -21,30 +25,50 @@ api = Namespace('problems', description='Problems related operations')
 db_manager = DatabaseManager()
 
 
+def geometry_response(get_body):
+    """
+    Réponse précalculée d'une route de la carte, au niveau de détail demandé (?detail=),
+    compressée si le client accepte gzip, 304 si le client a déjà cette version.
+    """
+    level = request.args.get('detail', DEFAULT_DETAIL_LEVEL)
+    if level not in DETAIL_LEVELS:
+        abort(400, f"detail must be one of: {', '.join(DETAIL_LEVELS)}")
+    try:
+        geometry = precomputed_geometry.ensure_built(response_cache.versions((PROBLEMS,))[0])
+        body = get_body(geometry, level)
+    except Exception as e:
+        # Catch all other exceptions and return a server error
+        abort(500, f"An error occurred: {str(e)}")
+
+    gzip_accepted = accepts_gzip()
+    etag = body.etag + '-gzip' if gzip_accepted else body.etag
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    elif gzip_accepted:
+        compression_stats.record(request.endpoint, len(body.body), len(body.gzip), from_cache=True)
+        response = Response(body.gzip, mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = Response(body.body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
 @api.route('')
 class ProblemsList(Resource):
+    @token_required
+    @cached_response(PROBLEMS)
     @api.marshal_list_with(simple_problem_model_with_region)
     @api.response(401, 'User token invalid')
     @api.response(500, 'Internal Server Error')
-    @token_required
     def get(self):
         '''List all problems'''
         try:
-            data = models.Serializer.serialize_list_row(
-                db_manager.ReadProblems())
-            for problem in data:
-                problem['question'] = problem['question']
-                problem['values_list'] = problem['values_list']
-                problem['variables'] = problem['variables']
-                problem['solution'] = problem['solution']
-                nbUnknowns = get_array_width(problem['solution'])
-                if (not nbUnknowns):
-                    del problem['solution']
-                problem['unknowns'] = nbUnknowns
-                problem['nb_help'] = sum(
-                    [problem['help_1'] != None, problem['help_2'] != None, problem['help_3'] != None])
-
-            if problem is None:
+            # only the fields of simple_problem_model_with_region are selected
+            data = db_manager.ReadProblemsProjection()
+            if not data:
                 abort(404)
         except Exception as e:
             print(e)
@@ -113,18 +137,11 @@ class Regions(Resource):
     @api.response(401, 'User token invalid')
     @api.response(403, 'Regions not found')
     @api.response(500, 'Internal Server Error')
+    @api.doc(params={"detail": f"Level of detail of the paths: {', '.join(DETAIL_LEVELS)} (default {DEFAULT_DETAIL_LEVEL})"})
     @token_required
     def get(self):
         """Retrieves all regions"""
-        try:
-            data = models.Region.serialize_list(db_manager.ReadRegions())
-
-            if data is None:
-                return "Cannot get regions", 403
-            return jsonify(data)
-        except Exception as e:
-            # Catch all other exceptions and return a server error
-            abort(500, f"An error occurred: {str(e)}")
+        return geometry_response(lambda geometry, level: geometry.regions(level))
 
 
 @api.route('/regions/<string:region_code>/departments')
@@ -134,23 +151,23 @@ class Departments(Resource):
     @api.response(401, 'User token invalid')
     @api.response(403, 'Regions not found')
     @api.response(500, 'Internal Server Error')
+    @api.doc(params={"detail": f"Level of detail of the paths: {', '.join(DETAIL_LEVELS)} (default {DEFAULT_DETAIL_LEVEL})"})
     @token_required
     def get(self, region_code):
         """Retrieves all department for a region"""
+        return geometry_response(lambda geometry, level: geometry.departments(region_code, level))
 
-        try:
-            data = models.Department.serialize_list(
-                db_manager.ReadDepartmentsByRegionCode(region_code))
-            if data is None:
-                return "Cannot get departments", 403
-            for dpt in data:
-                if type(dpt['zones']) is bytes:  # BDD en prod qui renvoie des bytes
-                    dpt['zones'] = dpt['zones'].decode('utf-8')
 
-            return jsonify(data)
-        except Exception as e:
-            # Catch all other exceptions and return a server error
-            abort(500, f"An error occurred: {str(e)}")
+@api.route('/cache')
+class ResponseCacheStats(Resource):
+    @api.response(401, 'User is not admin')
+    @token_required
+    def get(self):
+        '''Retrieve the response cache counters and the gzip ratio / CPU time by route (admin only)'''
+        user_id = get_token_claims()['user_id']
+        if not db_manager.UserIsAdmin(user_id):
+            return {'message': "User is not admin"}, 401
+        return {'responses': response_cache.stats(), 'compression': compression_stats.report()}, 200
 
 
 @api.route('/completed')
@@ -161,8 +178,8 @@ class ProblemCompletedByUser(Resource):
     @token_required
     def get(self):
         '''Retrieve user completed problems'''
-        is_user_admin = decode_token(request.headers["Authorization"])['admin']
-        user_id = decode_token(request.headers["Authorization"])['user_id']
+        is_user_admin = get_token_claims()['admin']
+        user_id = get_token_claims()['user_id']
         try:
             if is_user_admin:
                 data = models.ProblemCompleted.serialize_list(
@@ -189,7 +206,7 @@ class ProblemHint(Resource):
     def get(self, problem_id, hint_nb):
         '''Retrieve one problem hint by '''
 
-        user_id = decode_token(request.headers["Authorization"])['user_id']
+        user_id = get_token_claims()['user_id']
         try:
             data = models.Serializer.serialize_row(
                 db_manager.ReadProblemById(problem_id))
@@ -221,7 +238,7 @@ class ProblemCompleted(Resource):
     def get(self, problem_id):
         '''Retrieve if user has completed problem'''
 
-        user_id = decode_token(request.headers["Authorization"])['user_id']
+        user_id = get_token_claims()['user_id']
         try:
             data = models.Serializer.serialize_row(
                 db_manager.ReadProblemCompletedByPrimaryKey(
@@ -253,7 +270,7 @@ class VerifySolution(Resource):
         r = request.json
         helps_used = r["helps_used"]
 
-        user_id = decode_token(request.headers["Authorization"])['user_id']
+        user_id = get_token_claims()['user_id']
         try:
             data = models.Serializer.serialize_row(
                 db_manager.ReadProblemById(problem_id))
@@ -7,7 +7,7 @@ from core.models import (carre_completed_model, profile_info,
                          user_confirmation, user_edit_model, user_model)
 from flask import abort, jsonify, request
 from flask_restx import Namespace, Resource
-from utils.token import decode_token
+from utils.token import get_token_claims
 
 api = Namespace('users', description='Users related operations')
 
@@ -16,28 +16,62 @@ from database.database import DatabaseManager
 db_manager = DatabaseManager()
 
 from utils.decorators import token_required
+from utils.export_stream import export_response
 from utils.mail import sendConfirmationTemplate
+from utils.pagination import (DEFAULT_PAGE_LIMIT, NEXT_CURSOR_HEADER,
+                              next_cursor_headers, request_cursor,
+                              request_limit)
+
+# same fields as the admin list of users
+USER_EXPORT_COLUMNS = tuple(user_model)
 
 
 @api.route('')
 class UsersList(Resource):
     @api.marshal_list_with(user_model)
     @api.response(401, 'User token invalid')
+    @api.response(400, 'Invalid limit or cursor')
     @api.response(500, 'Internal Server Error')
+    @api.doc(params={"limit": "Page size, all users when neither limit nor cursor is given",
+                     "cursor": f"Cursor of the next page, returned in the {NEXT_CURSOR_HEADER} header"})
     @token_required
     def get(self):
-        '''List all users'''
+        '''List all users (newest first), optionally paginated'''
+        limit = request_limit()
+        cursor = request_cursor(size=1)
+        headers = {}
         try:
-          user_id = decode_token(request.headers["Authorization"])['user_id']
+          user_id = get_token_claims()['user_id']
           if not db_manager.UserIsAdmin(user_id):
             abort(401, 'User not authorized to list users')
 
-          data = models.User.serialize_list(db_manager.ReadUsers())
+          if limit is None and cursor is None:
+            data = models.User.serialize_list(db_manager.ReadUsers())
+          else:
+            limit = limit or DEFAULT_PAGE_LIMIT
+            # one extra user tells if there is a next page
+            data = models.User.serialize_list(
+              db_manager.ReadUsersPage(cursor[0] if cursor else None, limit + 1))
+            headers = next_cursor_headers(data, limit, keys=('id',))
           if data is None:
             abort(404)
         except Exception as e:
           return {'message': "User not found"}, 404
-        return data, 200
+        return data, 200, headers
+
+@api.route('/export')
+class UsersExport(Resource):
+    @api.response(200, 'Users streamed as NDJSON or CSV')
+    @api.response(400, 'Invalid format')
+    @api.response(401, 'User is not admin')
+    @api.doc(params={"format": "ndjson (default) or csv"})
+    @token_required
+    def get(self):
+        '''Export all users, streamed with a server-side cursor (admin only)'''
+        user_id = get_token_claims()['user_id']
+        if not db_manager.UserIsAdmin(user_id):
+          return {'message': "User is not admin"}, 401
+        return export_response(db_manager.StreamUsers(USER_EXPORT_COLUMNS), USER_EXPORT_COLUMNS, 'users')
 
 @api.route('/<int:user_id>')
 class User(Resource):
@@ -66,7 +100,7 @@ class User(Resource):
     def put(self, user_id):
         '''Update one user by id'''
         r = request.json
-        token_user_id = decode_token(request.headers["Authorization"])['user_id']
+        token_user_id = get_token_claims()['user_id']
         if token_user_id != user_id:
           abort(401, 'User not authorized to update this user')
 
@@ -5,6 +5,7 @@ import json
 from database.database import DatabaseManager
 from utils.common import get_array_width
 from utils.decorators import token_required
+from utils.response_cache import WEEK_PROBLEMS, cached_response
 import database.models as models
 from flask import request
 from core.models import model_namespace, completion_response_model, problem_verification_model
@@ -12,10 +13,11 @@ from flask_restx import fields
 import os
 import werkzeug
 from flask import send_from_directory
-from utils.token import decode_token
+from utils.token import get_token_claims
 from utils.validation import verify_standard_solution
 from werkzeug.exceptions import HTTPException
-from utils.image_utils import upload_image_with_compression, create_lowered_image
+from utils.image_utils import (RENDITION_MISSING, image_processing_pool,
+                               upload_image_with_compression)
 
 UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), '..', 'static', 'weekproblems')
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
@@ -46,6 +48,7 @@ week_problem_input_model = model_namespace.model('WeekProblemInput', {
 # Va chercher tous les problemes de la semaine
 class WeekProblemsList(Resource):
     @token_required
+    @cached_response(WEEK_PROBLEMS)
     def get(self):
         '''List all week problems (raw, serialized)'''
         try:
@@ -200,6 +203,16 @@ class WeekProblemUploadImage(Resource):
         file: werkzeug.datastructures.FileStorage = request.files['image']
         return upload_image_with_compression(file, UPLOAD_FOLDER, '/week_problems/image')
 
+@api.route('/upload-image/status/<string:filename>')
+class WeekProblemUploadImageStatus(Resource):
+    @api.response(404, 'Image not found')
+    def get(self, filename):
+        '''Status of the lowered version of an uploaded image (pending, ready, failed, missing or none)'''
+        image_path = os.path.join(UPLOAD_FOLDER, filename)
+        if filename != werkzeug.utils.secure_filename(filename) or not os.path.isfile(image_path):
+            return {'message': 'Image not found'}, 404
+        return {'filename': filename, 'image_status': image_processing_pool.status(image_path)}, 200
+
 @api.route('/image/<string:filename>')
 class WeekProblemImage(Resource):
     def get(self, filename):
@@ -233,13 +246,11 @@ class WeekProblemImageLowered(Resource):
             original_file = next((f for f in files if f.lower().split('.')[0] == filename_lower.split('.')[0]), None)
 
             if original_file:
-                # Create lowered version from original
+                # Lowered version produced in the background, the original is served meanwhile
                 original_path = os.path.join(UPLOAD_FOLDER, original_file)
-                lowered_path = create_lowered_image(original_path)
-
-                if lowered_path and os.path.exists(lowered_path):
-                    lowered_filename = os.path.basename(lowered_path)
-                    return send_from_directory(UPLOAD_FOLDER, lowered_filename)
+                if image_processing_pool.status(original_path) == RENDITION_MISSING:
+                    image_processing_pool.submit(original_path)
+                return send_from_directory(UPLOAD_FOLDER, original_file)
 
             abort(404, "Image not found")
         except Exception as e:
@@ -261,7 +272,7 @@ class WeekProblemVerify(Resource):
     @token_required
     def post(self, problem_id):
         r = request.json
-        user_id = decode_token(request.headers.get('Authorization'))['user_id']
+        user_id = get_token_claims()['user_id']
         try:
             problem = db_manager.ReadWeekProblemById(problem_id)
             if not problem or problem.solution is None:
@@ -302,7 +313,7 @@ class WeekProblemCompleted(Resource):
     def get(self, problem_id):
         '''Check if current user has completed this week problem'''
         try:
-            user_id = decode_token(request.headers.get('Authorization'))['user_id']
+            user_id = get_token_claims()['user_id']
             completed = db_manager.ReadWeekProblemCompletedByPrimaryKey(user_id, problem_id)
             problem = db_manager.ReadWeekProblemById(problem_id)
             reward_mojette = int(getattr(problem, 'reward_mojette', 0) or 0) if problem else 0
@@ -329,7 +340,7 @@ class WeekProblemsCompletedList(Resource):
     def get(self):
         '''List week problem IDs completed by current user'''
         try:
-            user_id = decode_token(request.headers.get('Authorization'))['user_id']
+            user_id = get_token_claims()['user_id']
             ids = db_manager.ReadWeekProblemsCompletedByUser(user_id)
             return {'completed_ids': ids}, 200
         except Exception as e:
@@ -345,28 +356,11 @@ class WeekProblemCompletions(Resource):
     def get(self, problem_id):
         '''List all completions for a given week problem, with user info.'''
         try:
-            rows = db_manager.ReadWeekProblemCompletionsByProblem(problem_id)
-            # Build a minimal, JSON-serializable payload (avoid raw SQLAlchemy objects)
-            data = []
-            for row in rows:
-                try:
-                    completed = row[0]
-                    user = row[1]
-                except Exception:
-                    # Fallback for different row access styles
-                    completed = getattr(row, 'WeekProblemCompleted', None) or row[0]
-                    user = getattr(row, 'User', None) or row[1]
-
-                item = {
-                    'user_id': getattr(completed, 'user_id', None),
-                    'username': getattr(user, 'username', None),
-                    'completion_date': (
-                        completed.completion_date.isoformat()
-                        if getattr(completed, 'completion_date', None) else None
-                    ),
-                    'helps_used': getattr(completed, 'helps_used', 0),
-                }
-                data.append(item)
+            data = db_manager.ReadWeekProblemCompletionsByProblemProjection(problem_id)
+            # Build a JSON-serializable payload
+            for item in data:
+                if item['completion_date']:
+                    item['completion_date'] = item['completion_date'].isoformat()
 
             return data, 200
         except Exception as e:
@@ -5,6 +5,8 @@ import time
 
 import bcrypt
 from utils.common import load_environment
+from utils.mojette_grid_cache import touch_mojette_grids_version
+from utils.response_cache import CONTENTS, bump_content_version
 # SQLAlchemy imports
 from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker
@@ -523,6 +525,7 @@ def populate_mojette():
             print(e)
 
     session.commit()
+    touch_mojette_grids_version()
     print("Mojette data inserted successfully")
 
 
@@ -580,6 +583,8 @@ def update_mojette():
             print(e)
 
     session.commit()
+    # Les workers de l'API vident leur cache de grilles décodées
+    touch_mojette_grids_version()
     print("Mojette data updated successfully")
 
 
@@ -782,6 +787,8 @@ def populate_formations():
 def reset_tables():
     reset_table("carre_completed", "user_id")
     reset_table("mojette_completed", "user_id")
+    reset_table("mojette_leaderboard", "grid_id")
+    reset_table("daily_grid", "mojette_id")
     reset_table("problem_completed", "user_id")
     reset_table("carre", "id")
     reset_table("problem", "id")
@@ -898,5 +905,8 @@ if __name__ == "__main__":
     if args['draw']:
         draw_schema()
 
+    # Cached API responses (problems, week problems, formations) are rebuilt by the running server
+    bump_content_version(*CONTENTS)
+
     # Close the global session when finished
     session.close()
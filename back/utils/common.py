@@ -1,9 +1,21 @@
+import os
+import tempfile
+
+
 def get_array_width(arr):
     if type(arr) != list or not len(arr): return 0
     depth = lambda L: isinstance(L, list) and max(map(depth, L)) + 1
     return 1 if (depth(arr) == 1) else len(arr[0])
 
 
+def write_atomic(path: str, content: bytes) -> None:
+    """Write a file shared between processes: readers see the old or the new content, never a partial one"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
 
 
 needed_list = ["EMAIL_USER", "EMAIL_PASSWORD", "EMAIL_PORT", "EMAIL_SERVER", "EMAIL_DEFAULT_SENDER",
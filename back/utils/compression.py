@@ -0,0 +1,99 @@
+import gzip
+import threading
+import time
+from typing import Dict
+
+from flask import Flask, Response, request
+
+# Responses smaller than this are sent as is (gzip would barely save anything)
+COMPRESSION_MIN_SIZE = 1024
+COMPRESSION_LEVEL = 6
+COMPRESSIBLE_MIMETYPES = {
+    'application/json', 'application/x-ndjson', 'application/javascript',
+    'image/svg+xml', 'text/css', 'text/csv', 'text/html', 'text/plain',
+}
+
+
+class CompressionStats:
+    """Per route (endpoint) counters of the gzip compression"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes: Dict[str, Dict[str, float]] = {}
+
+    def record(self, route: str, size: int, compressed_size: int, cpu_time: float = 0.0,
+               from_cache: bool = False) -> None:
+        """
+        Args:
+            route: Endpoint of the request
+            size: Size of the uncompressed body
+            compressed_size: Size of the gzip body sent
+            cpu_time: CPU time spent compressing (0 when the compressed bytes were cached)
+            from_cache: The compressed bytes came from a cache
+        """
+        with self._lock:
+            stats = self._routes.setdefault(route or 'unknown', {
+                'responses': 0, 'from_cache': 0, 'bytes_in': 0, 'bytes_out': 0, 'cpu_time': 0.0})
+            stats['responses'] += 1
+            stats['from_cache'] += from_cache
+            stats['bytes_in'] += size
+            stats['bytes_out'] += compressed_size
+            stats['cpu_time'] += cpu_time
+
+    def report(self) -> Dict[str, Dict[str, float]]:
+        """Counters by route, with the compression ratio (compressed / original size)"""
+        with self._lock:
+            return {
+                route: dict(stats,
+                            ratio=round(stats['bytes_out'] / stats['bytes_in'], 4) if stats['bytes_in'] else None,
+                            cpu_time_ms=round(stats['cpu_time'] * 1000, 3))
+                for route, stats in self._routes.items()
+            }
+
+
+compression_stats = CompressionStats()
+
+
+def accepts_gzip() -> bool:
+    return request.accept_encodings['gzip'] > 0
+
+
+def gzip_compress(body: bytes) -> bytes:
+    """Compress a body, the CPU time is recorded for the current route"""
+    start = time.thread_time()
+    compressed = gzip.compress(body, compresslevel=COMPRESSION_LEVEL)
+    compression_stats.record(request.endpoint, len(body), len(compressed), time.thread_time() - start)
+    return compressed
+
+
+def init_compression(app: Flask) -> None:
+    """
+    Compress the responses with gzip when the client accepts it (Accept-Encoding).
+    Responses already encoded (served precompressed by a cache), streamed,
+    not textual or smaller than COMPRESSION_MIN_SIZE are left untouched.
+    """
+
+    @app.after_request
+    def compress_response(response: Response) -> Response:
+        if (response.status_code != 200
+                or request.method == 'HEAD'
+                or response.direct_passthrough
+                or response.is_streamed
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        if not accepts_gzip():
+            return response
+        body = response.get_data()
+        if len(body) < COMPRESSION_MIN_SIZE:
+            return response
+
+        response.set_data(gzip_compress(body))
+        response.headers['Content-Encoding'] = 'gzip'
+        # the gzip body is another representation: its strong ETag must differ
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag + '-gzip')
+        return response
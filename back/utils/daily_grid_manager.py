@@ -1,41 +1,59 @@
+import calendar
 import datetime
 import json
 import os
-import random
 from typing import Dict, Optional
 
-# Chemin vers le fichier de stockage des grilles du mois
+import click
+from flask.cli import AppGroup
+
+# Ancien fichier de stockage des grilles du mois, importé une fois dans la table daily_grid
 DAILY_GRIDS_FILE = os.path.join(os.path.dirname(
     os.path.dirname(__file__)), 'data', 'daily_grids.json')
-# Assurez-vous que le dossier data existe
-os.makedirs(os.path.dirname(DAILY_GRIDS_FILE), exist_ok=True)
 
 
 class DailyGridManager:
-    """Gestionnaire des grilles quotidiennes pour les Mojettes"""
+    """
+    Gestionnaire des grilles quotidiennes pour les Mojettes
+
+    Le planning est stocké dans la table daily_grid (jour -> grille) et généré
+    à l'avance par pregenerate() (commande `flask daily-grids pregenerate`,
+    à lancer chaque mois). Les requêtes des utilisateurs ne font que lire ce
+    planning et ne déclenchent jamais de génération.
+    """
 
     def __init__(self):
-        self.ensure_file_exists()
+        # (année, mois, grilles) du mois en cours, gardé en mémoire une fois complet
+        # (un jour programmé ne change plus)
+        self._cached_month: Optional[tuple] = None
 
-    def ensure_file_exists(self) -> None:
-        """S'assure que le fichier de stockage existe, le crée si nécessaire"""
-        if not os.path.exists(DAILY_GRIDS_FILE):
-            empty_data = {
-                "current_month": "",
-                "grids": {}
-            }
-            with open(DAILY_GRIDS_FILE, 'w') as f:
-                json.dump(empty_data, f)
-
-    def load_data(self) -> Dict:
-        """Charge les données du fichier"""
-        with open(DAILY_GRIDS_FILE, 'r') as f:
-            return json.load(f)
+    def get_month_grids(self) -> Dict[str, int]:
+        """
+        Récupère les grilles programmées pour le mois en cours
 
-    def save_data(self, data: Dict) -> None:
-        """Sauvegarde les données dans le fichier"""
-        with open(DAILY_GRIDS_FILE, 'w') as f:
-            json.dump(data, f)
+        Returns:
+            Dictionnaire jour du mois ("1" à "31") -> ID de la grille
+        """
+        today = datetime.date.today()
+        month = (today.year, today.month)
+
+        cached = self._cached_month
+        if cached is not None and cached[:2] == month:
+            return cached[2]
+
+        from database.database import DatabaseManager
+
+        first_day = today.replace(day=1)
+        last_day = today.replace(day=calendar.monthrange(today.year, today.month)[1])
+        grids = {
+            str(day.day): mojette_id for day, mojette_id
+            in DatabaseManager().ReadDailyGridsBetween(first_day, last_day).items()
+        }
+
+        # Un mois incomplet (pregenerate pas encore lancé) n'est pas gardé en mémoire
+        if len(grids) == last_day.day:
+            self._cached_month = (*month, grids)
+        return grids
 
     def get_daily_grid_id(self, day: Optional[int] = None) -> int:
         """
@@ -54,67 +72,92 @@ class DailyGridManager:
         if requested_day > today.day:
             return -1  # Jour futur non autorisé
 
-        current_day = day if day is not None else today.day
-        current_month = f"{today.year}-{today.month}"
-        # current_day = "7"  # Pour les tests
-        # current_month = "2025-05"  # Pour les tests
-
-        data = self.load_data()
-
-        # Vérifier si nous sommes dans un nouveau mois
-        if data["current_month"] != current_month:
-            # Générer de nouvelles grilles pour le mois
-            self._generate_monthly_grids(current_month)
-            data = self.load_data()  # Recharger les données
+        grids = self.get_month_grids()
 
         # Récupérer l'ID de la grille pour le jour demandé
-        day_str = str(current_day)
-        if day_str not in data["grids"]:
-            return -1  # Jour invalide
+        day_str = str(requested_day)
+        if day_str not in grids:
+            return -1  # Jour invalide ou pas encore programmé
 
-        return int(data["grids"][day_str])
+        return int(grids[day_str])
 
-    def _generate_monthly_grids(self, month: str) -> None:
+    def pregenerate(self, months: int = 2) -> Dict[datetime.date, int]:
         """
-        Génère les grilles pour un mois entier
+        Programme les grilles du mois en cours et des `months` mois suivants.
+        Seuls les jours sans grille sont remplis, les jours déjà programmés ne changent pas.
 
         Args:
-            month: Mois au format "YYYY-MM"
+            months: Nombre de mois à programmer après le mois en cours
+
+        Returns:
+            Les grilles programmées par cet appel, par jour
         """
         from database.database import DatabaseManager
 
         db_manager = DatabaseManager()
-
-        # Déterminer le nombre de jours dans le mois
-        year, month_num = map(int, month.split('-'))
-        last_day = 31  # Par défaut, maximum possible
-        if month_num in [4, 6, 9, 11]:
-            last_day = 30
-        elif month_num == 2:
-            # Vérifier si c'est une année bissextile
-            if year % 4 == 0 and (year % 100 != 0 or year % 400 == 0):
-                last_day = 29
-            else:
-                last_day = 28
-
-        # Récupérer des IDs de grilles aléatoires directement depuis la base de données
-        # Nous en demandons last_day pour couvrir tous les jours du mois
-        mojette_ids = db_manager.ReadRandomMojetteIds(last_day)
-
-        if not mojette_ids:
+        self.import_legacy_file()
+
+        first_day = datetime.date.today().replace(day=1)
+        year, month = divmod(first_day.month - 1 + months, 12)
+        last_month = datetime.date(first_day.year + year, month + 1, 1)
+        last_day = last_month.replace(
+            day=calendar.monthrange(last_month.year, last_month.month)[1])
+
+        scheduled = db_manager.ReadDailyGridsBetween(first_day, last_day)
+        missing_days = [first_day + datetime.timedelta(days=i)
+                        for i in range((last_day - first_day).days + 1)]
+        missing_days = [day for day in missing_days if day not in scheduled]
+        if not missing_days:
+            return {}
+
+        # Récupérer des IDs de grilles aléatoires directement depuis la base de données,
+        # une grille unique par jour
+        mojette_ids = db_manager.ReadRandomMojetteIds(len(missing_days))
+        if len(mojette_ids) < len(missing_days):
             raise ValueError(
-                "Aucune grille disponible pour générer les grilles du mois")
-
-        # Assigner les grilles pour chaque jour du mois
-        monthly_grids = {}
-        for day in range(1, last_day + 1):
-            # Chaque jour utilise une grille unique
-            grid_id = mojette_ids[day-1]
-            monthly_grids[str(day)] = grid_id
-
-        # Sauvegarder les nouvelles données
-        data = {
-            "current_month": month,
-            "grids": monthly_grids
-        }
-        self.save_data(data)
+                f"Pas assez de grilles disponibles pour programmer {len(missing_days)} jours "
+                f"({len(mojette_ids)} disponibles)")
+
+        schedule = dict(zip(missing_days, mojette_ids))
+        db_manager.CreateDailyGrids(schedule)
+        return schedule
+
+    def import_legacy_file(self) -> Dict[datetime.date, int]:
+        """
+        Importe dans la table daily_grid le mois stocké dans l'ancien fichier
+        data/daily_grids.json, pour les jours qui n'ont pas encore de grille.
+        """
+        from database.database import DatabaseManager
+
+        if not os.path.exists(DAILY_GRIDS_FILE):
+            return {}
+        with open(DAILY_GRIDS_FILE, 'r') as f:
+            data = json.load(f)
+        if not data.get("current_month"):
+            return {}
+
+        db_manager = DatabaseManager()
+        year, month = map(int, data["current_month"].split('-'))
+        legacy = {datetime.date(year, month, int(day)): int(mojette_id)
+                  for day, mojette_id in data["grids"].items()}
+        scheduled = db_manager.ReadDailyGridsBetween(min(legacy), max(legacy)) if legacy else {}
+        schedule = {day: mojette_id for day, mojette_id in legacy.items()
+                    if day not in scheduled}
+        if schedule:
+            db_manager.CreateDailyGrids(schedule)
+        return schedule
+
+
+daily_grids_cli = AppGroup('daily-grids', help='Planning des grilles Mojette du jour')
+
+
+@daily_grids_cli.command('pregenerate')
+@click.option('--months', default=2, show_default=True,
+              help='Nombre de mois à programmer après le mois en cours')
+def pregenerate_command(months):
+    """Programme à l'avance les grilles du jour (à lancer chaque mois, par exemple via cron)"""
+    schedule = DailyGridManager().pregenerate(months)
+    if schedule:
+        print(f"{len(schedule)} grilles programmées du {min(schedule)} au {max(schedule)}")
+    else:
+        print("Toutes les grilles sont déjà programmées")
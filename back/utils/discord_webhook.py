@@ -1,6 +1,138 @@
+import atexit
+import json
 import os
+import queue
+import threading
+import time
+import urllib.error
+import urllib.request
 from datetime import datetime
-from discord_webhook import DiscordWebhook as DiscordWebhookLib, DiscordEmbed
+from typing import Dict, List, Optional
+
+import click
+from flask.cli import AppGroup
+
+# Discord accepts at most 10 embeds per message
+MAX_EMBEDS_PER_MESSAGE = 10
+
+
+class WebhookDispatcher:
+    """
+    Outbound queue of Discord notifications: requests only enqueue the embed, a
+    background thread posts it to the webhook. Embeds queued within `coalesce_delay`
+    seconds of each other are sent together (up to 10 per message), so a burst of
+    purchases costs one call instead of one per purchase.
+
+    Each call has a `timeout`. A rate-limited call (429) is retried once if Discord
+    asks to wait less than `max_retry_after` seconds, any other failure is logged and
+    the embeds are dropped. When `max_size` embeds are already waiting, new ones are
+    dropped too: a notification is never worth slowing down a purchase.
+    """
+
+    def __init__(self, url: Optional[str], max_size: int = 500, coalesce_delay: float = 0.5,
+                 timeout: float = 5.0, max_retry_after: float = 5.0):
+        self.url = url
+        self.coalesce_delay = coalesce_delay
+        self.timeout = timeout
+        self.max_retry_after = max_retry_after
+        self._queue: "queue.Queue[dict]" = queue.Queue(maxsize=max_size)
+        self._thread: Optional[threading.Thread] = None
+        self._thread_lock = threading.Lock()
+        self._atexit_registered = False
+        self.sent = 0
+        self.messages = 0
+        self.failed = 0
+        self.dropped = 0
+
+    def _ensure_worker(self) -> None:
+        # started on the first notification of each process (after the fork of the workers)
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='discord-webhook', daemon=True)
+                self._thread.start()
+                if not self._atexit_registered:
+                    # the thread is a daemon: give it a chance to send what is queued
+                    atexit.register(self.flush, self.timeout + self.coalesce_delay)
+                    self._atexit_registered = True
+
+    def enqueue(self, embed: dict) -> bool:
+        """Queue an embed, returns False if it was dropped because the queue is full"""
+        try:
+            self._queue.put_nowait(embed)
+        except queue.Full:
+            self.dropped += 1
+            print("Discord webhook queue full, notification dropped")
+            return False
+        self._ensure_worker()
+        return True
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every queued embed was sent (or dropped), returns False on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def stats(self) -> Dict[str, int]:
+        return {'queued': self._queue.qsize(), 'sent': self.sent, 'messages': self.messages,
+                'failed': self.failed, 'dropped': self.dropped}
+
+    def _post(self, embeds: List[dict]) -> None:
+        """One call to the webhook, raises urllib.error.HTTPError on an error status"""
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps({'embeds': embeds}).encode('utf-8'),
+            headers={'Content-Type': 'application/json', 'User-Agent': 'PPMOJ-webhook'},
+            method='POST',
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+    def _send(self, embeds: List[dict]) -> None:
+        for attempt in range(2):
+            try:
+                self._post(embeds)
+                self.sent += len(embeds)
+                self.messages += 1
+                return
+            except urllib.error.HTTPError as e:
+                retry_after = None
+                if e.code == 429:
+                    try:
+                        retry_after = float(json.loads(e.read() or b'{}').get('retry_after'))
+                    except (TypeError, ValueError):
+                        retry_after = None
+                if attempt == 0 and retry_after is not None and retry_after <= self.max_retry_after:
+                    time.sleep(retry_after)
+                    continue
+                error = f"HTTP {e.code}"
+            except Exception as e:
+                error = repr(e)
+            self.failed += len(embeds)
+            print(f"Error sending Discord webhook notification ({len(embeds)} embed(s) dropped): {error}")
+            return
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.coalesce_delay
+            while len(batch) < MAX_EMBEDS_PER_MESSAGE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._send(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
 
 
 class DiscordWebhook:
@@ -11,6 +143,32 @@ class DiscordWebhook:
         self.webhook_url = os.getenv('DISCORD_WEBHOOK_URL')
         self.enabled = self.webhook_url is not None and self.webhook_url != ''
         self.env = os.getenv('ENV')
+        self.dispatcher = WebhookDispatcher(self.webhook_url)
+
+    def build_purchase_embed(
+        self,
+        username: str,
+        formation_name: str,
+        purchase_type: str,
+        amount: int,
+        user_id: int,
+    ) -> dict:
+        """Embed of a purchase notification, in the format of the Discord API"""
+        # Determine the color based on the env (green for prod, red for dev)
+        color = "57F287" if self.env == 'prod' else "ED4245"
+
+        return {
+            'title': "Nouvel achat" if self.env == 'prod' else "(DEV) Nouvel achat",
+            'description': f"Un utilisateur a acheté une formation : **{formation_name}**",
+            'color': int(color, 16),
+            'fields': [
+                {'name': "User", 'value': f"{username} (ID: {user_id})", 'inline': True},
+                {'name': "Formation", 'value': formation_name, 'inline': True},
+                {'name': "Methode", 'value': "Token Coins" if purchase_type == 'token_coin' else "Mojettes", 'inline': True},
+                {'name': "Prix", 'value': str(amount), 'inline': True},
+                {'name': "Date", 'value': datetime.now().strftime("%Y-%m-%d %H:%M:%S"), 'inline': True},
+            ],
+        }
 
     def send_purchase_notification(
         self,
@@ -21,7 +179,7 @@ class DiscordWebhook:
         user_id: int,
     ) -> bool:
         """
-        Send a purchase notification to Discord.
+        Queue a purchase notification for Discord, sent in the background.
 
         Args:
             username: The username of the buyer
@@ -30,63 +188,33 @@ class DiscordWebhook:
             amount: Amount paid/spent (mojettes or token coins)
             user_id: ID of the user
         Returns:
-            True if notification was sent successfully, False otherwise
+            True if notification was queued, False otherwise
         """
         if not self.enabled:
             return False
 
         try:
-            # Determine the color based on the env (green for prod, red for dev)
-            color = "57F287" if self.env == 'prod' else "ED4245"
-
-            # Create the webhook
-            webhook = DiscordWebhookLib(url=self.webhook_url, rate_limit={"max_retries": 1})
-
-            # Create the embed
-            embed = DiscordEmbed(
-                title="Nouvel achat" if self.env == 'prod' else "(DEV) Nouvel achat",
-                description=f"Un utilisateur a acheté une formation : **{formation_name}**",
-                color=color
-            )
-
-            embed.add_embed_field(
-                name="User",
-                value=f"{username} (ID: {user_id})",
-                inline=True
-            )
-
-            embed.add_embed_field(
-                name="Formation",
-                value=formation_name,
-                inline=True
-            )
-
-            embed.add_embed_field(
-                name="Methode",
-                value="Token Coins" if purchase_type == 'token_coin' else "Mojettes",
-                inline=True
-            )
-
-            embed.add_embed_field(
-                name="Prix",
-                value=str(amount),
-                inline=True
-            )
-
-            embed.add_embed_field(
-                name="Date",
-                value=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                inline=True
-            )
-
-            webhook.add_embed(embed)
-            response = webhook.execute()
-
-            return response is not None
-
+            embed = self.build_purchase_embed(username, formation_name, purchase_type, amount, user_id)
+            return self.dispatcher.enqueue(embed)
         except Exception as e:
             print(f"Error sending Discord webhook notification: {str(e)}")
             return False
 
 
 discord_webhook = DiscordWebhook()
+
+discord_cli = AppGroup('discord', help='Notifications Discord')
+
+
+@discord_cli.command('stub-server')
+@click.option('--port', default=8099, show_default=True, help='Port du faux webhook')
+def stub_server_command(port):
+    """Faux webhook Discord local qui affiche les notifications reçues"""
+    from utils.webhook_stub import WebhookStubServer
+
+    stub = WebhookStubServer(port=port, verbose=True)
+    print(f"Listening on {stub.url}")
+    try:
+        stub.serve_forever()
+    except KeyboardInterrupt:
+        stub.stop()
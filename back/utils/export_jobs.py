@@ -0,0 +1,187 @@
+import json
+import os
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Optional
+
+from flask import Flask, current_app
+from flask.cli import AppGroup
+from utils.common import write_atomic
+
+# Status files (<job id>.json) and archives (<job id>.zip / .json) of the RGPD exports,
+# shared by all the workers of the app
+EXPORT_JOBS_DIR = os.path.join(os.path.dirname(
+    os.path.dirname(__file__)), 'data', 'rgpd_exports')
+
+# Seconds an archive can be downloaded after it is ready
+EXPORT_JOB_TTL = 24 * 3600
+# A pending or running job whose status was not updated for this long was lost
+# (process restarted) and is reported as failed
+EXPORT_JOB_STALE_AFTER = 15 * 60
+
+EXPORT_FORMATS = ('json', 'zip')
+
+PENDING = 'pending'
+RUNNING = 'running'
+COMPLETED = 'completed'
+FAILED = 'failed'
+
+
+class ExportJobManager:
+    """
+    RGPD data exports built in the background: the request only enqueues a job,
+    a thread of the pool writes the archive to `directory` and keeps its status
+    file up to date, the archive is then downloaded from disk until it expires.
+    """
+
+    def __init__(self, directory: str = EXPORT_JOBS_DIR, max_workers: int = 2, ttl: float = EXPORT_JOB_TTL):
+        self.directory = directory
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='rgpd-export')
+
+    def _status_path(self, job_id: str) -> str:
+        return os.path.join(self.directory, f'{job_id}.json')
+
+    def artifact_path(self, job: dict) -> str:
+        return os.path.join(self.directory, f"{job['job_id']}.export.{job['format']}")
+
+    def _save(self, job: dict) -> None:
+        job['updated_at'] = time.time()
+        write_atomic(self._status_path(job['job_id']), json.dumps(job).encode('utf-8'))
+
+    def submit(self, user_id: int, export_format: str = 'zip') -> dict:
+        """Enqueue the export of the user data, returns the job status"""
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown export format: {export_format}")
+        os.makedirs(self.directory, exist_ok=True)
+        self.cleanup()
+        job = {
+            'job_id': uuid.uuid4().hex,
+            'user_id': user_id,
+            'format': export_format,
+            'status': PENDING,
+            'progress': 0.0,
+            'created_at': time.time(),
+            'expires_at': None,
+            'size': None,
+            'error': None,
+        }
+        self._save(job)
+        self._executor.submit(self._run, current_app._get_current_object(), dict(job))
+        return job
+
+    def get(self, job_id: str) -> Optional[dict]:
+        """Status of the job, None if it does not exist (or was cleaned up)"""
+        # job ids are uuid4 hex, anything else could be a path
+        if not job_id.isalnum():
+            return None
+        try:
+            with open(self._status_path(job_id)) as f:
+                job = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if job['status'] in (PENDING, RUNNING) and time.time() - job['updated_at'] > EXPORT_JOB_STALE_AFTER:
+            job.update(status=FAILED, error='Export interrupted')
+        return job
+
+    def _run(self, app: Flask, job: dict) -> None:
+        from database.database import DatabaseManager
+        from database.models import UserDataRequest
+        from utils.export_stream import chunked
+        from utils.rgpd import stream_user_export_json, stream_user_export_zip
+
+        def on_progress(done: int, total: int) -> None:
+            job['progress'] = round(done / total, 2)
+            self._save(job)
+
+        with app.app_context():
+            db_manager = DatabaseManager()
+            path = self.artifact_path(job)
+            job['status'] = RUNNING
+            self._save(job)
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            try:
+                if job['format'] == 'zip':
+                    chunks = stream_user_export_zip(job['user_id'], progress=on_progress)
+                else:
+                    chunks = chunked(stream_user_export_json(job['user_id'], progress=on_progress))
+                with os.fdopen(fd, 'wb') as f:
+                    for chunk in chunks:
+                        f.write(chunk)
+                os.replace(tmp_path, path)
+                job.update(status=COMPLETED, progress=1.0, size=os.path.getsize(path),
+                           expires_at=time.time() + self.ttl)
+                self._save(job)
+                db_manager.CreateUserDataRequest(
+                    UserDataRequest(user_id=job['user_id'], status='completed', extra=f"job {job['job_id']}")
+                )
+            except Exception as e:
+                print(f"Error exporting user data (job {job['job_id']}): {str(e)}")
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                job.update(status=FAILED, error=str(e), expires_at=time.time() + self.ttl)
+                self._save(job)
+                try:
+                    db_manager.db.session.rollback()
+                    db_manager.CreateUserDataRequest(
+                        UserDataRequest(user_id=job['user_id'], status='failed', extra=str(e))
+                    )
+                except Exception:
+                    pass
+
+    def cleanup(self) -> int:
+        """Remove the expired jobs (status and archive) and the lost ones, returns how many"""
+        removed = 0
+        now = time.time()
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return 0
+        for name in names:
+            if not name.endswith('.json') or not name[:-len('.json')].isalnum():
+                continue
+            job = self.get(name[:-len('.json')])
+            if job is None:
+                continue
+            expires_at = job['expires_at'] or job['updated_at'] + self.ttl
+            if expires_at > now:
+                continue
+            for path in (self.artifact_path(job), self._status_path(job['job_id'])):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            removed += 1
+        return removed
+
+    @staticmethod
+    def public_status(job: dict) -> dict:
+        """Status returned by the API (timestamps as ISO dates)"""
+        def iso(timestamp):
+            return datetime.fromtimestamp(timestamp).isoformat() if timestamp else None
+
+        return {
+            'job_id': job['job_id'],
+            'user_id': job['user_id'],
+            'format': job['format'],
+            'status': job['status'],
+            'progress': job['progress'],
+            'size': job['size'],
+            'error': job['error'],
+            'created_at': iso(job['created_at']),
+            'expires_at': iso(job['expires_at']),
+        }
+
+
+export_job_manager = ExportJobManager()
+
+rgpd_exports_cli = AppGroup('rgpd-exports', help='Exports RGPD préparés en arrière-plan')
+
+
+@rgpd_exports_cli.command('cleanup')
+def cleanup_command():
+    """Supprime les exports expirés (à lancer régulièrement, par exemple chaque heure)"""
+    print(f"{export_job_manager.cleanup()} export(s) supprimé(s)")
@@ -0,0 +1,85 @@
+import csv
+import io
+import json
+from datetime import date
+from typing import Iterable, Iterator, Sequence
+
+from flask import Response, abort, request, stream_with_context
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+DEFAULT_EXPORT_FORMAT = 'ndjson'
+
+# Lines are grouped in chunks of about this size before being sent
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+
+def _json_default(value):
+    if isinstance(value, date):  # date and datetime
+        return value.isoformat()
+    if isinstance(value, bytes):  # BDD en prod qui renvoie des bytes
+        return value.decode('utf-8')
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def ndjson_lines(rows: Iterable[tuple], columns: Sequence[str]) -> Iterator[str]:
+    """One JSON object per row and per line"""
+    for row in rows:
+        yield json.dumps(dict(zip(columns, row)), default=_json_default, ensure_ascii=False) + '\n'
+
+
+def csv_lines(rows: Iterable[tuple], columns: Sequence[str]) -> Iterator[str]:
+    """Header line then one line per row"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # header of an empty export
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def chunked(lines: Iterable[str], chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[bytes]:
+    """Group lines in chunks of about `chunk_size` bytes (one write per chunk instead of per line)"""
+    parts = []
+    size = 0
+    for line in lines:
+        data = line.encode('utf-8')
+        parts.append(data)
+        size += len(data)
+        if size >= chunk_size:
+            yield b''.join(parts)
+            parts = []
+            size = 0
+    if parts:
+        yield b''.join(parts)
+
+
+def request_export_format() -> str:
+    """Format of the ?format= query parameter (400 if it is not supported)"""
+    export_format = request.args.get('format', DEFAULT_EXPORT_FORMAT)
+    if export_format not in EXPORT_FORMATS:
+        abort(400, f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+    return export_format
+
+
+def export_response(rows: Iterable[tuple], columns: Sequence[str], filename: str) -> Response:
+    """
+    Streamed download of `rows` in the format of ?format= (NDJSON or CSV).
+
+    `rows` should be lazy (e.g. a generator over Query.yield_per): it is only iterated
+    while the response is sent, chunk by chunk, so the memory used does not depend on
+    the number of rows. The request context is kept for the whole iteration.
+    """
+    export_format = request_export_format()
+    lines = ndjson_lines if export_format == 'ndjson' else csv_lines
+    response = Response(stream_with_context(chunked(lines(rows, columns))),
+                        mimetype=EXPORT_FORMATS[export_format])
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}.{export_format}'
+    return response
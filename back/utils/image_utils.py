@@ -1,7 +1,54 @@
+import multiprocessing
 import os
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Optional
+
 from PIL import Image
 import werkzeug
 
+# Markers of the renditions being produced (<lowered file>.pending) or which failed
+# (<lowered file>.failed), in a subfolder of the upload folder shared by all the workers
+RENDITION_STATUS_DIR = '.renditions'
+# A rendition pending for longer than this was lost (process restarted)
+RENDITION_STALE_AFTER = 5 * 60
+
+# Status of the lowered version of an upload
+RENDITION_PENDING = 'pending'
+RENDITION_READY = 'ready'
+RENDITION_FAILED = 'failed'
+RENDITION_MISSING = 'missing'  # never produced (uploaded before the pool existed, or deleted)
+RENDITION_NONE = 'none'  # not an image Pillow can lower (SVG...)
+
+# Uploads served as is, without lowered version
+NOT_LOWERED_EXTENSIONS = ('.svg',)
+
+
+def lowered_image_path(image_path):
+    """Path of the lowered version of an image (always a JPEG for compression)"""
+    base, ext = os.path.splitext(image_path)
+    return f"{base}_lowered.jpg"
+
+
+def _status_dir(upload_folder):
+    status_dir = os.path.join(upload_folder, RENDITION_STATUS_DIR)
+    os.makedirs(status_dir, exist_ok=True)
+    return status_dir
+
+
+def _marker_path(image_path, status):
+    lowered_filename = os.path.basename(lowered_image_path(image_path))
+    return os.path.join(os.path.dirname(image_path), RENDITION_STATUS_DIR, f"{lowered_filename}.{status}")
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
 
 def create_lowered_image(image_path, quality=60, max_width=800):
     """
@@ -33,12 +80,18 @@ def create_lowered_image(image_path, quality=60, max_width=800):
             new_height = int(img.height * ratio)
             img = img.resize((max_width, new_height), Image.Resampling.LANCZOS)
 
-        # Create lowered filename
-        base, ext = os.path.splitext(image_path)
-        lowered_path = f"{base}_lowered.jpg"  # Always save as JPEG for compression
+        lowered_path = lowered_image_path(image_path)
 
-        # Save compressed version
-        img.save(lowered_path, 'JPEG', quality=quality, optimize=True)
+        # Save compressed version, written aside then renamed so it is never served half written
+        status_dir = _status_dir(os.path.dirname(lowered_path))
+        fd, tmp_path = tempfile.mkstemp(dir=status_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                img.save(f, 'JPEG', quality=quality, optimize=True)
+            os.replace(tmp_path, lowered_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
 
         return lowered_path
     except Exception as e:
@@ -46,9 +99,107 @@ def create_lowered_image(image_path, quality=60, max_width=800):
         return None
 
 
+def _cpu_count():
+    # CPUs this process may run on (container limits), not the CPUs of the host
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+class ImageProcessingPool:
+    """
+    Lowered versions of the uploads produced in the background by a pool of processes
+    (at most one per CPU): Pillow decoding, resizing and encoding hold the GIL, so they
+    run outside of the processes serving the requests, and the upload returns as soon
+    as the original is stored.
+
+    The status of a rendition is read from the upload folder (lowered file or
+    marker), so any worker can report it.
+
+    The children are started with 'spawn', which re-runs the main module of the
+    server in each of them: under `flask run` or gunicorn it is their launcher,
+    but under `python app.py` every child imports app.py again and rebuilds the
+    whole app (database, Stripe catalog warming...). Only `flask run` and
+    gunicorn are supported to serve the uploads.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None):
+        self.max_workers = max_workers or _cpu_count()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._executor_pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        # created on the first upload of each process (after the fork of the workers)
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers, mp_context=multiprocessing.get_context('spawn'))
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def _reset_executor(self, broken: ProcessPoolExecutor) -> None:
+        # another thread may already have replaced the broken pool
+        with self._lock:
+            if self._executor is broken:
+                self._executor = None
+        broken.shutdown(wait=False)
+
+    def submit(self, image_path, quality=60, max_width=800) -> str:
+        """Queue the lowered version of an image, returns its status"""
+        if image_path.lower().endswith(NOT_LOWERED_EXTENSIONS):
+            return RENDITION_NONE
+        pending_path = _marker_path(image_path, RENDITION_PENDING)
+        _status_dir(os.path.dirname(image_path))
+        _remove(_marker_path(image_path, RENDITION_FAILED))
+        with open(pending_path, 'w'):
+            pass
+        executor = None
+        try:
+            executor = self._get_executor()
+            future = executor.submit(create_lowered_image, image_path, quality, max_width)
+        except Exception as e:
+            # pool broken (a child was killed): a new one is created for the next upload
+            print(f"Error queuing lowered image: {e}")
+            if executor is not None:
+                self._reset_executor(executor)
+            self._finish(image_path, None)
+            return RENDITION_FAILED
+        future.add_done_callback(lambda done: self._finish(image_path, done))
+        return RENDITION_PENDING
+
+    @staticmethod
+    def _finish(image_path, future: Optional[Future]) -> None:
+        failed = future is None or future.exception() is not None or future.result() is None
+        if failed:
+            with open(_marker_path(image_path, RENDITION_FAILED), 'w'):
+                pass
+        _remove(_marker_path(image_path, RENDITION_PENDING))
+
+    @staticmethod
+    def status(image_path) -> str:
+        """Status of the lowered version of an image (RENDITION_PENDING, _READY, _FAILED, _MISSING or _NONE)"""
+        if image_path.lower().endswith(NOT_LOWERED_EXTENSIONS):
+            return RENDITION_NONE
+        if os.path.exists(lowered_image_path(image_path)):
+            return RENDITION_READY
+        if os.path.exists(_marker_path(image_path, RENDITION_FAILED)):
+            return RENDITION_FAILED
+        try:
+            pending_since = os.path.getmtime(_marker_path(image_path, RENDITION_PENDING))
+        except OSError:
+            return RENDITION_MISSING
+        return RENDITION_PENDING if time.time() - pending_since < RENDITION_STALE_AFTER else RENDITION_FAILED
+
+
+image_processing_pool = ImageProcessingPool()
+
+
 def upload_image_with_compression(file, upload_folder, url_prefix, quality=60, max_width=800):
     """
-    Upload an image file and create a compressed version.
+    Upload an image file and queue the creation of a compressed version,
+    produced in the background by image_processing_pool.
 
     Args:
         file: werkzeug.datastructures.FileStorage object from request.files
@@ -58,7 +209,8 @@ def upload_image_with_compression(file, upload_folder, url_prefix, quality=60, m
         max_width: Maximum width for the compressed version
 
     Returns:
-        Dictionary with 'image_url' and 'image_url_lowered' or error message
+        Dictionary with 'image_url', 'image_url_lowered' and 'image_status' (status of the
+        compressed version: 'pending', 'failed', or 'none' for an SVG) or error message
     """
     if not file or file.filename == '':
         return {'message': 'Empty filename.'}, 400
@@ -78,15 +230,15 @@ def upload_image_with_compression(file, upload_folder, url_prefix, quality=60, m
     # Save original file
     file.save(save_path)
 
-    # Create lowered version
-    lowered_path = create_lowered_image(save_path, quality=quality, max_width=max_width)
+    # Create lowered version in the background
+    status = image_processing_pool.submit(save_path, quality=quality, max_width=max_width)
 
     # Prepare response
     image_url = f"{url_prefix}/{filename}"
-    response = {'image_url': image_url}
+    response = {'image_url': image_url, 'image_status': status}
 
-    if lowered_path:
-        lowered_filename = os.path.basename(lowered_path)
+    if status != RENDITION_NONE:
+        lowered_filename = os.path.basename(lowered_image_path(save_path))
         response['image_url_lowered'] = f"{url_prefix}/{lowered_filename}"
 
     return response, 201
@@ -1,13 +1,224 @@
 
+import atexit
+import heapq
+import itertools
 import os
+import queue
+import smtplib
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
 
-from flask import Flask, abort, g, json, jsonify, render_template, request
+from flask import Flask, abort, current_app, g, json, jsonify, render_template, request
 from flask_mail import Mail, Message
+from markupsafe import escape
+
+# Substituted for the link when a template is rendered once for the cache
+_LINK_PLACEHOLDER = 'MAILLINKPLACEHOLDER7f3a9c'
+
+# Transient SMTP errors (4xx) and lost connections are retried, the rest is dropped
+_TRANSIENT_ERRORS = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError,
+                     ConnectionError, TimeoutError, OSError)
+
+# (sender, recipients, message bytes, attempts)
+QueuedMail = Tuple[str, List[str], bytes, int]
+
+
+class MailQueue:
+    """
+    Outbound mail queue: requests only enqueue the message, a background thread
+    sends it over an SMTP connection kept open between messages (closed after
+    `idle_timeout` seconds without mail), by batches of at most `batch_size`.
+
+    Lost connections and temporary SMTP errors (4xx) are retried `max_retries`
+    times with an increasing delay, permanent errors (5xx) are logged and dropped.
+    A message waiting for its retry is kept aside by the worker, the other
+    messages are sent meanwhile. The SMTP settings are the MAIL_* settings of Flask-Mail.
+    """
+
+    def __init__(self, max_size: int = 1000, batch_size: int = 20, max_retries: int = 3,
+                 retry_delay: float = 2.0, idle_timeout: float = 30.0):
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.idle_timeout = idle_timeout
+        self._queue: "queue.Queue[QueuedMail]" = queue.Queue(maxsize=max_size)
+        self._app: Optional[Flask] = None
+        self._thread: Optional[threading.Thread] = None
+        self._thread_lock = threading.Lock()
+        # only used by the worker thread: its connection and its messages to retry,
+        # as a heap of (not before, sequence, message)
+        self._smtp: Optional[smtplib.SMTP] = None
+        self._delayed: List[Tuple[float, int, QueuedMail]] = []
+        self._sequence = itertools.count()
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+
+    def init_app(self, app: Flask) -> None:
+        self._app = app
+        # the sender thread is a daemon: give it a chance to send what is queued
+        atexit.register(self.flush, 10)
+
+    def _ensure_worker(self) -> None:
+        # started on the first mail of each process (after the fork of the workers)
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='mail-queue', daemon=True)
+                self._thread.start()
+
+    def enqueue(self, sender: str, recipients: List[str], message: bytes) -> None:
+        """
+        Queue a message; if the queue is full it is sent right away in the calling thread,
+        on its own connection and without retry
+        """
+        try:
+            self._queue.put_nowait((sender, recipients, message, 0))
+        except queue.Full:
+            print("Mail queue full, sending synchronously")
+            self._send_direct(sender, recipients, message)
+            return
+        self._ensure_worker()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every queued message was sent (or dropped), returns False on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def stats(self) -> Dict[str, int]:
+        return {'queued': self._queue.qsize(), 'delayed': len(self._delayed), 'sent': self.sent,
+                'failed': self.failed, 'retried': self.retried}
+
+    def _connect(self) -> smtplib.SMTP:
+        config = self._app.config
+        host, port = config.get('MAIL_SERVER', 'localhost'), config.get('MAIL_PORT', 25)
+        if config.get('MAIL_USE_SSL'):
+            smtp = smtplib.SMTP_SSL(host, port, timeout=30)
+        else:
+            smtp = smtplib.SMTP(host, port, timeout=30)
+        if config.get('MAIL_USE_TLS'):
+            smtp.starttls()
+        if config.get('MAIL_USERNAME') and config.get('MAIL_PASSWORD'):
+            smtp.login(config['MAIL_USERNAME'], config['MAIL_PASSWORD'])
+        return smtp
+
+    def _close(self) -> None:
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except Exception:
+                pass
+            self._smtp = None
+
+    def _send_direct(self, sender: str, recipients: List[str], message: bytes) -> None:
+        """Send one message on a short-lived connection (the worker connection is not shared)"""
+        try:
+            smtp = self._connect()
+            try:
+                smtp.sendmail(sender, recipients, message)
+            finally:
+                try:
+                    smtp.quit()
+                except Exception:
+                    pass
+            self.sent += 1
+        except Exception as e:
+            self.failed += 1
+            print(f"Mail to {recipients} dropped: {e!r}")
+
+    def _send_batch(self, batch: List[QueuedMail]) -> None:
+        """Send the messages on the shared connection, the transient failures are scheduled for a retry"""
+        for mail in batch:
+            sender, recipients, message, attempts = mail
+            try:
+                if self._smtp is None:
+                    self._smtp = self._connect()
+                self._smtp.sendmail(sender, recipients, message)
+                self.sent += 1
+                self._queue.task_done()
+            except smtplib.SMTPResponseException as e:
+                if 400 <= e.smtp_code < 500:
+                    self._retry(mail, e)
+                else:
+                    self._drop(f"Mail to {recipients} refused: {e.smtp_code} {e.smtp_error!r}")
+            except smtplib.SMTPRecipientsRefused as e:
+                self._drop(f"Mail recipients refused: {e.recipients}")
+            except _TRANSIENT_ERRORS as e:
+                # connection lost: reconnect for the next message
+                self._close()
+                self._retry(mail, e)
+            except Exception as e:
+                self._close()
+                self._drop(f"Mail to {recipients} failed: {e!r}")
+
+    def _drop(self, reason: str) -> None:
+        self.failed += 1
+        print(reason)
+        self._queue.task_done()
+
+    def _retry(self, mail: QueuedMail, error) -> None:
+        sender, recipients, message, attempts = mail
+        if attempts + 1 >= self.max_retries:
+            self._drop(f"Mail to {recipients} dropped after {attempts + 1} attempts: {error!r}")
+            return
+        self.retried += 1
+        # kept aside until its delay is over, the queue keeps being sent meanwhile
+        # (the message stays unfinished in the queue until it is sent or dropped)
+        not_before = time.monotonic() + self.retry_delay * (attempts + 1)
+        heapq.heappush(self._delayed, (not_before, next(self._sequence),
+                                       (sender, recipients, message, attempts + 1)))
+
+    def _run(self) -> None:
+        while True:
+            timeout = self.idle_timeout
+            if self._delayed:
+                timeout = max(0.0, min(timeout, self._delayed[0][0] - time.monotonic()))
+            batch = []
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                if not self._delayed:
+                    self._close()
+                    continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            now = time.monotonic()
+            while self._delayed and self._delayed[0][0] <= now and len(batch) < self.batch_size:
+                batch.append(heapq.heappop(self._delayed)[2])
+            if batch:
+                self._send_batch(batch)
+
+
+mail_queue = MailQueue()
+
+
+# Rendered templates, with _LINK_PLACEHOLDER in place of the link
+_rendered_templates: Dict[str, str] = {}
+
+
+def render_link_template(template_name: str, confirmation_link: str) -> str:
+    """
+    render_template(template_name, confirmation_link=...) rendered only once per template:
+    the link is the only variable of the mail templates, it is substituted in the cached HTML.
+    """
+    rendered = _rendered_templates.get(template_name)
+    if rendered is None:
+        rendered = render_template(template_name, confirmation_link=_LINK_PLACEHOLDER)
+        _rendered_templates[template_name] = rendered
+    return rendered.replace(_LINK_PLACEHOLDER, str(escape(confirmation_link)))
 
 
 def send_email(to, subject, html_content):
-    from app import app
-    mail = Mail(app)
+    app = current_app
     if isinstance(to, str):  # Vérifiez si to est une chaîne de caractères
       to = [to]  # Convertissez-la en liste si ce n'est pas déjà le cas
     msg = Message(
@@ -16,14 +227,16 @@ def send_email(to, subject, html_content):
         html=html_content,
         sender=app.config["MAIL_DEFAULT_SENDER"],
     )
-    mail.send(msg)
+    if app.config.get('MAIL_SUPPRESS_SEND', app.testing):
+        return
+    # le message est construit ici (contexte Flask), l'envoi SMTP se fait en arrière-plan
+    mail_queue.enqueue(msg.sender, list(msg.send_to), msg.as_bytes())
 
 
 def sendConfirmationTemplate(email, user_id, token):
     front_url = os.getenv("FRONT_URL")
     confirmation_link = f"{front_url}/confirm_account/{user_id}/{token}"
-    html_content = render_template(
-        'ConfirmationAccount.html', confirmation_link=confirmation_link)
+    html_content = render_link_template('ConfirmationAccount.html', confirmation_link)
     subject = "Account Confirmation"
     send_email(email, subject, html_content)
 
@@ -31,8 +244,7 @@ def sendConfirmationTemplate(email, user_id, token):
 def sendConfirmationPayment(email, user_id, token):
     front_url = os.getenv("FRONT_URL")
     confirmation_link = f"{front_url}/confirm_payment/{user_id}/{token}"
-    html_content = render_template(
-        'ConfirmationPayment.html', confirmation_link=confirmation_link)
+    html_content = render_link_template('ConfirmationPayment.html', confirmation_link)
     subject = "Payment Confirmation"
     send_email(email, subject, html_content)
 
@@ -40,7 +252,6 @@ def sendConfirmationPayment(email, user_id, token):
 def sendPasswordResetTemplate(email, token):
     front_url = os.getenv("FRONT_URL")
     confirmation_link = f"{front_url}/lostpassword/{token}"
-    html_content = render_template(
-        'ModificationPassword.html', confirmation_link=confirmation_link)
+    html_content = render_link_template('ModificationPassword.html', confirmation_link)
     subject = "Password Reset"
     send_email(email, subject, html_content)
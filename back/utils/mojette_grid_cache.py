@@ -0,0 +1,121 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+# File touched by script_db.py when mojettes are (re)imported, so that every
+# running worker drops its decoded grids (the script runs in another process)
+MOJETTE_GRIDS_VERSION_FILE = os.path.join(os.path.dirname(
+    os.path.dirname(__file__)), 'data', 'mojette_grids.version')
+
+
+def touch_mojette_grids_version() -> None:
+    """Mark every cached Mojette grid as stale, in all processes"""
+    os.makedirs(os.path.dirname(MOJETTE_GRIDS_VERSION_FILE), exist_ok=True)
+    with open(MOJETTE_GRIDS_VERSION_FILE, 'w') as f:
+        f.write(str(time.time()))
+
+
+class DecodedMojette:
+    """
+    A Mojette grid with its shape and reward, already parsed from the database strings.
+
+    Attributes:
+        data (dict): Serialized grid, shape and reward columns (as returned by Serializer.serialize_row).
+        bin_values (tuple[int]): Values of the bins, parsed from 'bin_values'.
+        array_box (tuple[int]): Boxes of the shape, parsed from 'array_box'.
+        solution (tuple[int] | None): Solution of the grid, parsed from 'solution'.
+        reward (int): Mojettes earned when solving the grid.
+        help_cost (int): Cost of a hint, in percent of the reward.
+    """
+
+    __slots__ = ('data', 'bin_values', 'array_box', 'solution', 'reward', 'help_cost')
+
+    def __init__(self, data: Dict):
+        self.data = data
+        self.bin_values = tuple(int(x) for x in data['bin_values'].split(','))
+        self.array_box = tuple(int(x) for x in data['array_box'].split(' '))
+        solution = data.get('solution')
+        self.solution = tuple(int(x) for x in solution.split(',')) if solution else None
+        self.reward = data.get('reward')
+        self.help_cost = data.get('help_1_percent_cost')
+
+    def to_dict(self) -> Dict:
+        """Return a new dictionary matching mojette_model, safe to modify by the caller"""
+        result = dict(self.data)
+        result['bin_values'] = list(self.bin_values)
+        result['array_box'] = list(self.array_box)
+        return result
+
+
+class MojetteGridCache:
+    """
+    Bounded LRU cache of decoded Mojette grids, keyed by grid id.
+
+    Grids do not change once imported (a new grid gets a new id): entries are only
+    dropped by clear(), or when script_db.py touches MOJETTE_GRIDS_VERSION_FILE.
+    """
+
+    def __init__(self, max_size: int = 512, version_check_interval: float = 5.0):
+        self.max_size = max_size
+        self.version_check_interval = version_check_interval
+        self._entries: "OrderedDict[int, DecodedMojette]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = self._read_version()
+        self._next_version_check = time.monotonic() + version_check_interval
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _read_version() -> Optional[float]:
+        try:
+            return os.path.getmtime(MOJETTE_GRIDS_VERSION_FILE)
+        except OSError:
+            return None
+
+    def _check_version(self) -> None:
+        """Clear the cache if script_db.py updated the grids (checked at most every version_check_interval)"""
+        now = time.monotonic()
+        if now < self._next_version_check:
+            return
+        self._next_version_check = now + self.version_check_interval
+        version = self._read_version()
+        if version != self._version:
+            self._version = version
+            self._entries.clear()
+
+    def get(self, mojette_id: int) -> Optional[DecodedMojette]:
+        with self._lock:
+            self._check_version()
+            entry = self._entries.get(mojette_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(mojette_id)
+            self.hits += 1
+            return entry
+
+    def put(self, mojette_id: int, entry: DecodedMojette) -> None:
+        with self._lock:
+            self._entries[mojette_id] = entry
+            self._entries.move_to_end(mojette_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters and current size of the cache"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._entries),
+                'max_size': self.max_size,
+            }
+
+
+mojette_grid_cache = MojetteGridCache()
@@ -0,0 +1,68 @@
+import base64
+from typing import Optional, Sequence, Tuple
+
+from flask import abort, request
+
+# Header carrying the cursor of the next page (absent on the last page)
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+
+# Page size of the paginated list endpoints when only ?cursor= is given, and largest ?limit=
+DEFAULT_PAGE_LIMIT = 100
+MAX_PAGE_LIMIT = 1000
+
+# Sort key of the last row of a page: (level, id) for the grid catalogs,
+# (id,) for the users, (user_id, grid_id) for the completions
+Cursor = Tuple[int, ...]
+
+
+def encode_cursor(*values: int) -> str:
+    """Opaque cursor pointing after the row whose sort key is `values`"""
+    return base64.urlsafe_b64encode(':'.join(map(str, values)).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str, size: int = 2) -> Cursor:
+    """
+    Raises:
+        ValueError: The cursor was not built by encode_cursor with `size` values
+    """
+    try:
+        values = tuple(int(value) for value in
+                       base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode().split(':'))
+    except (UnicodeDecodeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+    if len(values) != size:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return values
+
+
+def request_cursor(size: int = 2) -> Optional[Cursor]:
+    """Cursor of the ?cursor= query parameter, None if absent (400 if it is invalid)"""
+    cursor = request.args.get('cursor')
+    if cursor is None:
+        return None
+    try:
+        return decode_cursor(cursor, size)
+    except ValueError:
+        abort(400, "Invalid cursor")
+
+
+def request_limit() -> Optional[int]:
+    """Page size of the ?limit= query parameter, None if absent (400 if it is not in 1..MAX_PAGE_LIMIT)"""
+    limit = request.args.get('limit')
+    if limit is None:
+        return None
+    if not limit.isdigit() or not 0 < int(limit) <= MAX_PAGE_LIMIT:
+        abort(400, f"limit must be between 1 and {MAX_PAGE_LIMIT}")
+    return int(limit)
+
+
+def next_cursor_headers(rows: list, limit: int, keys: Sequence[str] = ('level', 'id')) -> dict:
+    """
+    Headers of a page read with `limit + 1` rows: the extra row only tells that
+    there is a next page, it is removed from `rows`.
+    """
+    if len(rows) <= limit:
+        return {}
+    del rows[limit:]
+    last = rows[-1]
+    return {NEXT_CURSOR_HEADER: encode_cursor(*(last[key] for key in keys))}
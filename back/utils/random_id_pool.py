@@ -0,0 +1,67 @@
+import random
+import threading
+import time
+from typing import Callable, Dict, Iterable, List
+
+
+class RandomIdPool:
+    """
+    In-memory pool of candidate ids (unsolved grids, unpublished carres...) to draw from.
+
+    The pool is loaded once with `loader` and then kept up to date incrementally
+    with add() / discard(); it is fully reloaded every `ttl` seconds to catch
+    changes made by other processes (other workers, script_db.py).
+    Drawing k distinct ids costs O(k), whatever the size of the tables.
+    """
+
+    def __init__(self, ttl: float = 600.0):
+        self.ttl = ttl
+        self._ids: List[int] = []
+        self._positions: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self._expires_at = 0.0
+
+    def _refresh(self, loader: Callable[[], Iterable[int]]) -> None:
+        if time.monotonic() < self._expires_at:
+            return
+        ids = list(dict.fromkeys(loader()))
+        self._ids = ids
+        self._positions = {id: position for position, id in enumerate(ids)}
+        self._expires_at = time.monotonic() + self.ttl
+
+    def sample(self, k: int, loader: Callable[[], Iterable[int]]) -> List[int]:
+        """Draw up to k distinct ids (less if the pool is smaller), without removing them"""
+        with self._lock:
+            self._refresh(loader)
+            return random.sample(self._ids, min(k, len(self._ids)))
+
+    def add(self, id: int) -> None:
+        with self._lock:
+            if id not in self._positions:
+                self._positions[id] = len(self._ids)
+                self._ids.append(id)
+
+    def discard(self, id: int) -> None:
+        with self._lock:
+            position = self._positions.pop(id, None)
+            if position is None:
+                return
+            # swap with the last id so that removal stays O(1)
+            last = self._ids.pop()
+            if last != id:
+                self._ids[position] = last
+                self._positions[last] = position
+
+    def invalidate(self) -> None:
+        """Force a full reload on the next draw"""
+        with self._lock:
+            self._expires_at = 0.0
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+
+# Mojettes never completed nor scheduled as a daily grid
+unsolved_mojette_pool = RandomIdPool()
+# Carres not published yet
+unpublished_carre_pool = RandomIdPool()
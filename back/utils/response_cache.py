@@ -0,0 +1,202 @@
+import hashlib
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from functools import wraps
+from typing import Dict, Optional, Tuple
+
+from flask import Response, request
+from flask_restx.representations import output_json
+from utils.common import write_atomic
+from utils.compression import (COMPRESSION_MIN_SIZE, accepts_gzip,
+                               compression_stats, gzip_compress)
+from utils.token import get_token_claims
+
+# One file per kind of content, rewritten on every change so that all the
+# workers (and script_db.py, which runs in another process) share the versions
+CONTENT_VERSIONS_DIR = os.path.join(os.path.dirname(
+    os.path.dirname(__file__)), 'data', 'content_versions')
+
+# Kinds of content
+PROBLEMS = 'problems'  # problems, regions and departments (only changed by script_db.py)
+WEEK_PROBLEMS = 'week_problems'
+FORMATIONS = 'formations'  # formations, sessions, categories and purchases
+CONTENTS = (PROBLEMS, WEEK_PROBLEMS, FORMATIONS)
+
+
+def _version_path(content: str) -> str:
+    return os.path.join(CONTENT_VERSIONS_DIR, f'{content}.version')
+
+
+def bump_content_version(*contents: str) -> None:
+    """Mark the cached responses built from these contents as stale, in all processes"""
+    os.makedirs(CONTENT_VERSIONS_DIR, exist_ok=True)
+    for content in contents:
+        version = uuid.uuid4().hex
+        write_atomic(_version_path(content), version.encode('utf-8'))
+        response_cache.set_version(content, version)
+
+
+class CachedResponse:
+    """A cached body, with its gzip version once a client accepting gzip asked for it"""
+
+    __slots__ = ('body', 'gzip', 'etag', 'mimetype', 'expires_at')
+
+    def __init__(self, body: bytes, mimetype: str, expires_at: Optional[float]):
+        self.body = body
+        self.gzip: Optional[bytes] = None
+        self.etag = hashlib.sha1(body).hexdigest()
+        self.mimetype = mimetype
+        self.expires_at = expires_at
+
+    def to_response(self) -> Response:
+        compress = len(self.body) >= COMPRESSION_MIN_SIZE and accepts_gzip()
+        etag = self.etag + '-gzip' if compress else self.etag
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+        elif compress:
+            if self.gzip is None:
+                self.gzip = gzip_compress(self.body)
+            else:
+                compression_stats.record(request.endpoint, len(self.body), len(self.gzip), from_cache=True)
+            response = Response(self.gzip, status=200, mimetype=self.mimetype)
+            response.headers['Content-Encoding'] = 'gzip'
+        else:
+            response = Response(self.body, status=200, mimetype=self.mimetype)
+        response.set_etag(etag)
+        response.vary.add('Accept-Encoding')
+        # authenticated content: browsers may keep it but must revalidate it
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+
+
+class ResponseCache:
+    """
+    Bounded LRU of serialized GET responses, keyed by route, query parameters,
+    content versions (and user when the response depends on it).
+
+    Versions are re-read from CONTENT_VERSIONS_DIR at most every
+    `version_check_interval` seconds; a bump makes the old keys unreachable,
+    they are then evicted by the LRU.
+    """
+
+    def __init__(self, max_size: int = 1024, version_check_interval: float = 1.0):
+        self.max_size = max_size
+        self.version_check_interval = version_check_interval
+        self._entries: "OrderedDict[tuple, CachedResponse]" = OrderedDict()
+        self._versions: Dict[str, str] = {}
+        self._next_version_check = 0.0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _read_versions(self) -> None:
+        now = time.monotonic()
+        if now < self._next_version_check:
+            return
+        self._next_version_check = now + self.version_check_interval
+        for content in CONTENTS:
+            try:
+                with open(_version_path(content)) as f:
+                    self._versions[content] = f.read()
+            except OSError:
+                self._versions[content] = ''
+
+    def set_version(self, content: str, version: str) -> None:
+        with self._lock:
+            self._versions[content] = version
+
+    def versions(self, contents: Tuple[str, ...]) -> tuple:
+        with self._lock:
+            self._read_versions()
+            return tuple(self._versions[content] for content in contents)
+
+    def get(self, key: tuple) -> Optional[CachedResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at is not None and time.monotonic() >= entry.expires_at:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: tuple, entry: CachedResponse) -> None:
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._entries),
+                'max_size': self.max_size,
+            }
+
+
+response_cache = ResponseCache()
+
+
+def _to_response(result) -> Response:
+    """Build the response of a Resource method the way flask-restx would (JSON)"""
+    if isinstance(result, Response):
+        return result
+    data, status, headers = result, 200, None
+    if isinstance(result, tuple):
+        data, status, headers = (result + (None, None))[:3]
+    response = output_json(data, status, headers)
+    response.mimetype = 'application/json'
+    return response
+
+
+def cached_response(*contents: str, per_user: bool = False, max_age: Optional[float] = None):
+    """
+    Cache the JSON response of a GET method until one of `contents` is bumped
+    (bump_content_version), and answer If-None-Match with 304 Not Modified.
+    Only 200 responses are cached.
+
+    Must be placed under @token_required (so authentication is still checked) and
+    above @api.marshal_with (so the marshalled output is what gets cached).
+
+    Args:
+        contents: Kinds of content the response is built from (PROBLEMS, FORMATIONS...)
+        per_user: The response depends on the user of the Authorization token
+        max_age: Seconds after which an entry is rebuilt anyway (responses depending on the date)
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            user_id = None
+            if per_user and request.headers.get('Authorization') is not None:
+                try:
+                    user_id = get_token_claims()['user_id']
+                except Exception:
+                    return f(*args, **kwargs)
+            key = (request.path, tuple(sorted(request.args.items(multi=True))),
+                   response_cache.versions(contents), user_id)
+
+            entry = response_cache.get(key)
+            if entry is None:
+                response = _to_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                entry = CachedResponse(
+                    response.get_data(), response.mimetype,
+                    time.monotonic() + max_age if max_age is not None else None)
+                response_cache.put(key, entry)
+            return entry.to_response()
+        return decorated
+    return decorator
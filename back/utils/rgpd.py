@@ -3,131 +3,195 @@ RGPD (GDPR) utilities for user data export and deletion.
 """
 
 import json
+import textwrap
+import zipfile
 from datetime import datetime, date
-from io import BytesIO
+from typing import Callable, Iterable, Iterator, Optional, Tuple
 from database.database import DatabaseManager
 from sqlalchemy import text
 
+# Tables exported with the user row, in the order of the export document
+USER_EXPORT_TABLES = (
+    'checkout_session',
+    'carre_completed',
+    'formation_bought',
+    'mojette_completed',
+    'problem_completed',
+    'week_problem_completed',
+)
 
-def get_user_export_data(user_id: int) -> dict:
+# Called with (tables done, tables total) while an export is written
+ProgressCallback = Callable[[int, int], None]
+
+# Rows fetched at a time from the server-side cursor of each table
+EXPORT_BATCH_SIZE = 500
+
+# Bytes buffered before a chunk of the zip archive is sent
+ZIP_CHUNK_SIZE = 64 * 1024
+
+
+def serialize_value(value):
+    """
+    Convert a database value to a JSON-serializable value
+    (datetime and date as ISO strings, bytes decoded as UTF-8).
     """
-    Collect all data related to a user for RGPD data export.
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    elif isinstance(value, bytes):
+        return value.decode('utf-8')
+    return value
+
+
+def _json_default(value):
+    serialized = serialize_value(value)
+    if serialized is value:
+        raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+    return serialized
+
+
+def _dumps(value, indent: int = 2) -> str:
+    return json.dumps(value, indent=indent, ensure_ascii=False, default=_json_default)
+
+
+def _iter_table_rows(table: str, user_id: int) -> Iterator[dict]:
+    """Rows of one table for the user, read lazily with a server-side cursor"""
+    session = DatabaseManager().db.session
+    result = session.execute(
+        text(f'SELECT * FROM {table} WHERE user_id = :user_id'),
+        {'user_id': user_id},
+        execution_options={'yield_per': EXPORT_BATCH_SIZE}
+    )
+    for row in result.mappings():
+        yield dict(row)
+
+
+def iter_user_export_tables(user_id: int,
+                            progress: Optional[ProgressCallback] = None) -> Iterator[Tuple[str, Iterator[dict]]]:
+    """
+    Tables of the user data export, as (table name, lazy rows), the user row first.
+    Tables without rows for the user are skipped, only their first row is read to know it.
+    Each table must be consumed before the next one is requested.
 
     Args:
-        user_id: The ID of the user to export data for
+        progress: Called before each table is read, and once all of them are done
 
-    Returns:
-        A dictionary containing all user data organized by table
+    Raises:
+        LookupError: The user does not exist
     """
-    db_manager = DatabaseManager()
-    session = db_manager.db.session
+    total = 1 + len(USER_EXPORT_TABLES)
+    user = DatabaseManager().ReadUserById(user_id)
+    if user is None:
+        raise LookupError('User not found')
+    yield 'user', iter([user.serialize()])
+
+    for done, table in enumerate(USER_EXPORT_TABLES, start=1):
+        if progress is not None:
+            progress(done, total)
+        rows = _iter_table_rows(table, user_id)
+        first = next(rows, None)
+        if first is not None:
+            yield table, _chain_first(first, rows)
+    if progress is not None:
+        progress(total, total)
+
+
+def _chain_first(first: dict, rows: Iterator[dict]) -> Iterator[dict]:
+    yield first
+    yield from rows
+
+
+def _export_metadata(user_id: int, export_date: Optional[datetime] = None) -> dict:
+    return {
+        'export_date': (export_date or datetime.now()).isoformat(),
+        'user_id': user_id
+    }
 
-    export_data = {}
 
-    try:
-        # Get user's own data
-        user = db_manager.ReadUserById(user_id)
-        if user:
-            export_data['user'] = [user.serialize()]
-        else:
-            return {'error': 'User not found'}
-
-        # Get checkout sessions
-        checkout_sessions = session.execute(
-            text('SELECT * FROM checkout_session WHERE user_id = :user_id'),
-            {'user_id': user_id}
-        ).fetchall()
-        if checkout_sessions:
-            export_data['checkout_session'] = [dict(row._mapping) for row in checkout_sessions]
-
-        # Get carre completed
-        carre_completed = session.execute(
-            text('SELECT * FROM carre_completed WHERE user_id = :user_id'),
-            {'user_id': user_id}
-        ).fetchall()
-        if carre_completed:
-            export_data['carre_completed'] = [dict(row._mapping) for row in carre_completed]
-
-        # Get formation bought
-        formation_bought = session.execute(
-            text('SELECT * FROM formation_bought WHERE user_id = :user_id'),
-            {'user_id': user_id}
-        ).fetchall()
-        if formation_bought:
-            export_data['formation_bought'] = [dict(row._mapping) for row in formation_bought]
-
-        # Get mojette completed
-        mojette_completed = session.execute(
-            text('SELECT * FROM mojette_completed WHERE user_id = :user_id'),
-            {'user_id': user_id}
-        ).fetchall()
-        if mojette_completed:
-            export_data['mojette_completed'] = [dict(row._mapping) for row in mojette_completed]
-
-        # Get problem completed
-        problem_completed = session.execute(
-            text('SELECT * FROM problem_completed WHERE user_id = :user_id'),
-            {'user_id': user_id}
-        ).fetchall()
-        if problem_completed:
-            export_data['problem_completed'] = [dict(row._mapping) for row in problem_completed]
-
-        # Get week problem completed
-        week_problem_completed = session.execute(
-            text('SELECT * FROM week_problem_completed WHERE user_id = :user_id'),
-            {'user_id': user_id}
-        ).fetchall()
-        if week_problem_completed:
-            export_data['week_problem_completed'] = [dict(row._mapping) for row in week_problem_completed]
-
-        return export_data
-
-    except Exception as e:
-        import traceback
-        print(f"Error exporting user data: {str(e)}")
-        traceback.print_exc()
-        return {'error': str(e)}
-
-
-def convert_to_json_serializable(data: dict) -> dict:
+def _stream_json_array(rows: Iterable[dict], level: int) -> Iterator[str]:
+    """JSON array of `rows`, written like json.dumps(indent=2) nested `level` times"""
+    prefix = '  ' * (level + 1)
+    separator = '[\n'
+    for row in rows:
+        yield separator + textwrap.indent(_dumps(row), prefix)
+        separator = ',\n'
+    yield '[]' if separator == '[\n' else '\n' + '  ' * level + ']'
+
+
+def stream_user_export_json(user_id: int, export_date: Optional[datetime] = None,
+                            progress: Optional[ProgressCallback] = None) -> Iterator[str]:
     """
-    Convert database data to JSON-serializable format.
-    Handles datetime, date objects and other non-JSON types.
+    JSON document with all user data, yielded piece by piece: one record of one
+    table at a time, so the whole document never exists in memory.
+    Same output as the previous json.dumps(indent=2) of {'metadata': ..., 'data': ...}.
 
-    Args:
-        data: Dictionary with user data
+    Raises:
+        LookupError: The user does not exist (before anything is yielded)
+    """
+    tables = iter_user_export_tables(user_id, progress)
+    # the user row is read first, so a missing user fails before the response starts
+    first_table = next(tables)
 
-    Returns:
-        Dictionary with JSON-serializable data
+    metadata = textwrap.indent(_dumps(_export_metadata(user_id, export_date)), '  ').lstrip()
+    yield '{\n  "metadata": ' + metadata + ',\n  "data": {'
+    separator = '\n'
+    for table, rows in _chain_first(first_table, tables):
+        yield f'{separator}    {json.dumps(table)}: '
+        yield from _stream_json_array(rows, 2)
+        separator = ',\n'
+    yield '\n  }\n}'
+
+
+class _ChunkBuffer:
+    """Write-only file object collecting the bytes written by zipfile (not seekable)"""
+
+    def __init__(self):
+        self._parts = []
+        self.size = 0
+
+    def write(self, data: bytes) -> int:
+        self._parts.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def take(self) -> bytes:
+        data = b''.join(self._parts)
+        self._parts = []
+        self.size = 0
+        return data
+
+
+def stream_user_export_zip(user_id: int, export_date: Optional[datetime] = None,
+                           progress: Optional[ProgressCallback] = None) -> Iterator[bytes]:
     """
-    def serialize_value(value):
-        if isinstance(value, datetime):
-            return value.isoformat()
-        elif isinstance(value, date):
-            return value.isoformat()
-        elif isinstance(value, bytes):
-            return value.decode('utf-8')
-        elif value is None:
-            return None
-        else:
-            return value
-
-    serialized = {}
-    for table_name, records in data.items():
-        if isinstance(records, list):
-            serialized[table_name] = [
-                {k: serialize_value(v) for k, v in record.items()}
-                for record in records
-            ]
-        else:
-            serialized[table_name] = serialize_value(records)
+    Zip archive of the user data, one JSON file per table (and metadata.json), yielded
+    in chunks while it is written: entries are compressed on the fly with data
+    descriptors, nothing is kept in memory beyond the current chunk.
 
-    return serialized
+    Raises:
+        LookupError: The user does not exist (before anything is yielded)
+    """
+    tables = iter_user_export_tables(user_id, progress)
+    first_table = next(tables)
+
+    buffer = _ChunkBuffer()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('metadata.json', _dumps(_export_metadata(user_id, export_date)))
+        for table, rows in _chain_first(first_table, tables):
+            with archive.open(f'{table}.json', 'w') as entry:
+                for part in _stream_json_array(rows, 0):
+                    entry.write(part.encode('utf-8'))
+                    if buffer.size >= ZIP_CHUNK_SIZE:
+                        yield buffer.take()
+    yield buffer.take()
 
 
 def create_user_export_json(user_id: int) -> str:
     """
     Create a JSON string with all user data.
+    Prefer stream_user_export_json for a response: this joins the whole document.
 
     Args:
         user_id: The ID of the user to export data for
@@ -135,21 +199,7 @@ def create_user_export_json(user_id: int) -> str:
     Returns:
         JSON string with all user data
     """
-    export_data = get_user_export_data(user_id)
-
-    if 'error' in export_data:
-        return json.dumps(export_data)
-
-    # Convert to JSON-serializable format
-    serializable_data = convert_to_json_serializable(export_data)
-
-    # Add metadata
-    export_data_with_metadata = {
-        'metadata': {
-            'export_date': datetime.now().isoformat(),
-            'user_id': user_id
-        },
-        'data': serializable_data
-    }
-
-    return json.dumps(export_data_with_metadata, indent=2, ensure_ascii=False)
+    try:
+        return ''.join(stream_user_export_json(user_id))
+    except LookupError as e:
+        return json.dumps({'error': str(e)})
@@ -0,0 +1,54 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+class UserRoleCache:
+    """
+    Bounded cache of user roles, so that admin checks do not query the user table
+    on every request.
+
+    Entries expire after `ttl` seconds, which bounds how long a role changed by
+    another process (script_db.py, manual SQL) can be seen; changes made through
+    DatabaseManager call invalidate() right away.
+    """
+
+    MISSING = object()
+
+    def __init__(self, ttl: float = 60.0, max_size: int = 4096):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: "OrderedDict[int, tuple[float, Optional[str]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int):
+        """Cached role of the user (None for an unknown user), or UserRoleCache.MISSING"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return self.MISSING
+            expires_at, role = entry
+            if time.monotonic() >= expires_at:
+                del self._entries[user_id]
+                return self.MISSING
+            self._entries.move_to_end(user_id)
+            return role
+
+    def put(self, user_id: int, role: Optional[str]) -> None:
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, role)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+user_role_cache = UserRoleCache()
@@ -0,0 +1,385 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import stripe
+from flask import Flask
+from flask.cli import AppGroup
+
+# SQLite file shared by all the workers of the app (and the CLI)
+STRIPE_CATALOG_PATH = os.path.join(os.path.dirname(
+    os.path.dirname(__file__)), 'data', 'stripe_catalog.sqlite3')
+
+# Entries younger than this are served as is, older ones are served while they are
+# refreshed in the background, up to STRIPE_CATALOG_MAX_STALE
+STRIPE_CATALOG_FRESH_TTL = 60 * 60  # 1 hour
+STRIPE_CATALOG_MAX_STALE = 7 * 24 * 60 * 60  # 1 week
+# Seconds a process owns the refresh of an entry before another one may try again
+STRIPE_CATALOG_REFRESH_LEASE = 30
+# Concurrent Stripe calls of a process to fetch the prices missing from the catalog
+STRIPE_FETCH_WORKERS = 8
+
+# Keys of the catalog entries
+PRODUCTS = 'products'
+PRICES = 'prices'
+
+
+def product_key(product_id: str) -> str:
+    return f'product:{product_id}'
+
+
+def price_key(price_id: str) -> str:
+    return f'price:{price_id}'
+
+
+def product_prices_key(product_id: str) -> str:
+    return f'product_prices:{product_id}'
+
+
+# A loader fetches an entry from Stripe and returns it with the other entries it
+# allows to fill (the prices of a product come with the list of all prices...)
+Loader = Callable[[], Dict[str, Any]]
+
+
+def _to_json(value) -> Any:
+    # StripeObject is a dict: a JSON round trip gives plain dicts and lists
+    return json.loads(json.dumps(value))
+
+
+def _load_products() -> Dict[str, Any]:
+    products = _to_json(list(stripe.Product.list(limit=100).auto_paging_iter()))
+    entries = {product_key(product['id']): product for product in products}
+    entries[PRODUCTS] = products
+    return entries
+
+
+def _load_prices() -> Dict[str, Any]:
+    prices = _to_json(list(stripe.Price.list(limit=100).auto_paging_iter()))
+    entries: Dict[str, Any] = {price_key(price['id']): price for price in prices}
+    for price in prices:
+        entries.setdefault(product_prices_key(price['product']), []).append(price)
+    entries[PRICES] = prices
+    return entries
+
+
+def _load_product(product_id: str) -> Dict[str, Any]:
+    return {product_key(product_id): _to_json(stripe.Product.retrieve(product_id))}
+
+
+def _load_product_prices(product_id: str) -> Dict[str, Any]:
+    prices = _to_json(list(stripe.Price.list(product=product_id, limit=100).auto_paging_iter()))
+    entries = {price_key(price['id']): price for price in prices}
+    entries[product_prices_key(product_id)] = prices
+    return entries
+
+
+def _load_price(price_id: str) -> Dict[str, Any]:
+    return {price_key(price_id): _to_json(stripe.Price.retrieve(price_id))}
+
+
+def _load_expanded_price(price_id: str) -> Dict[str, Any]:
+    # one call for the price and its product, stored as two entries like the lists do
+    price = _to_json(stripe.Price.retrieve(price_id, expand=['product']))
+    product = price['product']
+    return {price_key(price_id): dict(price, product=product['id']), product_key(product['id']): product}
+
+
+class StripeFetchError(Exception):
+    """A price or a product missing from the catalog could not be fetched from Stripe (same message as the Stripe error)"""
+
+    def __init__(self, object_id: str, error: Exception):
+        super().__init__(str(error))
+        self.object_id = object_id
+        self.error = error
+
+
+class StripeCatalog:
+    """
+    Cache of the Stripe products and prices, in a SQLite file shared by the workers:
+    the catalog is fetched once for all of them (warmed at boot) instead of once per
+    worker. Stale entries are served while one worker refreshes them in the background,
+    and an error on a product or a price only invalidates that entry.
+
+    Values are the JSON of the Stripe objects (plain dicts and lists).
+    """
+
+    def __init__(self, path: str = STRIPE_CATALOG_PATH, fresh_ttl: float = STRIPE_CATALOG_FRESH_TTL,
+                 max_stale: float = STRIPE_CATALOG_MAX_STALE, refresh_workers: int = 2):
+        self.path = path
+        self.fresh_ttl = fresh_ttl
+        self.max_stale = max_stale
+        self._executor = ThreadPoolExecutor(max_workers=refresh_workers, thread_name_prefix='stripe-catalog')
+        self._fetch_executor = ThreadPoolExecutor(max_workers=STRIPE_FETCH_WORKERS, thread_name_prefix='stripe-fetch')
+        self._refreshing = set()
+        self._refreshing_lock = threading.Lock()
+        self._initialized = False
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refresh_errors = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._initialized:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        if not self._initialized:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS catalog ('
+                'key TEXT PRIMARY KEY, value TEXT NOT NULL, '
+                'fetched_at REAL NOT NULL, refresh_until REAL NOT NULL DEFAULT 0)'
+            )
+            self._initialized = True
+        return connection
+
+    def _read(self, key: str):
+        with closing(self._connect()) as connection:
+            row = connection.execute('SELECT value, fetched_at FROM catalog WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def _write(self, entries: Dict[str, Any]) -> None:
+        now = time.time()
+        with closing(self._connect()) as connection:
+            with connection:
+                connection.execute('BEGIN IMMEDIATE')
+                connection.executemany(
+                    'INSERT OR REPLACE INTO catalog (key, value, fetched_at, refresh_until) VALUES (?, ?, ?, 0)',
+                    [(key, json.dumps(value), now) for key, value in entries.items()]
+                )
+
+    def _read_many(self, keys: List[str]) -> Dict[str, tuple]:
+        if not keys:
+            return {}
+        with closing(self._connect()) as connection:
+            rows = connection.execute(
+                f"SELECT key, value, fetched_at FROM catalog WHERE key IN ({', '.join('?' * len(keys))})", keys
+            ).fetchall()
+        return {key: (json.loads(value), fetched_at) for key, value, fetched_at in rows}
+
+    def _load(self, key: str, loader: Loader):
+        entries = loader()
+        self._write(entries)
+        return entries[key]
+
+    def _take_lease(self, key: str) -> bool:
+        """Only one process refreshes an entry: the one which updates refresh_until"""
+        now = time.time()
+        with closing(self._connect()) as connection:
+            cursor = connection.execute(
+                'UPDATE catalog SET refresh_until = ? WHERE key = ? AND refresh_until < ?',
+                (now + STRIPE_CATALOG_REFRESH_LEASE, key, now)
+            )
+            return cursor.rowcount == 1
+
+    def _refresh(self, key: str, loader: Loader) -> None:
+        try:
+            if self._take_lease(key):
+                self._load(key, loader)
+        except Exception as e:
+            self.refresh_errors += 1
+            print(f"Error refreshing the Stripe catalog ({key}): {e!r}")
+        finally:
+            with self._refreshing_lock:
+                self._refreshing.discard(key)
+
+    def _refresh_in_background(self, key: str, loader: Loader) -> None:
+        with self._refreshing_lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        self._executor.submit(self._refresh, key, loader)
+
+    def get(self, key: str, loader: Loader):
+        """Entry `key`, fetched with `loader` if it is missing or too old"""
+        cached = self._read(key)
+        if cached is not None:
+            value, fetched_at = cached
+            age = time.time() - fetched_at
+            if age < self.fresh_ttl:
+                self.hits += 1
+                return value
+            if age < self.max_stale:
+                self.stale_hits += 1
+                self._refresh_in_background(key, loader)
+                return value
+        self.misses += 1
+        return self._load(key, loader)
+
+    def get_cached(self, key: str):
+        """Entry `key` if it is cached (even stale), None otherwise: never calls Stripe"""
+        cached = self._read(key)
+        return None if cached is None else cached[0]
+
+    def products(self) -> List[dict]:
+        return self.get(PRODUCTS, _load_products)
+
+    def prices(self) -> List[dict]:
+        return self.get(PRICES, _load_prices)
+
+    def product(self, product_id: str) -> dict:
+        return self.get(product_key(product_id), lambda: _load_product(product_id))
+
+    def product_prices(self, product_id: str) -> List[dict]:
+        return self.get(product_prices_key(product_id), lambda: _load_product_prices(product_id))
+
+    def price(self, price_id: str) -> dict:
+        return self.get(price_key(price_id), lambda: _load_price(price_id))
+
+    def _usable(self, key: str, cached: Dict[str, tuple], loader: Loader):
+        """Value of `key` in `cached` if it can be served (refreshed in the background if stale), None otherwise"""
+        if key not in cached:
+            return None
+        value, fetched_at = cached[key]
+        age = time.time() - fetched_at
+        if age >= self.max_stale:
+            return None
+        if age >= self.fresh_ttl:
+            self.stale_hits += 1
+            self._refresh_in_background(key, loader)
+        else:
+            self.hits += 1
+        return value
+
+    def expanded_prices(self, price_ids: Iterable[str]) -> Dict[str, dict]:
+        """
+        Prices with their product expanded, like stripe.Price.retrieve(price_id, expand=['product']),
+        by price id. They come from the catalog, the missing ones are fetched concurrently
+        (at most STRIPE_FETCH_WORKERS calls at a time) and added to it.
+
+        Raises:
+            StripeFetchError: A missing price could not be fetched
+        """
+        price_ids = list(dict.fromkeys(price_ids))
+        cached = self._read_many([price_key(price_id) for price_id in price_ids])
+        prices = {}
+        for price_id in price_ids:
+            price = self._usable(price_key(price_id), cached, lambda price_id=price_id: _load_price(price_id))
+            if price is not None:
+                prices[price_id] = price
+        cached = self._read_many(list({product_key(price['product']) for price in prices.values()}))
+
+        result = {}
+        for price_id, price in prices.items():
+            product_id = price['product']
+            product = self._usable(product_key(product_id), cached, lambda product_id=product_id: _load_product(product_id))
+            if product is not None:
+                result[price_id] = dict(price, product=product)
+
+        missing = [price_id for price_id in price_ids if price_id not in result]
+        if missing:
+            entries = self._fetch_concurrently(missing, _load_expanded_price)
+            for price_id in missing:
+                price = entries[price_key(price_id)]
+                result[price_id] = dict(price, product=entries[product_key(price['product'])])
+        return result
+
+    def products_by_id(self, product_ids: Iterable[str]) -> Dict[str, dict]:
+        """
+        Products by id, from the catalog, the missing ones are fetched concurrently
+        (at most STRIPE_FETCH_WORKERS calls at a time) and added to it.
+
+        Raises:
+            StripeFetchError: A missing product could not be fetched
+        """
+        product_ids = list(dict.fromkeys(product_ids))
+        cached = self._read_many([product_key(product_id) for product_id in product_ids])
+        result = {}
+        for product_id in product_ids:
+            product = self._usable(product_key(product_id), cached, lambda product_id=product_id: _load_product(product_id))
+            if product is not None:
+                result[product_id] = product
+        missing = [product_id for product_id in product_ids if product_id not in result]
+        if missing:
+            entries = self._fetch_concurrently(missing, _load_product)
+            for product_id in missing:
+                result[product_id] = entries[product_key(product_id)]
+        return result
+
+    def _fetch_concurrently(self, object_ids: List[str], loader: Callable[[str], Dict[str, Any]]) -> Dict[str, Any]:
+        """Entries loaded by loader(object_id) for each id, the Stripe calls made concurrently, stored in the catalog"""
+        self.misses += len(object_ids)
+        futures = {object_id: self._fetch_executor.submit(loader, object_id) for object_id in object_ids}
+        entries = {}
+        for object_id, future in futures.items():
+            try:
+                entries.update(future.result())
+            except Exception as e:
+                raise StripeFetchError(object_id, e) from e
+        self._write(entries)
+        return entries
+
+    def invalidate(self, *keys: str) -> None:
+        """Remove the entries: they are fetched again on their next read"""
+        with closing(self._connect()) as connection:
+            connection.executemany('DELETE FROM catalog WHERE key = ?', [(key,) for key in keys])
+
+    def mark_stale(self, *keys: str) -> None:
+        """The entries are still served, but refreshed on their next read"""
+        with closing(self._connect()) as connection:
+            connection.executemany(
+                'UPDATE catalog SET fetched_at = MIN(fetched_at, ?) WHERE key = ?',
+                [(time.time() - self.fresh_ttl, key) for key in keys]
+            )
+
+    def invalidate_product(self, product_id: str) -> None:
+        self.invalidate(product_key(product_id), product_prices_key(product_id))
+        self.mark_stale(PRODUCTS)
+
+    def invalidate_price(self, price_id: str, product_id: Optional[str] = None) -> None:
+        self.invalidate(price_key(price_id))
+        if product_id is not None:
+            self.invalidate(product_prices_key(product_id))
+        self.mark_stale(PRICES)
+
+    def clear(self) -> None:
+        with closing(self._connect()) as connection:
+            connection.execute('DELETE FROM catalog')
+
+    def warm(self) -> None:
+        """Fetch the lists of products and prices (and every entry they contain) if they are not fresh"""
+        self.products()
+        self.prices()
+
+    def stats(self) -> Dict[str, int]:
+        return {'hits': self.hits, 'stale_hits': self.stale_hits, 'misses': self.misses,
+                'refresh_errors': self.refresh_errors}
+
+    def init_app(self, app: Flask) -> None:
+        # warmed in the background so that a Stripe outage does not block the boot;
+        # the workers started after the first one find the entries already fresh
+        if app.testing or not stripe.api_key:
+            return
+
+        def warm():
+            try:
+                self.warm()
+            except Exception as e:
+                print(f"Error warming the Stripe catalog: {e!r}")
+
+        threading.Thread(target=warm, name='stripe-catalog-warm', daemon=True).start()
+
+
+stripe_catalog = StripeCatalog()
+
+stripe_catalog_cli = AppGroup('stripe-catalog', help='Cache du catalogue Stripe (produits et prix)')
+
+
+@stripe_catalog_cli.command('warm')
+def warm_command():
+    """Recharge les produits et les prix depuis Stripe"""
+    stripe_catalog.clear()
+    stripe_catalog.warm()
+    print(f"{len(stripe_catalog.products())} produit(s), {len(stripe_catalog.prices())} prix")
+
+
+@stripe_catalog_cli.command('clear')
+def clear_command():
+    """Vide le cache (il est rechargé à la prochaine requête)"""
+    stripe_catalog.clear()
@@ -0,0 +1,161 @@
+import hashlib
+import hmac
+import json
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+from urllib.parse import parse_qs, urlparse
+
+
+def sign_webhook_payload(payload: bytes, secret: str, timestamp: Optional[int] = None) -> str:
+    """Stripe-Signature header of a webhook payload, as Stripe computes it"""
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    signature = hmac.new(secret.encode('utf-8'), f'{timestamp}.'.encode('utf-8') + payload, hashlib.sha256).hexdigest()
+    return f't={timestamp},v1={signature}'
+
+
+class StripeStubServer:
+    """
+    Local HTTP stand-in for the Stripe API, for the tests and the benchmarks of the
+    payment routes: serves the given products and prices (lists and retrieve, with
+    expand=['product'] on the prices), customers and checkout sessions (created paid,
+    with their line items), after `delay` seconds to simulate the latency of the real
+    API, and counts the calls in `calls` ('GET /v1/prices/<id>' -> n).
+
+    Usage:
+        stub = StripeStubServer(products, prices, delay=0.15).start()
+        stripe.api_base = stub.url
+        ...
+        stub.stop()
+    """
+
+    def __init__(self, products: List[dict], prices: List[dict], host: str = '127.0.0.1',
+                 port: int = 0, delay: float = 0.0):
+        self.products = {product['id']: product for product in products}
+        self.prices = {price['id']: price for price in prices}
+        self.customers = {}
+        self.sessions = {}
+        self.delay = delay
+        self.calls = Counter()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def _price(self, price_id: str, expand: List[str]) -> Optional[dict]:
+        price = self.prices.get(price_id)
+        if price is not None and 'product' in expand:
+            price = dict(price, product=self.products.get(price['product'], price['product']))
+        return price
+
+    @staticmethod
+    def _list(url: str, data: List[dict]) -> dict:
+        return {'object': 'list', 'url': url, 'has_more': False, 'data': data}
+
+    def _create_session(self, form: dict) -> dict:
+        session_id = f'cs_test_{len(self.sessions) + 1}'
+        items = []
+        index = 0
+        while f'line_items[{index}][price]' in form:
+            price = self._price(form[f'line_items[{index}][price]'][0], [])
+            quantity = int(form.get(f'line_items[{index}][quantity]', ['1'])[0])
+            items.append({'id': f'li_{session_id}_{index}', 'object': 'item', 'quantity': quantity,
+                          'price': price, 'amount_total': (price or {}).get('unit_amount', 0) * quantity})
+            index += 1
+        session = {'id': session_id, 'object': 'checkout.session', 'status': 'complete',
+                   'payment_status': 'paid', 'consent': {'terms_of_service': 'accepted'},
+                   'customer': form.get('customer', [None])[0], 'url': f'{self.url}/pay/{session_id}'}
+        self.sessions[session_id] = (session, items)
+        return session
+
+    def handle(self, method: str, path: str, query: dict):
+        """(status, body) of a call"""
+        # stripe-python sends expand[0]=product
+        expand = [value for key, values in query.items() if key.startswith('expand[') for value in values]
+        if method == 'GET' and path == '/v1/products':
+            return 200, self._list(path, list(self.products.values()))
+        if method == 'GET' and path == '/v1/prices':
+            prices = [price for price in self.prices.values()
+                      if 'product' not in query or price['product'] == query['product'][0]]
+            return 200, self._list(path, prices)
+        if method == 'POST' and path == '/v1/customers':
+            customer = {'id': f'cus_test_{len(self.customers) + 1}', 'object': 'customer',
+                        'email': query.get('email', [None])[0]}
+            self.customers[customer['id']] = customer
+            return 200, customer
+        if method == 'POST' and path == '/v1/checkout/sessions':
+            return 200, self._create_session(query)
+        match = re.fullmatch(r'/v1/checkout/sessions/([\w-]+)(/line_items|/expire)?', path)
+        if match and match.group(1) in self.sessions:
+            session, items = self.sessions[match.group(1)]
+            if match.group(2) == '/line_items':
+                return 200, self._list(path, items)
+            if match.group(2) == '/expire':
+                session['status'] = 'expired'
+            if 'line_items' in expand:
+                return 200, dict(session, line_items=self._list(f'{path}/line_items', items))
+            return 200, session
+        match = re.fullmatch(r'/v1/customers/([\w-]+)', path)
+        if method == 'GET' and match:
+            return 200, self.customers.get(match.group(1), {'id': match.group(1), 'object': 'customer'})
+        match = re.fullmatch(r'/v1/(products|prices)/([\w-]+)', path)
+        if method == 'GET' and match:
+            if match.group(1) == 'products':
+                obj = self.products.get(match.group(2))
+            else:
+                obj = self._price(match.group(2), expand)
+            if obj is not None:
+                return 200, obj
+            return 404, {'error': {'type': 'invalid_request_error', 'code': 'resource_missing',
+                                   'message': f'No such {match.group(1)[:-1]}: {match.group(2)}', 'param': 'id'}}
+        return 404, {'error': {'type': 'invalid_request_error', 'message': f'Unrecognized request URL ({method} {path})'}}
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _respond(self, method):
+                url = urlparse(self.path)
+                query = parse_qs(url.query)
+                if method == 'POST':
+                    length = int(self.headers.get('Content-Length', 0))
+                    query.update(parse_qs(self.rfile.read(length).decode('utf-8')))
+                with stub._lock:
+                    stub.calls[f'{method} {url.path}'] += 1
+                if stub.delay:
+                    time.sleep(stub.delay)
+                status, body = stub.handle(method, url.path, query)
+                data = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self._respond('GET')
+
+            def do_POST(self):
+                self._respond('POST')
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> 'StripeStubServer':
+        self._thread = threading.Thread(target=self._server.serve_forever, name='stripe-stub', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
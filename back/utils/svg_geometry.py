@@ -0,0 +1,316 @@
+import gzip
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote, unquote
+
+from flask.cli import AppGroup
+from utils.common import write_atomic
+
+# Precomputed bodies, one gzip file per route and level of detail
+GEOMETRY_DIR = os.path.join(os.path.dirname(
+    os.path.dirname(__file__)), 'data', 'geometry')
+
+# Levels of detail served by /problems/regions and /problems/regions/<code>/departments:
+# (Douglas-Peucker tolerance as a fraction of the shape bounding box diagonal, decimals kept)
+DETAIL_LEVELS: Dict[str, Optional[Tuple[float, int]]] = {
+    'full': None,  # original path
+    'high': (0.0005, 2),
+    'medium': (0.002, 1),
+    'low': (0.006, 1),
+}
+DEFAULT_DETAIL_LEVEL = 'full'
+
+_PATH_TOKEN = re.compile(r'[MmLlHhVvZz]|[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
+
+Point = Tuple[float, float]
+
+
+def parse_svg_path(d: str) -> Optional[List[List[Point]]]:
+    """
+    Parse an SVG path made of straight lines (M, L, H, V, Z, absolute or relative)
+    into its subpaths in absolute coordinates.
+
+    Returns:
+        The list of subpaths, None if the path uses curves (it is then left untouched)
+    """
+    # anything else than straight line commands and numbers (curves, arcs...)
+    if _PATH_TOKEN.sub('', d).replace(',', '').split():
+        return None
+    tokens = _PATH_TOKEN.findall(d)
+
+    subpaths: List[List[Point]] = []
+    x = y = start_x = start_y = 0.0
+    command = None
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if token.isalpha():
+            command = token
+            i += 1
+            if command in 'Zz':
+                x, y = start_x, start_y
+                command = None
+            continue
+        if command is None:
+            return None
+        relative = command.islower()
+        if command in 'Mm':
+            x = x + float(tokens[i]) if relative else float(tokens[i])
+            y = y + float(tokens[i + 1]) if relative else float(tokens[i + 1])
+            start_x, start_y = x, y
+            subpaths.append([(x, y)])
+            # coordinates following a moveto are implicit linetos
+            command = 'l' if relative else 'L'
+            i += 2
+            continue
+        if command in 'Ll':
+            x = x + float(tokens[i]) if relative else float(tokens[i])
+            y = y + float(tokens[i + 1]) if relative else float(tokens[i + 1])
+            i += 2
+        elif command in 'Hh':
+            x = x + float(tokens[i]) if relative else float(tokens[i])
+            i += 1
+        else:  # Vv
+            y = y + float(tokens[i]) if relative else float(tokens[i])
+            i += 1
+        if not subpaths:
+            return None
+        subpaths[-1].append((x, y))
+    return subpaths
+
+
+def douglas_peucker(points: List[Point], tolerance: float) -> List[Point]:
+    """Simplify a polyline, keeping the points further than `tolerance` from the simplified line"""
+    if len(points) < 3:
+        return list(points)
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        (x1, y1), (x2, y2) = points[first], points[last]
+        dx, dy = x2 - x1, y2 - y1
+        length = math.hypot(dx, dy)
+        max_distance, index = -1.0, first
+        for i in range(first + 1, last):
+            px, py = points[i]
+            if length == 0:
+                distance = math.hypot(px - x1, py - y1)
+            else:
+                distance = abs(dy * px - dx * py + x2 * y1 - y2 * x1) / length
+            if distance > max_distance:
+                max_distance, index = distance, i
+        if max_distance > tolerance:
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+    return [point for point, kept in zip(points, keep) if kept]
+
+
+def _simplify_ring(ring: List[Point], tolerance: float) -> List[Point]:
+    # a closed ring is split at its farthest point from the start, so both ends are kept
+    if len(ring) < 4:
+        return ring
+    x0, y0 = ring[0]
+    far = max(range(len(ring)), key=lambda i: (ring[i][0] - x0) ** 2 + (ring[i][1] - y0) ** 2)
+    return douglas_peucker(ring[:far + 1], tolerance)[:-1] + douglas_peucker(ring[far:], tolerance)
+
+
+def _format_number(value: float, decimals: int) -> str:
+    text = f'{value:.{decimals}f}'.rstrip('0').rstrip('.') if decimals else f'{value:.0f}'
+    return '0' if text in ('-0', '') else text
+
+
+def simplify_svg_path(d: str, tolerance_ratio: float, decimals: int) -> str:
+    """
+    Simplified version of an SVG path: every subpath is simplified with Douglas-Peucker
+    (tolerance relative to the size of the whole path), rounded to `decimals` and written
+    back in relative coordinates (shorter). Paths with curves are returned unchanged.
+    """
+    subpaths = parse_svg_path(d)
+    if not subpaths:
+        return d
+    xs = [x for subpath in subpaths for x, _ in subpath]
+    ys = [y for subpath in subpaths for _, y in subpath]
+    tolerance = tolerance_ratio * math.hypot(max(xs) - min(xs), max(ys) - min(ys))
+
+    parts = []
+    # current point, after a 'z' it is the start of the subpath
+    current_x = current_y = 0.0
+    for subpath in subpaths:
+        rounded = []
+        for x, y in _simplify_ring(subpath, tolerance):
+            point = (round(x, decimals), round(y, decimals))
+            if not rounded or rounded[-1] != point:
+                rounded.append(point)
+        # a ring reduced to less than a triangle disappears at this level of detail
+        if len(rounded) < 3:
+            continue
+        numbers = []
+        for x, y in rounded:
+            numbers.append(_format_number(x - current_x, decimals))
+            numbers.append(_format_number(y - current_y, decimals))
+            current_x, current_y = x, y
+        current_x, current_y = rounded[0]
+        parts.append('m ' + ' '.join(numbers) + ' z')
+    return ' '.join(parts) if parts else d
+
+
+class GeometryBody:
+    """JSON body of a map response at one level of detail, with its gzip version and ETag"""
+
+    __slots__ = ('body', 'gzip', 'etag')
+
+    def __init__(self, body: bytes, compressed: Optional[bytes] = None):
+        self.body = body
+        self.gzip = compressed if compressed is not None else gzip.compress(body, compresslevel=9)
+        self.etag = hashlib.sha1(body).hexdigest()
+
+    @classmethod
+    def from_data(cls, data) -> 'GeometryBody':
+        # same output as flask.jsonify
+        return cls(json.dumps(data, sort_keys=True, separators=(',', ':')).encode('utf-8') + b'\n')
+
+
+class PrecomputedGeometry:
+    """
+    Bodies of /problems/regions and /problems/regions/<code>/departments for every
+    level of detail, kept in memory and in GEOMETRY_DIR (gzip files) so that the
+    simplification runs once per version of the regions and departments.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._regions: Dict[str, GeometryBody] = {}
+        self._departments: Dict[str, Dict[str, GeometryBody]] = {}
+
+    @staticmethod
+    def _with_level(rows: List[dict], level: str) -> List[dict]:
+        parameters = DETAIL_LEVELS[level]
+        if parameters is None:
+            return rows
+        return [dict(row, coordinates=simplify_svg_path(row['coordinates'], *parameters)) for row in rows]
+
+    def build(self, regions: List[dict], departments: List[dict], version: str) -> None:
+        """
+        Precompute all the levels of detail.
+
+        Args:
+            regions: Serialized region rows, as returned by /problems/regions
+            departments: Serialized department rows, as returned by /problems/regions/<code>/departments
+            version: Version of the source data (PROBLEMS content version)
+        """
+        built_regions = {level: GeometryBody.from_data(self._with_level(regions, level))
+                         for level in DETAIL_LEVELS}
+        by_region: Dict[str, List[dict]] = {}
+        for department in departments:
+            by_region.setdefault(department['region'], []).append(department)
+        built_departments = {
+            region_code: {level: GeometryBody.from_data(self._with_level(rows, level))
+                          for level in DETAIL_LEVELS}
+            for region_code, rows in by_region.items()
+        }
+        with self._lock:
+            self._regions, self._departments, self._version = built_regions, built_departments, version
+
+    def save(self, directory: str = None) -> None:
+        """Write the precomputed bodies (gzip) in directory, the version file last"""
+        directory = directory or GEOMETRY_DIR
+        os.makedirs(directory, exist_ok=True)
+        files = {f'regions.{level}.json.gz': body for level, body in self._regions.items()}
+        for region_code, levels in self._departments.items():
+            for level, body in levels.items():
+                files[f'departments.{quote(region_code, safe="")}.{level}.json.gz'] = body
+        for name, body in files.items():
+            write_atomic(os.path.join(directory, name), body.gzip)
+        write_atomic(os.path.join(directory, 'version'), self._version.encode('utf-8'))
+
+    def load(self, version: str, directory: str = None) -> bool:
+        """Load the bodies saved for this version, returns False if there are none"""
+        directory = directory or GEOMETRY_DIR
+        try:
+            with open(os.path.join(directory, 'version'), 'rb') as f:
+                if f.read().decode('utf-8') != version:
+                    return False
+            regions: Dict[str, GeometryBody] = {}
+            departments: Dict[str, Dict[str, GeometryBody]] = {}
+            for name in os.listdir(directory):
+                if not name.endswith('.json.gz'):
+                    continue
+                with open(os.path.join(directory, name), 'rb') as f:
+                    compressed = f.read()
+                body = GeometryBody(gzip.decompress(compressed), compressed)
+                route, key = name[:-len('.json.gz')].split('.', 1)
+                if route == 'regions':
+                    regions[key] = body
+                else:
+                    region_code, level = key.rsplit('.', 1)
+                    departments.setdefault(unquote(region_code), {})[level] = body
+        except (OSError, ValueError, IndexError):
+            return False
+        if set(regions) != set(DETAIL_LEVELS):
+            return False
+        with self._lock:
+            self._regions, self._departments, self._version = regions, departments, version
+        return True
+
+    def ensure_built(self, version: str) -> 'PrecomputedGeometry':
+        """Load or build the bodies of this version (read from the database on the first call only)"""
+        if self._version == version:
+            return self
+        with _build_lock:
+            if self._version != version and not self.load(version):
+                regions, departments = _read_map_rows()
+                self.build(regions, departments, version)
+                self.save()
+        return self
+
+    def regions(self, level: str) -> GeometryBody:
+        return self._regions[level]
+
+    def departments(self, region_code: str, level: str) -> GeometryBody:
+        region = self._departments.get(region_code)
+        if region is None:
+            return _EMPTY_LIST
+        return region[level]
+
+
+def _read_map_rows() -> Tuple[List[dict], List[dict]]:
+    """Regions and departments, serialized as the map routes return them"""
+    from database.database import DatabaseManager
+    from database.models import Serializer
+
+    db_manager = DatabaseManager()
+    regions = Serializer.serialize_list(db_manager.ReadRegions())
+    departments = Serializer.serialize_list(db_manager.ReadDepartments())
+    for department in departments:
+        if type(department['zones']) is bytes:  # BDD en prod qui renvoie des bytes
+            department['zones'] = department['zones'].decode('utf-8')
+    return regions, departments
+
+
+_EMPTY_LIST = GeometryBody.from_data([])
+_build_lock = threading.Lock()
+precomputed_geometry = PrecomputedGeometry()
+
+geometry_cli = AppGroup('geometry', help='Tracés SVG précalculés de la carte')
+
+
+@geometry_cli.command('build')
+def build_command():
+    """Précalcule les niveaux de détail des régions et départements (à lancer après script_db.py)"""
+    from utils.response_cache import PROBLEMS, response_cache
+
+    version = response_cache.versions((PROBLEMS,))[0]
+    regions, departments = _read_map_rows()
+    precomputed_geometry.build(regions, departments, version)
+    precomputed_geometry.save()
+    for level in DETAIL_LEVELS:
+        body = precomputed_geometry.regions(level)
+        print(f"regions {level:<6} {len(body.body):>8} bytes, {len(body.gzip):>7} gzip")
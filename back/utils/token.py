@@ -1,5 +1,24 @@
 import datetime
+import threading
+from collections import OrderedDict
+from typing import TypedDict
+
 import jwt
+from flask import current_app, g, request
+
+# Number of recently verified tokens kept, so that a token already seen is not verified again
+VERIFIED_TOKENS_MAX_SIZE = 1024
+
+_verified_tokens = OrderedDict()
+_verified_tokens_lock = threading.Lock()
+
+
+class TokenClaims(TypedDict):
+  """Claims of a verified authentication token (see generate_token). Must not be modified."""
+  user_id: int
+  admin: bool
+  expiration: str
+
 
 def generate_token(user_id, role=False):
   from app import app
@@ -11,6 +30,28 @@ def generate_token(user_id, role=False):
   }, app.config['SECRET_KEY'])
   return token
 
-def decode_token(token):
-  from app import app
-  return jwt.decode(token, app.config["SECRET_KEY"], algorithms=["HS256"])
\ No newline at end of file
+def decode_token(token) -> TokenClaims:
+  with _verified_tokens_lock:
+    claims = _verified_tokens.get(token)
+    if claims is not None:
+      _verified_tokens.move_to_end(token)
+      return claims
+
+  claims = jwt.decode(token, current_app.config["SECRET_KEY"], algorithms=["HS256"])
+
+  with _verified_tokens_lock:
+    _verified_tokens[token] = claims
+    while len(_verified_tokens) > VERIFIED_TOKENS_MAX_SIZE:
+      _verified_tokens.popitem(last=False)
+  return claims
+
+def get_token_claims() -> TokenClaims:
+  """
+  Claims of the Authorization token of the current request.
+  Set on flask.g by token_required, otherwise decoded once and kept for the rest of the request.
+  """
+  claims = g.get("token_claims")
+  if claims is None:
+    claims = decode_token(request.headers.get("Authorization"))
+    g.token_claims = claims
+  return claims
@@ -0,0 +1,78 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+
+
+class WebhookStubServer:
+    """
+    Local HTTP stand-in for a Discord webhook: records the JSON payloads it receives
+    and answers like Discord (204), optionally after `delay` seconds or with another
+    `status` (e.g. 429 with a retry_after, 500) to test the dispatcher.
+
+    Usage:
+        stub = WebhookStubServer().start()
+        os.environ['DISCORD_WEBHOOK_URL'] = stub.url
+        ...
+        stub.stop()
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, delay: float = 0.0,
+                 status: int = 204, retry_after: float = 0.1, verbose: bool = False):
+        self.delay = delay
+        self.status = status
+        self.retry_after = retry_after
+        self.verbose = verbose
+        self.received: List[dict] = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}/webhook'
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                if stub.delay:
+                    time.sleep(stub.delay)
+                status = stub.status
+                if status < 300:
+                    with stub._lock:
+                        stub.received.append(payload)
+                    if stub.verbose:
+                        print(json.dumps(payload, indent=2, ensure_ascii=False))
+                body = json.dumps({'retry_after': stub.retry_after}).encode() if status == 429 else b''
+                try:
+                    self.send_response(status)
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except ConnectionError:
+                    # the client gave up (timeout test)
+                    pass
+
+            def log_message(self, format, *args):
+                if stub.verbose:
+                    super().log_message(format, *args)
+
+        return Handler
+
+    def start(self) -> 'WebhookStubServer':
+        self._thread = threading.Thread(target=self._server.serve_forever, name='webhook-stub', daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self) -> None:
+        self._server.serve_forever()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
@@ -11,3 +11,15 @@ export interface User {
   tutorial_mojette_done?: boolean;
   created_at?: string;
 }
+
+export interface UserDataExport {
+  job_id: string;
+  user_id: number;
+  format: 'json' | 'zip';
+  status: 'pending' | 'running' | 'completed' | 'failed';
+  progress: number;
+  size: number | null;
+  error: string | null;
+  created_at: string;
+  expires_at: string | null;
+}
@@ -2,10 +2,10 @@ import { HttpClient } from '@angular/common/http';
 import { Injectable } from '@angular/core';
 import { MatDialog } from '@angular/material/dialog';
 import { Router } from '@angular/router';
-import { BehaviorSubject, Observable, of, Subject } from 'rxjs';
-import { catchError, map, tap } from 'rxjs/operators';
+import { BehaviorSubject, Observable, of, Subject, throwError, timer } from 'rxjs';
+import { catchError, exhaustMap, first, map, switchMap, tap } from 'rxjs/operators';
 import { environment } from 'src/environments/environment';
-import { User } from '../_models/User';
+import { User, UserDataExport } from '../_models/User';
 import { ConfirmationDialogComponent } from '../pages/account/confirmation-dialog.component';
 @Injectable({
   providedIn: 'root',
@@ -162,11 +162,41 @@ export class AuthService {
     return this.http.put<boolean>(url, {});
   }
 
-  exportUserData(user_id: number): Observable<Blob> {
-    const url = `${this.url}/user/${user_id}/export-data`;
+  requestUserDataExport(
+    user_id: number,
+    format: 'json' | 'zip' = 'json'
+  ): Observable<UserDataExport> {
+    const url = `${this.url}/user/${user_id}/export-data?format=${format}`;
+    return this.http.post<UserDataExport>(url, {});
+  }
+
+  getUserDataExport(user_id: number, job_id: string): Observable<UserDataExport> {
+    const url = `${this.url}/user/${user_id}/export-data/${job_id}`;
+    return this.http.get<UserDataExport>(url);
+  }
+
+  downloadUserDataExport(user_id: number, job_id: string): Observable<Blob> {
+    const url = `${this.url}/user/${user_id}/export-data/${job_id}/download`;
     return this.http.get(url, { responseType: 'blob' });
   }
 
+  // L'export est préparé en arrière-plan : demande, suivi toutes les secondes, puis téléchargement
+  exportUserData(user_id: number, format: 'json' | 'zip' = 'json'): Observable<Blob> {
+    return this.requestUserDataExport(user_id, format).pipe(
+      switchMap(job =>
+        timer(0, 1000).pipe(
+          exhaustMap(() => this.getUserDataExport(user_id, job.job_id)),
+          first(status => status.status === 'completed' || status.status === 'failed')
+        )
+      ),
+      switchMap(job =>
+        job.status === 'failed'
+          ? throwError(() => new Error(job.error ?? 'Export failed'))
+          : this.downloadUserDataExport(user_id, job.job_id)
+      )
+    );
+  }
+
   deleteUserAccount(user_id: number): Observable<any> {
     const url = `${this.url}/user/${user_id}/delete-account`;
     return this.http.delete(url);
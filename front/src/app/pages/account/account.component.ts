@@ -255,7 +255,7 @@ export class AccountComponent implements OnInit {
   // RGPD Methods
   downloadUserData() {
     this.isDownloadingData = true;
-    this.downloadMessage = 'Téléchargement de vos données...';
+    this.downloadMessage = 'Préparation de vos données...';
     this.downloadMessageType = '';
 
     this.authService.exportUserData(this.userId).subscribe(